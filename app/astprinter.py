@@ -0,0 +1,125 @@
+from app.expression import *
+from app.statement import *
+
+
+# Prints a whole program as indented s-expressions, one statement per
+# line. Expressions use the same notation as their __str__ does for the
+# parse command.
+class AstPrinter(Expr.Visitor, Stmt.Visitor):
+    INDENT = "  "
+
+    def __init__(self):
+        self.depth = 0
+
+    def print(self, statements: list[Stmt]) -> str:
+        return "\n".join(self.lines(statements))
+
+    def lines(self, statements: list[Stmt]) -> list[str]:
+        self.depth += 1
+        out = [stmt.accept(self) for stmt in statements]
+        self.depth -= 1
+        return out
+
+    def pad(self) -> str:
+        return self.INDENT * (self.depth - 1)
+
+    def nested(self, head: str, statements: list[Stmt]) -> str:
+        body = self.lines(statements)
+        if not body:
+            return f"{self.pad()}({head})"
+        return f"{self.pad()}({head}\n" + "\n".join(body) + ")"
+
+    def show(self, expr: Expr) -> str:
+        return expr.accept(self)
+
+
+    # Exprs
+    def visitLiteralExpr(self, expr: ExprLiteral):
+        if isinstance(expr.val, str):
+            return f'"{expr.val}"'
+        return str(expr)
+
+    def visitUnaryExpr(self, expr: ExprUnary):
+        return f"({expr.op.lex} {self.show(expr.expr)})"
+
+    def visitGroupingExpr(self, expr: ExprGrouping):
+        return f"(group {self.show(expr.expr)})"
+
+    def visitBinaryExpr(self, expr: ExprBinary):
+        return f"({expr.op.lex} {self.show(expr.left)} {self.show(expr.right)})"
+
+    def visitLogicalExpr(self, expr: ExprLogical):
+        return f"({expr.op.lex} {self.show(expr.left)} {self.show(expr.right)})"
+
+    def visitVariableExpr(self, expr: ExprVariable):
+        return expr.name.lex
+
+    def visitAssignExpr(self, expr: ExprAssign):
+        return f"(= {expr.name.lex} {self.show(expr.val)})"
+
+    def visitCallExpr(self, expr: ExprCall):
+        args = "".join(" " + self.show(arg) for arg in expr.args)
+        return f"(call {self.show(expr.callee)}{args})"
+
+    def visitGetExpr(self, expr: ExprGet):
+        return f"(. {self.show(expr.obj)} {expr.name.lex})"
+
+    def visitSetExpr(self, expr: ExprSet):
+        return f"(= (. {self.show(expr.obj)} {expr.name.lex}) {self.show(expr.val)})"
+
+    def visitThisExpr(self, expr: ExprThis):
+        return "this"
+
+    def visitSuperExpr(self, expr: ExprSuper):
+        return f"(. super {expr.method.lex})"
+
+
+    # Stmts
+    def visitExpressionStmt(self, stmt: StmtExpression):
+        return f"{self.pad()}(; {self.show(stmt.expression)})"
+
+    def visitPrintStmt(self, stmt: StmtPrint):
+        return f"{self.pad()}(print {self.show(stmt.expression)})"
+
+    def visitVarStmt(self, stmt: StmtVariable):
+        if stmt.initializer is None:
+            return f"{self.pad()}(var {stmt.name.lex})"
+        return f"{self.pad()}(var {stmt.name.lex} {self.show(stmt.initializer)})"
+
+    def visitBlockStmt(self, stmt: StmtBlock):
+        return self.nested("block", stmt.statements)
+
+    def visitIfStmt(self, stmt: StmtIf):
+        branches = [stmt.thenBranch]
+        if stmt.elseBranch is not None:
+            branches.append(stmt.elseBranch)
+        return self.nested(f"if {self.show(stmt.condition)}", branches)
+
+    def visitWhileStmt(self, stmt: StmtWhile):
+        return self.nested(f"while {self.show(stmt.condition)}", [stmt.body])
+
+    # Clauses left out print as ()
+    def visitForStmt(self, stmt: StmtFor):
+        clauses = ["()", "()", "()"]
+        if stmt.initializer is not None:
+            clauses[0] = stmt.initializer.accept(self).strip()
+        if stmt.condition is not None:
+            clauses[1] = self.show(stmt.condition)
+        if stmt.increment is not None:
+            clauses[2] = self.show(stmt.increment)
+        return self.nested("for " + " ".join(clauses), [stmt.body])
+
+    def visitFunctionStmt(self, stmt: StmtFunction):
+        params = " ".join(param.lex for param in stmt.params)
+        return self.nested(f"fun {stmt.name.lex} ({params})", stmt.body)
+
+    def visitReturnStmt(self, stmt: StmtReturn):
+        if stmt.value is None:
+            return f"{self.pad()}(return)"
+        return f"{self.pad()}(return {self.show(stmt.value)})"
+
+    def visitClassStmt(self, stmt: StmtClass):
+        head = f"class {stmt.name.lex}"
+        if stmt.superclass is not None:
+            head += f" < {stmt.superclass.name.lex}"
+        return self.nested(head, stmt.methods)
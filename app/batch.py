@@ -0,0 +1,72 @@
+import io
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout, redirect_stderr
+from functools import partial
+
+from app.lox import Lox
+
+
+# Expand directories to the .lox files under them, in a stable order.
+def collect(args: list[str]) -> list[str]:
+    paths: list[str] = []
+    for arg in args:
+        if os.path.isdir(arg):
+            found = []
+            for root, dirs, files in os.walk(arg):
+                dirs[:] = [d for d in dirs if d != "__loxcache__"]
+                found += [os.path.join(root, f) for f in files if f.endswith(".lox")]
+            paths += sorted(found)
+        else:
+            paths.append(arg)
+    return paths
+
+
+# Runs in a worker: one fresh Lox (and so one Interpreter) per script, with
+# its output captured instead of interleaved with the other workers'.
+def runScript(path: str, cmd: str, options: dict) -> tuple[str, int, str, str]:
+    out, err = io.StringIO(), io.StringIO()
+    code = 0
+    with redirect_stdout(out), redirect_stderr(err):
+        lox = Lox()
+        for name, val in options.items():
+            setattr(lox, name, val)
+        try:
+            lox.runFile(path, cmd)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except OSError as e:
+            print(f"Cannot open {path}: {e.strerror}", file=sys.stderr)
+            code = 66
+        except Exception:
+            traceback.print_exc()
+            code = 1
+    return path, code, out.getvalue(), err.getvalue()
+
+
+# Run every script in a pool of jobs processes. Each script's output is
+# written out whole, in argument order, under a header naming it. Returns
+# the worst exit code.
+def runBatch(paths: list[str], cmd: str, jobs: int, options: dict = None) -> int:
+    work = partial(runScript, cmd=cmd, options=options or {})
+    # small batches amortise the round trip to the worker without letting
+    # one slow script hold up a long queue behind it
+    chunksize = max(1, len(paths) // (jobs * 8))
+
+    status = 0
+    failed: list[tuple[str, int]] = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for path, code, out, err in pool.map(work, paths, chunksize=chunksize):
+            sys.stdout.write(f"==> {path} <==\n{out}")
+            if err:
+                sys.stderr.write(f"==> {path} <==\n{err}")
+            if code:
+                failed.append((path, code))
+            status = max(status, code)
+
+    for path, code in failed:
+        print(f"{path}: exit {code}", file=sys.stderr)
+    print(f"{len(paths)} scripts, {len(failed)} failed", file=sys.stderr)
+    return status
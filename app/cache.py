@@ -0,0 +1,115 @@
+import glob
+import hashlib
+import os
+import pickle
+import zlib
+
+
+# Front-end results (the Stmt tree from Parser.parse, with the scope
+# depths and slots the Resolver stores on it) saved next to the script, the
+# way CPython keeps .pyc files in __pycache__.
+class ProgramCache:
+    MAGIC = b"LOXC"
+    DIR = "__loxcache__"
+
+    _version = None
+
+    def __init__(self, path: str, level: int = 0):
+        self.source = path
+        self.dir = os.path.join(os.path.dirname(path), self.DIR)
+        self.stem = os.path.basename(path)
+        # the optimizer rewrites the tree, so each -O level gets its own entry
+        self.tag = f"{self.version()}.O{level}"
+        self.path = os.path.join(self.dir, f"{self.stem}.{self.tag}.loxc")
+        self._digest = None
+        # hash of the text that was parsed, set once all of it went through
+        # hashing(); an entry is stored under this, never under digest()
+        self.parsed = None
+
+    # Hash of the interpreter's own sources, so that any change to the AST
+    # classes or the resolver invalidates every entry.
+    @classmethod
+    def version(cls) -> str:
+        if cls._version is None:
+            h = hashlib.sha256()
+            here = os.path.dirname(os.path.abspath(__file__))
+            for name in sorted(glob.glob(os.path.join(here, "*.py"))):
+                with open(name, "rb") as file:
+                    h.update(file.read())
+            cls._version = h.hexdigest()[:16]
+        return cls._version
+
+    # Hash of the source as it is on disk now. Both hashes are over the
+    # text read the way the scanner gets it, so they agree for one source.
+    def digest(self) -> bytes:
+        if self._digest is None:
+            h = hashlib.sha256()
+            with open(self.source) as file:
+                for chunk in iter(lambda: file.read(1 << 16), ""):
+                    h.update(chunk.encode("utf-8", "surrogatepass"))
+            self._digest = h.digest()
+        return self._digest
+
+    # Pass the chunks of source text through, hashing them on the way. The
+    # file can change between runs, or between the load() check and the
+    # read the parser gets, so what is stored is keyed by what was parsed.
+    def hashing(self, chunks):
+        self.parsed = None
+        h = hashlib.sha256()
+        for chunk in chunks:
+            h.update(chunk.encode("utf-8", "surrogatepass"))
+            yield chunk
+        self.parsed = h.digest()
+
+    # The statements, or None. Entries for another version of the
+    # source, or that fail to load, are removed.
+    def load(self):
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+
+        head = len(self.MAGIC) + 32
+        if data[:len(self.MAGIC)] != self.MAGIC or \
+                data[len(self.MAGIC):head] != self.digest():
+            self.evict(self.path)
+            return None
+
+        try:
+            return pickle.loads(zlib.decompress(data[head:]))
+        except Exception:
+            self.evict(self.path)
+            return None
+
+    def store(self, statements) -> None:
+        if self.parsed is None:
+            return
+        try:
+            payload = pickle.dumps(statements, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # e.g. a tree too deep for pickle; just run without a cache
+            return
+
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            # entries left behind by other interpreter versions
+            pattern = glob.escape(self.stem) + "." + "?" * len(self.version())
+            mine = f"{self.stem}.{self.version()}."
+            for old in glob.glob(os.path.join(self.dir, pattern + "*.loxc")):
+                if not os.path.basename(old).startswith(mine):
+                    self.evict(old)
+
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as file:
+                file.write(self.MAGIC + self.parsed + zlib.compress(payload))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def evict(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,162 @@
+from array import array
+from enum import IntEnum
+
+
+# Instructions for the VM. Code is an array of 16-bit units: an opcode,
+# followed by its operands, one unit each. Jumps are unsigned offsets from
+# the unit after the operand.
+class OpCode(IntEnum):
+    GET_LOCAL = 0           # slot
+    SET_LOCAL = 1           # slot
+    CONSTANT = 2            # constant
+    GET_GLOBAL = 3          # name constant
+    SET_GLOBAL = 4          # name constant
+    GET_UPVALUE = 5         # upvalue
+    SET_UPVALUE = 6         # upvalue
+    POP = 7
+    JUMP_IF_FALSE = 8       # offset
+    LOOP = 9                # offset back
+    JUMP = 10               # offset
+    LESS = 11
+    ADD = 12
+    SUBTRACT = 13
+    CALL = 14               # arg count
+    RETURN = 15
+    GET_METHOD = 16         # name constant
+    INVOKE = 17             # arg count
+    GET_PROPERTY = 18       # name constant
+    SET_PROPERTY = 19       # name constant
+    CHECK_INSTANCE = 20
+    EQUAL = 21
+    NOT_EQUAL = 22
+    GREATER = 23
+    GREATER_EQUAL = 24
+    LESS_EQUAL = 25
+    MULTIPLY = 26
+    DIVIDE = 27
+    NOT = 28
+    NEGATE = 29
+    JUMP_IF_TRUE = 30       # offset
+    NIL = 31
+    TRUE = 32
+    FALSE = 33
+    PRINT = 34
+    DEFINE_GLOBAL = 35      # name constant
+    CLOSURE = 36            # function constant, then (isLocal, index) per upvalue
+    CLOSE_UPVALUE = 37
+    GET_SUPER = 38          # name constant
+    CLASS = 39              # name constant
+    INHERIT = 40
+    METHOD = 41             # name constant
+
+
+OPERANDS = {op: 1 for op in OpCode}
+for op in (OpCode.POP, OpCode.LESS, OpCode.ADD, OpCode.SUBTRACT,
+           OpCode.RETURN, OpCode.EQUAL, OpCode.NOT_EQUAL, OpCode.GREATER,
+           OpCode.GREATER_EQUAL, OpCode.LESS_EQUAL, OpCode.MULTIPLY,
+           OpCode.DIVIDE, OpCode.NOT, OpCode.NEGATE, OpCode.NIL, OpCode.TRUE,
+           OpCode.FALSE, OpCode.PRINT, OpCode.CLOSE_UPVALUE, OpCode.INHERIT,
+           OpCode.CHECK_INSTANCE):
+    OPERANDS[op] = 0
+
+
+class Chunk:
+    __slots__ = ("code", "lines", "constants", "_index")
+
+    # operands are one unit each
+    MAX_OPERAND = 0xFFFF
+
+    def __init__(self):
+        self.code = array("H")
+        # source line of every unit, for runtime errors
+        self.lines = array("i")
+        self.constants: list = []
+        self._index: dict = {}
+
+    def write(self, unit: int, line: int) -> None:
+        self.code.append(unit)
+        self.lines.append(line)
+
+    # Numbers and strings are shared; keyed by type too, since 1.0 == True
+    def addConstant(self, val) -> int:
+        if isinstance(val, (float, str)):
+            key = (type(val), val)
+            if key in self._index:
+                return self._index[key]
+            self._index[key] = len(self.constants)
+        self.constants.append(val)
+        return len(self.constants) - 1
+
+
+# A compiled function: what a CLOSURE instruction wraps at runtime
+class FunctionProto:
+    __slots__ = ("name", "arity", "upvalues", "chunk")
+
+    def __init__(self, name: str, arity: int = 0):
+        self.name = name
+        self.arity = arity
+        self.upvalues = 0
+        self.chunk = Chunk()
+
+    def __str__(self) -> str:
+        if self.name is None:
+            return "<script>"
+        return f"<fn {self.name}>"
+
+
+def disassemble(function: FunctionProto) -> None:
+    chunk = function.chunk
+    print(f"== {function} ==")
+    offset = 0
+    while offset < len(chunk.code):
+        offset = disassembleInstruction(chunk, offset)
+
+    for constant in chunk.constants:
+        if isinstance(constant, FunctionProto):
+            print()
+            disassemble(constant)
+
+
+def disassembleInstruction(chunk: Chunk, offset: int) -> int:
+    code = chunk.code
+    op = OpCode(code[offset])
+    line = chunk.lines[offset]
+    if offset > 0 and line == chunk.lines[offset - 1]:
+        prefix = f"{offset:04d}    | "
+    else:
+        prefix = f"{offset:04d} {line:4d} "
+    name = f"OP_{op.name}"
+
+    if OPERANDS[op] == 0:
+        print(prefix + name)
+        return offset + 1
+
+    operand = code[offset + 1]
+    if op in (OpCode.JUMP, OpCode.JUMP_IF_FALSE, OpCode.JUMP_IF_TRUE):
+        print(f"{prefix}{name:<16} {offset:4d} -> {offset + 2 + operand}")
+    elif op == OpCode.LOOP:
+        print(f"{prefix}{name:<16} {offset:4d} -> {offset + 2 - operand}")
+    elif op in (OpCode.CONSTANT, OpCode.GET_GLOBAL, OpCode.SET_GLOBAL,
+                OpCode.DEFINE_GLOBAL, OpCode.GET_PROPERTY, OpCode.SET_PROPERTY,
+                OpCode.GET_METHOD, OpCode.GET_SUPER,
+                OpCode.CLASS, OpCode.METHOD):
+        print(f"{prefix}{name:<16} {operand:4d} '{_show(chunk.constants[operand])}'")
+    elif op == OpCode.CLOSURE:
+        function = chunk.constants[operand]
+        print(f"{prefix}{name:<16} {operand:4d} {function}")
+        offset += 2
+        for i in range(function.upvalues):
+            isLocal, index = code[offset], code[offset + 1]
+            kind = "local" if isLocal else "upvalue"
+            print(f"{offset:04d}    |                     {kind} {index}")
+            offset += 2
+        return offset
+    else:
+        print(f"{prefix}{name:<16} {operand:4d}")
+    return offset + 2
+
+
+def _show(val) -> str:
+    if isinstance(val, float) and val.is_integer():
+        return str(int(val))
+    return str(val)
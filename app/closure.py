@@ -0,0 +1,631 @@
+from app.tokens import Token, TokenType
+from app.runtime import MyRuntimeError
+from app.expression import *
+from app.statement import *
+from app.environment import Environment, LocalEnvironment
+from app.callable import LoxCallable
+from app.loxclass import LoxClass
+from app.instance import LoxInstance
+from app.interpreter import Interpreter
+from app.natives import defineNatives
+from app.memo import Memo
+from app.rope import Rope, STRINGS, concat
+
+
+# run --engine=closure
+#
+# Compiles the resolved tree once into nested Python closures and runs
+# those instead of visiting the tree. Every expression becomes a function
+# of the current environment that returns its value; every statement a
+# function of the environment that returns None, or a 1-tuple holding the
+# value of a `return` that has to unwind to the enclosing call.
+#
+# The choices the interpreter makes on every evaluation (which operator,
+# local or global, how many scopes out) are made here once, when the
+# closure is built.
+class ClosureCompiler(Expr.Visitor, Stmt.Visitor):
+    def __init__(self, lox):
+        self.lox = lox
+        self.globals = Environment()
+        # functions wrapped in a Memo, by --memo or memo()
+        self.memos: list[Memo] = []
+        defineNatives(self.globals, lox, self.memos)
+
+    def interpret(self, statements: list[Stmt]):
+        try:
+            self.sequence(statements)(self.globals)
+        except MyRuntimeError as e:
+            self.lox.runtimeError(e)
+
+    def compile(self, node):
+        return node.accept(self)
+
+    # Run statements in order, stopping at the first that returns
+    def sequence(self, statements: list[Stmt]):
+        stmts = tuple(self.compile(stmt) for stmt in statements)
+
+        if len(stmts) == 1:
+            return stmts[0]
+
+        def run(env):
+            for stmt in stmts:
+                ret = stmt(env)
+                if ret is not None:
+                    return ret
+        return run
+
+
+    # Variable access, specialised on where the variable lives
+    @staticmethod
+    def localGet(depth: int, slot: int):
+        if depth == 0:
+            return lambda env: env.values[slot]
+        if depth == 1:
+            return lambda env: env.enclosing.values[slot]
+        if depth == 2:
+            return lambda env: env.enclosing.enclosing.values[slot]
+
+        def get(env):
+            for i in range(depth):
+                env = env.enclosing
+            return env.values[slot]
+        return get
+
+    def globalGet(self, name: Token):
+        values = self.globals._values
+        lex = name.lex
+
+        def get(env):
+            try:
+                return values[lex]
+            except KeyError:
+                raise MyRuntimeError(name, f"Undefined variable '{lex}'.")
+        return get
+
+    def variable(self, expr, name: Token):
+        if expr.depth is None:
+            return self.globalGet(name)
+        return self.localGet(expr.depth, expr.slot)
+
+    # Declare what a var, fun or class statement names, in the scope it
+    # runs in
+    def declare(self, stmt: Stmt, value):
+        lex = stmt.name.lex
+        slot = stmt.slot
+        if slot is None:
+            values = self.globals._values
+
+            def define(env):
+                values[lex] = value(env)
+            return define
+
+        # LocalEnvironment.defineAt
+        def define(env):
+            val = value(env)
+            values = env.values
+            if slot < len(values):
+                values[slot] = val
+            else:
+                values.append(val)
+        return define
+
+
+    # Exprs
+    def visitLiteralExpr(self, expr: ExprLiteral):
+        val = expr.val
+        return lambda env: val
+
+    def visitGroupingExpr(self, expr: ExprGrouping):
+        return self.compile(expr.expr)
+
+    def visitUnaryExpr(self, expr: ExprUnary):
+        operand = self.compile(expr.expr)
+        op = expr.op
+
+        if op.type == TokenType.BANG:
+            def bang(env):
+                val = operand(env)
+                return val is None or val is False
+            return bang
+
+        def negate(env):
+            val = operand(env)
+            if type(val) is float:
+                return -val
+            raise MyRuntimeError(op, "Operand must be a number.")
+        return negate
+
+    def visitBinaryExpr(self, expr: ExprBinary):
+        left = self.compile(expr.left)
+        right = self.compile(expr.right)
+        op = expr.op
+        t = op.type
+
+        if t == TokenType.PLUS:
+            CHUNK = Rope.CHUNK
+
+            def add(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float or type(a) is str \
+                        and type(b) is str and len(a) + len(b) < CHUNK:
+                    return a + b
+                if type(a) in STRINGS and type(b) in STRINGS:
+                    return concat(a, b)
+                raise MyRuntimeError(op, "Operands must be two numbers or two strings.")
+            return add
+
+        if t == TokenType.EQUAL_EQUAL:
+            return lambda env: left(env) == right(env)
+        if t == TokenType.BANG_EQUAL:
+            return lambda env: not left(env) == right(env)
+
+        def numbers():
+            return MyRuntimeError(op, "Operands must be numbers.")
+
+        if t == TokenType.MINUS:
+            def sub(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a - b
+                raise numbers()
+            return sub
+        if t == TokenType.STAR:
+            def mul(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a * b
+                raise numbers()
+            return mul
+        if t == TokenType.SLASH:
+            def div(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a / b
+                raise numbers()
+            return div
+        if t == TokenType.LESS:
+            def less(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a < b
+                raise numbers()
+            return less
+        if t == TokenType.LESS_EQUAL:
+            def lessEqual(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a <= b
+                raise numbers()
+            return lessEqual
+        if t == TokenType.GREATER:
+            def greater(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a > b
+                raise numbers()
+            return greater
+        if t == TokenType.GREATER_EQUAL:
+            def greaterEqual(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a >= b
+                raise numbers()
+            return greaterEqual
+
+    def visitLogicalExpr(self, expr: ExprLogical):
+        left = self.compile(expr.left)
+        right = self.compile(expr.right)
+
+        if expr.op.type == TokenType.OR:
+            def lor(env):
+                val = left(env)
+                if val is None or val is False:
+                    return right(env)
+                return val
+            return lor
+
+        def land(env):
+            val = left(env)
+            if val is None or val is False:
+                return val
+            return right(env)
+        return land
+
+    def visitVariableExpr(self, expr: ExprVariable):
+        return self.variable(expr, expr.name)
+
+    def visitAssignExpr(self, expr: ExprAssign):
+        value = self.compile(expr.val)
+        depth, slot = expr.depth, expr.slot
+
+        if depth is None:
+            values = self.globals._values
+            name = expr.name
+            lex = name.lex
+
+            def assignGlobal(env):
+                val = value(env)
+                if lex not in values:
+                    raise MyRuntimeError(name, f"Undefined variable '{lex}'.")
+                values[lex] = val
+                return val
+            return assignGlobal
+
+        if depth == 0:
+            def assign(env):
+                val = env.values[slot] = value(env)
+                return val
+            return assign
+
+        def assignAt(env):
+            val = value(env)
+            env.ancestor(depth).values[slot] = val
+            return val
+        return assignAt
+
+    def visitCallExpr(self, expr: ExprCall):
+        if type(expr.callee) is ExprGet:
+            return self.invoke(expr, expr.callee)
+
+        callee = self.compile(expr.callee)
+        args = tuple(self.compile(arg) for arg in expr.args)
+        count = len(args)
+        paren = expr.paren
+
+        def call(env):
+            function = callee(env)
+            values = [arg(env) for arg in args]
+
+            # CompiledFunction.call inlined
+            if type(function) is CompiledFunction:
+                if function.params != count:
+                    raise MyRuntimeError(paren,
+                        f"Expected {function.params} arguments but got {count}.")
+                if function.this is not None:
+                    values.insert(0, function.this)
+                ret = function.body(LocalEnvironment(function.closure, values))
+                if function.isInit:
+                    return values[0]
+                if ret is not None:
+                    return ret[0]
+                return None
+
+            # LoxClass.call inlined
+            if type(function) is LoxClass:
+                if function.initArity != count:
+                    raise MyRuntimeError(paren,
+                        f"Expected {function.initArity} arguments but got {count}.")
+                instance = LoxInstance(function)
+                init = function.initializer
+                if init is not None:
+                    values.insert(0, instance)
+                    init.body(LocalEnvironment(init.closure, values))
+                return instance
+
+            if not isinstance(function, LoxCallable):
+                raise MyRuntimeError(paren, "Can only call functions and classes.")
+            if count != function.arity():
+                raise MyRuntimeError(paren,
+                    f"Expected {function.arity()} arguments but got {count}.")
+            return function.call(None, values)
+        return call
+
+    # obj.name(args): a method runs with obj put straight in slot 0 of its
+    # frame, without binding it first
+    def invoke(self, expr: ExprCall, get: ExprGet):
+        obj = self.compile(get.obj)
+        args = tuple(self.compile(arg) for arg in expr.args)
+        count = len(args)
+        paren = expr.paren
+        name = get.name
+        lex = name.lex
+
+        def invoke(env):
+            instance = obj(env)
+            if not isinstance(instance, LoxInstance):
+                raise MyRuntimeError(name, "Only instances have properties.")
+
+            slot = instance.shape.slots.get(lex)
+            if slot is not None:
+                function = instance.values[slot]
+            else:
+                function = instance.klass.findMethod(lex)
+                if function is None:
+                    raise MyRuntimeError(name, "Undefined property '" + lex + "'.")
+                values = [instance]
+                for arg in args:
+                    values.append(arg(env))
+                if function.params != count:
+                    raise MyRuntimeError(paren,
+                        f"Expected {function.params} arguments but got {count}.")
+                ret = function.body(LocalEnvironment(function.closure, values))
+                if function.isInit:
+                    return instance
+                if ret is not None:
+                    return ret[0]
+                return None
+
+            values = [arg(env) for arg in args]
+            if not isinstance(function, LoxCallable):
+                raise MyRuntimeError(paren, "Can only call functions and classes.")
+            if count != function.arity():
+                raise MyRuntimeError(paren,
+                    f"Expected {function.arity()} arguments but got {count}.")
+            return function.call(None, values)
+        return invoke
+
+    def visitGetExpr(self, expr: ExprGet):
+        obj = self.compile(expr.obj)
+        name = expr.name
+
+        def get(env):
+            instance = obj(env)
+            if isinstance(instance, LoxInstance):
+                return instance.get(name)
+            raise MyRuntimeError(name, "Only instances have properties.")
+        return get
+
+    def visitSetExpr(self, expr: ExprSet):
+        obj = self.compile(expr.obj)
+        value = self.compile(expr.val)
+        name = expr.name
+
+        def set(env):
+            instance = obj(env)
+            if not isinstance(instance, LoxInstance):
+                raise MyRuntimeError(name, "Only instances have fields.")
+            val = value(env)
+            instance.set(name, val)
+            return val
+        return set
+
+    def visitThisExpr(self, expr: ExprThis):
+        return self.variable(expr, expr.keyword)
+
+    def visitSuperExpr(self, expr: ExprSuper):
+        superclass = self.localGet(expr.depth, expr.slot)
+        this = self.localGet(expr.depth - 1, 0)
+        method = expr.method
+        lex = method.lex
+
+        def getSuper(env):
+            found = superclass(env).findMethod(lex)
+            if found is None:
+                raise MyRuntimeError(method, "Undefined property '" + lex + "'.")
+            return found.bind(this(env))
+        return getSuper
+
+
+    # Stmts
+    def visitExpressionStmt(self, stmt: StmtExpression):
+        expr = self.compile(stmt.expression)
+
+        def expression(env):
+            expr(env)
+        return expression
+
+    def visitPrintStmt(self, stmt: StmtPrint):
+        expr = self.compile(stmt.expression)
+        string = Interpreter.string
+
+        def printStmt(env):
+            print(string(expr(env)))
+        return printStmt
+
+    def visitVarStmt(self, stmt: StmtVariable):
+        if stmt.initializer is not None:
+            value = self.compile(stmt.initializer)
+        else:
+            value = lambda env: None
+        return self.declare(stmt, value)
+
+    def visitBlockStmt(self, stmt: StmtBlock):
+        body = self.sequence(stmt.statements)
+        if not stmt.scoped:
+            return body
+
+        def block(env):
+            return body(LocalEnvironment(env))
+        return block
+
+    def visitIfStmt(self, stmt: StmtIf):
+        condition = self.compile(stmt.condition)
+        then = self.compile(stmt.thenBranch)
+
+        if stmt.elseBranch is None:
+            def ifStmt(env):
+                val = condition(env)
+                if val is not None and val is not False:
+                    return then(env)
+            return ifStmt
+
+        otherwise = self.compile(stmt.elseBranch)
+
+        def ifElse(env):
+            val = condition(env)
+            if val is not None and val is not False:
+                return then(env)
+            return otherwise(env)
+        return ifElse
+
+    def visitWhileStmt(self, stmt: StmtWhile):
+        condition = self.compile(stmt.condition)
+        body = self.compile(stmt.body)
+
+        def whileStmt(env):
+            while True:
+                val = condition(env)
+                if val is None or val is False:
+                    return
+                ret = body(env)
+                if ret is not None:
+                    return ret
+        return whileStmt
+
+    def visitForStmt(self, stmt: StmtFor):
+        init = None
+        if stmt.initializer is not None:
+            init = self.compile(stmt.initializer)
+        condition = None
+        if stmt.condition is not None:
+            condition = self.compile(stmt.condition)
+        increment = None
+        if stmt.increment is not None:
+            increment = self.compile(stmt.increment)
+        body = self.compile(stmt.body)
+
+        if Interpreter.counts(stmt):
+            loop = self.countedFor(stmt, init, condition, increment, body)
+        else:
+            def loop(env):
+                if init is not None:
+                    init(env)
+                while True:
+                    if condition is not None:
+                        val = condition(env)
+                        if val is None or val is False:
+                            return
+                    ret = body(env)
+                    if ret is not None:
+                        return ret
+                    if increment is not None:
+                        increment(env)
+
+        if not stmt.scoped:
+            return loop
+
+        def scopedFor(env):
+            return loop(LocalEnvironment(env))
+        return scopedFor
+
+    # As Interpreter.visitCountedForStmt
+    def countedFor(self, stmt: StmtFor, init, condition, increment, body):
+        slot = stmt.initializer.slot
+        compare = Interpreter.COMPARE[stmt.condition.op.type]
+        limit = self.compile(stmt.condition.right)
+        step = stmt.increment.val.right.val
+        if stmt.increment.val.op.type == TokenType.MINUS:
+            step = -step
+
+        def countedFor(env):
+            init(env)
+            values = env.values
+            while True:
+                i = values[slot]
+                bound = limit(env)
+                if type(i) is float and type(bound) is float:
+                    if not compare(i, bound):
+                        return
+                else:
+                    val = condition(env)
+                    if val is None or val is False:
+                        return
+
+                ret = body(env)
+                if ret is not None:
+                    return ret
+
+                i = values[slot]
+                if type(i) is float:
+                    values[slot] = i + step
+                else:
+                    increment(env)
+        return countedFor
+
+    def function(self, stmt: StmtFunction):
+        body = self.sequence(stmt.body)
+        return stmt.name.lex, len(stmt.params), body
+
+    def visitFunctionStmt(self, stmt: StmtFunction):
+        name, params, body = self.function(stmt)
+        if stmt.pure and self.lox.memo:
+            return self.declare(stmt, lambda env: self.memoize(
+                CompiledFunction(name, params, body, env, False)))
+        return self.declare(stmt, lambda env: CompiledFunction(name, params, body, env, False))
+
+    def memoize(self, function: LoxCallable) -> Memo:
+        memo = Memo(function, self.lox.memoSize)
+        self.memos.append(memo)
+        return memo
+
+    def visitReturnStmt(self, stmt: StmtReturn):
+        if stmt.value is None:
+            return lambda env: (None,)
+        value = self.compile(stmt.value)
+        return lambda env: (value(env),)
+
+    def visitClassStmt(self, stmt: StmtClass):
+        name = stmt.name.lex
+        methods = [self.function(method) for method in stmt.methods]
+
+        superclass = None
+        if stmt.superclass is not None:
+            superclass = self.compile(stmt.superclass)
+            superName = stmt.superclass.name
+
+        def klass(env):
+            parent = None
+            if superclass is not None:
+                parent = superclass(env)
+                if not isinstance(parent, LoxClass):
+                    raise MyRuntimeError(superName, "Superclass must be a class.")
+                env = LocalEnvironment(env, [parent])
+
+            table = {}
+            for lex, params, body in methods:
+                table[lex] = CompiledFunction(lex, params, body, env, lex == "init")
+            return LoxClass(name, parent, table)
+
+        return self.declare(stmt, klass)
+
+
+# A Lox function compiled by ClosureCompiler. body runs directly in the
+# scope that holds the parameters, after "this" for a method.
+class CompiledFunction(LoxCallable):
+    __slots__ = ("name", "params", "body", "closure", "isInit", "this")
+
+    def __init__(self, name: str, params: int, body, closure, isInit: bool, this=None):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.closure = closure
+        self.isInit = isInit
+        # the instance a method was bound to
+        self.this = this
+
+    def call(self, interpreter, args):
+        if self.this is not None:
+            args.insert(0, self.this)
+        ret = self.body(LocalEnvironment(self.closure, args))
+        if self.isInit:
+            return args[0]
+        if ret is not None:
+            return ret[0]
+        return None
+
+    def callOn(self, interpreter, this, args):
+        args.insert(0, this)
+        ret = self.body(LocalEnvironment(self.closure, args))
+        if self.isInit:
+            return this
+        if ret is not None:
+            return ret[0]
+        return None
+
+    def arity(self) -> int:
+        return self.params
+
+    def bind(self, instance):
+        return CompiledFunction(self.name, self.params, self.body, self.closure,
+                                self.isInit, instance)
+
+    def __str__(self) -> str:
+        return f"<fn {self.name}>"
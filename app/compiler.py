@@ -0,0 +1,402 @@
+from enum import Enum
+
+from app.tokens import Token, TokenType
+from app.expression import *
+from app.statement import *
+from app.chunk import Chunk, FunctionProto, OpCode
+
+
+class FunctionType(Enum):
+    SCRIPT = 0
+    FUNCTION = 1
+    METHOD = 2
+    INITIALIZER = 3
+
+
+class Local:
+    __slots__ = ("name", "depth", "captured")
+
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth
+        self.captured = False
+
+
+# Per-function compiler state, as in clox
+class FunctionState:
+    def __init__(self, enclosing, function: FunctionProto, kind: FunctionType):
+        self.enclosing: FunctionState = enclosing
+        self.function = function
+        self.kind = kind
+        # slot 0 holds the function itself, or the receiver in methods
+        receiver = "this" if kind in (FunctionType.METHOD, FunctionType.INITIALIZER) else ""
+        self.locals: list[Local] = [Local(receiver, 0)]
+        self.upvalues: list[tuple[int, int]] = []
+        self.scopeDepth = 0
+
+
+# Compiles the resolved tree to bytecode for the VM. The Resolver has
+# already reported every scoping error, so this only works out where each
+# name lives: a stack slot, an upvalue or a global.
+class Compiler(Expr.Visitor, Stmt.Visitor):
+    def __init__(self, lox):
+        self.lox = lox
+        self.current: FunctionState = None
+        self.line = 1
+        self.hadError = False
+
+    def compile(self, statements: list[Stmt]) -> FunctionProto:
+        self.current = FunctionState(None, FunctionProto(None), FunctionType.SCRIPT)
+        for stmt in statements:
+            stmt.accept(self)
+        function = self.endFunction()
+        return None if self.hadError else function
+
+    def error(self, msg: str) -> None:
+        self.lox.report(self.line, "", msg)
+        self.hadError = True
+
+
+    # Emitting
+    def chunk(self) -> Chunk:
+        return self.current.function.chunk
+
+    def emit(self, op: OpCode, *operands: int, line: int = None) -> None:
+        if line is not None:
+            self.line = line
+        chunk = self.chunk()
+        chunk.write(op, self.line)
+        for operand in operands:
+            chunk.write(operand, self.line)
+
+    def constant(self, val) -> int:
+        index = self.chunk().addConstant(val)
+        if index > Chunk.MAX_OPERAND:
+            self.error("Too many constants in one chunk.")
+            return 0
+        return index
+
+    def emitJump(self, op: OpCode) -> int:
+        self.emit(op, 0)
+        return len(self.chunk().code) - 1
+
+    def patchJump(self, at: int) -> None:
+        offset = len(self.chunk().code) - at - 1
+        if offset > Chunk.MAX_OPERAND:
+            self.error("Too much code to jump over.")
+        self.chunk().code[at] = offset & Chunk.MAX_OPERAND
+
+    def emitLoop(self, start: int) -> None:
+        offset = len(self.chunk().code) + 2 - start
+        if offset > Chunk.MAX_OPERAND:
+            self.error("Loop body too large.")
+            offset = 0
+        self.emit(OpCode.LOOP, offset)
+
+    def emitReturn(self) -> None:
+        if self.current.kind == FunctionType.INITIALIZER:
+            self.emit(OpCode.GET_LOCAL, 0)
+        else:
+            self.emit(OpCode.NIL)
+        self.emit(OpCode.RETURN)
+
+    def endFunction(self) -> FunctionProto:
+        self.emitReturn()
+        function = self.current.function
+        function.upvalues = len(self.current.upvalues)
+        self.current = self.current.enclosing
+        return function
+
+
+    # Scopes and variables
+    def beginScope(self) -> None:
+        self.current.scopeDepth += 1
+
+    def endScope(self) -> None:
+        state = self.current
+        state.scopeDepth -= 1
+        while state.locals and state.locals[-1].depth > state.scopeDepth:
+            if state.locals.pop().captured:
+                self.emit(OpCode.CLOSE_UPVALUE)
+            else:
+                self.emit(OpCode.POP)
+
+    def addLocal(self, name: str) -> None:
+        if len(self.current.locals) > Chunk.MAX_OPERAND:
+            self.error("Too many local variables in function.")
+            return
+        self.current.locals.append(Local(name, self.current.scopeDepth))
+
+    # The value to bind is on top of the stack
+    def defineVariable(self, name: Token) -> None:
+        if self.current.scopeDepth > 0:
+            self.addLocal(name.lex)
+        else:
+            self.emit(OpCode.DEFINE_GLOBAL, self.constant(name.lex), line=name.line)
+
+    @staticmethod
+    def resolveLocal(state: FunctionState, name: str) -> int:
+        for i in range(len(state.locals) - 1, -1, -1):
+            if state.locals[i].name == name:
+                return i
+        return -1
+
+    def addUpvalue(self, state: FunctionState, index: int, isLocal: bool) -> int:
+        upvalue = (int(isLocal), index)
+        if upvalue in state.upvalues:
+            return state.upvalues.index(upvalue)
+        if len(state.upvalues) > Chunk.MAX_OPERAND:
+            self.error("Too many closure variables in function.")
+            return 0
+        state.upvalues.append(upvalue)
+        return len(state.upvalues) - 1
+
+    def resolveUpvalue(self, state: FunctionState, name: str) -> int:
+        if state.enclosing is None:
+            return -1
+
+        local = self.resolveLocal(state.enclosing, name)
+        if local != -1:
+            state.enclosing.locals[local].captured = True
+            return self.addUpvalue(state, local, True)
+
+        upvalue = self.resolveUpvalue(state.enclosing, name)
+        if upvalue != -1:
+            return self.addUpvalue(state, upvalue, False)
+        return -1
+
+    def namedVariable(self, name: str, line: int, value: Expr = None) -> None:
+        slot = self.resolveLocal(self.current, name)
+        if slot != -1:
+            get, put, arg = OpCode.GET_LOCAL, OpCode.SET_LOCAL, slot
+        else:
+            arg = self.resolveUpvalue(self.current, name)
+            if arg != -1:
+                get, put = OpCode.GET_UPVALUE, OpCode.SET_UPVALUE
+            else:
+                get, put, arg = OpCode.GET_GLOBAL, OpCode.SET_GLOBAL, self.constant(name)
+
+        if value is None:
+            self.emit(get, arg, line=line)
+        else:
+            value.accept(self)
+            self.emit(put, arg, line=line)
+
+
+    # Exprs
+    def visitLiteralExpr(self, expr: ExprLiteral):
+        if expr.val is None:
+            self.emit(OpCode.NIL)
+        elif expr.val is True:
+            self.emit(OpCode.TRUE)
+        elif expr.val is False:
+            self.emit(OpCode.FALSE)
+        else:
+            self.emit(OpCode.CONSTANT, self.constant(expr.val))
+
+    def visitGroupingExpr(self, expr: ExprGrouping):
+        expr.expr.accept(self)
+
+    def visitUnaryExpr(self, expr: ExprUnary):
+        expr.expr.accept(self)
+        if expr.op.type == TokenType.BANG:
+            self.emit(OpCode.NOT, line=expr.op.line)
+        else:
+            self.emit(OpCode.NEGATE, line=expr.op.line)
+
+    BINARY = {
+        TokenType.PLUS: OpCode.ADD,
+        TokenType.MINUS: OpCode.SUBTRACT,
+        TokenType.STAR: OpCode.MULTIPLY,
+        TokenType.SLASH: OpCode.DIVIDE,
+        TokenType.LESS: OpCode.LESS,
+        TokenType.LESS_EQUAL: OpCode.LESS_EQUAL,
+        TokenType.GREATER: OpCode.GREATER,
+        TokenType.GREATER_EQUAL: OpCode.GREATER_EQUAL,
+        TokenType.EQUAL_EQUAL: OpCode.EQUAL,
+        TokenType.BANG_EQUAL: OpCode.NOT_EQUAL,
+    }
+
+    def visitBinaryExpr(self, expr: ExprBinary):
+        expr.left.accept(self)
+        expr.right.accept(self)
+        self.emit(self.BINARY[expr.op.type], line=expr.op.line)
+
+    def visitLogicalExpr(self, expr: ExprLogical):
+        expr.left.accept(self)
+        if expr.op.type == TokenType.OR:
+            end = self.emitJump(OpCode.JUMP_IF_TRUE)
+        else:
+            end = self.emitJump(OpCode.JUMP_IF_FALSE)
+        self.emit(OpCode.POP)
+        expr.right.accept(self)
+        self.patchJump(end)
+
+    def visitVariableExpr(self, expr: ExprVariable):
+        self.namedVariable(expr.name.lex, expr.name.line)
+
+    def visitAssignExpr(self, expr: ExprAssign):
+        self.namedVariable(expr.name.lex, expr.name.line, expr.val)
+
+    def visitCallExpr(self, expr: ExprCall):
+        if isinstance(expr.callee, ExprGet):
+            # receiver and method stay apart on the stack, so no bound
+            # method is made just to be called
+            expr.callee.obj.accept(self)
+            name = expr.callee.name
+            self.emit(OpCode.GET_METHOD, self.constant(name.lex), line=name.line)
+            op = OpCode.INVOKE
+        else:
+            expr.callee.accept(self)
+            op = OpCode.CALL
+
+        for arg in expr.args:
+            arg.accept(self)
+        self.emit(op, len(expr.args), line=expr.paren.line)
+
+    def visitGetExpr(self, expr: ExprGet):
+        expr.obj.accept(self)
+        self.emit(OpCode.GET_PROPERTY, self.constant(expr.name.lex), line=expr.name.line)
+
+    def visitSetExpr(self, expr: ExprSet):
+        expr.obj.accept(self)
+        # The interpreter rejects a non-instance before it evaluates the
+        # value, so check first unless the value can't have any effect.
+        val = expr.val
+        if not (isinstance(val, (ExprLiteral, ExprThis)) or
+                isinstance(val, ExprVariable) and val.depth is not None):
+            self.emit(OpCode.CHECK_INSTANCE, line=expr.name.line)
+        val.accept(self)
+        self.emit(OpCode.SET_PROPERTY, self.constant(expr.name.lex), line=expr.name.line)
+
+    def visitThisExpr(self, expr: ExprThis):
+        self.namedVariable("this", expr.keyword.line)
+
+    def visitSuperExpr(self, expr: ExprSuper):
+        self.namedVariable("this", expr.keyword.line)
+        self.namedVariable("super", expr.keyword.line)
+        self.emit(OpCode.GET_SUPER, self.constant(expr.method.lex), line=expr.method.line)
+
+
+    # Stmts
+    def visitExpressionStmt(self, stmt: StmtExpression):
+        stmt.expression.accept(self)
+        self.emit(OpCode.POP)
+
+    def visitPrintStmt(self, stmt: StmtPrint):
+        stmt.expression.accept(self)
+        self.emit(OpCode.PRINT)
+
+    def visitVarStmt(self, stmt: StmtVariable):
+        if stmt.initializer is not None:
+            stmt.initializer.accept(self)
+        else:
+            self.emit(OpCode.NIL)
+        self.defineVariable(stmt.name)
+
+    def visitBlockStmt(self, stmt: StmtBlock):
+        self.beginScope()
+        for inner in stmt.statements:
+            inner.accept(self)
+        self.endScope()
+
+    def visitIfStmt(self, stmt: StmtIf):
+        stmt.condition.accept(self)
+        thenJump = self.emitJump(OpCode.JUMP_IF_FALSE)
+        self.emit(OpCode.POP)
+        stmt.thenBranch.accept(self)
+        elseJump = self.emitJump(OpCode.JUMP)
+        self.patchJump(thenJump)
+        self.emit(OpCode.POP)
+        if stmt.elseBranch is not None:
+            stmt.elseBranch.accept(self)
+        self.patchJump(elseJump)
+
+    def visitWhileStmt(self, stmt: StmtWhile):
+        start = len(self.chunk().code)
+        stmt.condition.accept(self)
+        exitJump = self.emitJump(OpCode.JUMP_IF_FALSE)
+        self.emit(OpCode.POP)
+        stmt.body.accept(self)
+        self.emitLoop(start)
+        self.patchJump(exitJump)
+        self.emit(OpCode.POP)
+
+    def visitForStmt(self, stmt: StmtFor):
+        self.beginScope()
+        if stmt.initializer is not None:
+            stmt.initializer.accept(self)
+
+        start = len(self.chunk().code)
+        exitJump = None
+        if stmt.condition is not None:
+            stmt.condition.accept(self)
+            exitJump = self.emitJump(OpCode.JUMP_IF_FALSE)
+            self.emit(OpCode.POP)
+
+        stmt.body.accept(self)
+        if stmt.increment is not None:
+            stmt.increment.accept(self)
+            self.emit(OpCode.POP)
+        self.emitLoop(start)
+
+        if exitJump is not None:
+            self.patchJump(exitJump)
+            self.emit(OpCode.POP)
+        self.endScope()
+
+    def function(self, stmt: StmtFunction, kind: FunctionType) -> None:
+        function = FunctionProto(stmt.name.lex, len(stmt.params))
+        self.current = FunctionState(self.current, function, kind)
+        self.beginScope()
+        for param in stmt.params:
+            self.addLocal(param.lex)
+        for inner in stmt.body:
+            inner.accept(self)
+        state = self.current
+        self.endFunction()
+
+        self.emit(OpCode.CLOSURE, self.constant(function), line=stmt.name.line)
+        for isLocal, index in state.upvalues:
+            self.emit(isLocal, index)
+
+    def visitFunctionStmt(self, stmt: StmtFunction):
+        # declared first so the body can call itself
+        if self.current.scopeDepth > 0:
+            self.addLocal(stmt.name.lex)
+            self.function(stmt, FunctionType.FUNCTION)
+        else:
+            self.function(stmt, FunctionType.FUNCTION)
+            self.defineVariable(stmt.name)
+
+    def visitReturnStmt(self, stmt: StmtReturn):
+        self.line = stmt.keyword.line
+        if stmt.value is None:
+            self.emitReturn()
+        else:
+            stmt.value.accept(self)
+            self.emit(OpCode.RETURN)
+
+    def visitClassStmt(self, stmt: StmtClass):
+        name = stmt.name
+        self.emit(OpCode.CLASS, self.constant(name.lex), line=name.line)
+        self.defineVariable(name)
+
+        if stmt.superclass is not None:
+            superName = stmt.superclass.name
+            self.namedVariable(superName.lex, superName.line)
+            self.beginScope()
+            self.addLocal("super")
+            self.namedVariable(name.lex, name.line)
+            self.emit(OpCode.INHERIT, line=superName.line)
+
+        self.namedVariable(name.lex, name.line)
+        for method in stmt.methods:
+            kind = FunctionType.INITIALIZER if method.name.lex == "init" \
+                else FunctionType.METHOD
+            self.function(method, kind)
+            self.emit(OpCode.METHOD, self.constant(method.name.lex))
+        self.emit(OpCode.POP)
+
+        if stmt.superclass is not None:
+            self.endScope()
@@ -1,5 +1,6 @@
 from app.tokens import Token
 from app.runtime import MyRuntimeError
+from app.callable import LoxCallable
 
 
 
@@ -42,4 +43,78 @@ class Environment:
             self.enclosing.assign(name, val)
             return 
         
-        raise MyRuntimeError(name, f"Undefined variable '{name.lex}'.")
\ No newline at end of file
+        raise MyRuntimeError(name, f"Undefined variable '{name.lex}'.")
+
+# Interpreter's globals. Every name gets an index in values the first time
+# it is defined and keeps it, redefinitions included, so a use site can
+# look its index up once and read the list from then on.
+#
+# epoch changes whenever a function or class held by a global is replaced,
+# which is what a call site that bound the callee itself has to check.
+class GlobalEnvironment:
+    __slots__ = ("values", "index", "epoch", "enclosing")
+
+    def __init__(self):
+        self.values: list = []
+        self.index: dict[str, int] = {}
+        self.epoch = 0
+        self.enclosing = None
+
+    def define(self, name: str, val):
+        slot = self.index.get(name)
+        if slot is None:
+            self.index[name] = len(self.values)
+            self.values.append(val)
+        else:
+            self.setSlot(slot, val)
+
+    def slotOf(self, name: Token) -> int:
+        slot = self.index.get(name.lex)
+        if slot is None:
+            raise MyRuntimeError(name, f"Undefined variable '{name.lex}'.")
+        return slot
+
+    def setSlot(self, slot: int, val) -> None:
+        if isinstance(self.values[slot], LoxCallable):
+            self.epoch += 1
+        self.values[slot] = val
+
+    def get(self, name: Token):
+        return self.values[self.slotOf(name)]
+
+    def assign(self, name: Token, val):
+        self.setSlot(self.slotOf(name), val)
+
+# Environment for a block, function or method scope. The resolver gives
+# every local a slot numbered in declaration order, so reads are list
+# indexes. Globals stay in a GlobalEnvironment.
+class LocalEnvironment:
+    __slots__ = ("values", "enclosing")
+
+    def __init__(self, env = None, values: list = None):
+        self.values = values if values is not None else []
+        self.enclosing = env
+
+    def define(self, name: str, val):
+        self.values.append(val)
+
+    # A slot can be one a block that has ended used before, or the next new
+    # one: everything below it belongs to declarations that already ran
+    def defineAt(self, slot: int, val) -> None:
+        values = self.values
+        if slot < len(values):
+            values[slot] = val
+        else:
+            values.append(val)
+
+    def ancestor(self, dist: int):
+        env = self
+        for i in range(dist):
+            env = env.enclosing
+        return env
+
+    def getAt(self, dist: int, slot: int):
+        return self.ancestor(dist).values[slot]
+
+    def assignAt(self, dist: int, slot: int, val) -> None:
+        self.ancestor(dist).values[slot] = val
@@ -6,6 +6,8 @@ from app.statement import Stmt
 
 
 class Expr(Stmt, ABC):
+    __slots__ = ()
+
     class Visitor(ABC):
         @abstractmethod
         def visitLiteralExpr(self, expr): 
@@ -55,6 +57,53 @@ class Expr(Stmt, ABC):
         def visitSuperExpr(self, expr):
             pass
 
+        # Quickened nodes (see the end of this file). A visitor that
+        # doesn't handle them sees the node they started as.
+        def visitAddNumbersExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitAddStringsExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitSubtractExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitMultiplyExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitDivideExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitLessExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitLessEqualExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitGreaterExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitGreaterEqualExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitEqualExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitNotEqualExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitBinaryGenericExpr(self, expr):
+            return self.visitBinaryExpr(expr)
+
+        def visitNegateExpr(self, expr):
+            return self.visitUnaryExpr(expr)
+
+        def visitNotExpr(self, expr):
+            return self.visitUnaryExpr(expr)
+
+        def visitUnaryGenericExpr(self, expr):
+            return self.visitUnaryExpr(expr)
+
     # @abstractmethod
     def __str__(self): 
         pass 
@@ -64,6 +113,8 @@ class Expr(Stmt, ABC):
         pass
 
 class ExprLiteral(Expr):
+    __slots__ = ("val",)
+
     def __init__(self, val):
         self.val = val
     
@@ -78,6 +129,8 @@ class ExprLiteral(Expr):
         return visitor.visitLiteralExpr(self)
     
 class ExprUnary(Expr): 
+    __slots__ = ("op", "expr")
+
     def __init__(self, op, expr: Expr):
         self.op = op
         self.expr = expr
@@ -89,6 +142,8 @@ class ExprUnary(Expr):
         return visitor.visitUnaryExpr(self)
 
 class ExprGrouping(Expr): 
+    __slots__ = ("expr",)
+
     def __init__(self, expr: Expr):
         self.expr = expr
     
@@ -99,6 +154,8 @@ class ExprGrouping(Expr):
         return visitor.visitGroupingExpr(self)
 
 class ExprBinary(Expr): 
+    __slots__ = ("op", "left", "right")
+
     def __init__(self, op, left = None, right = None):
         self.op = op
         self.left = left
@@ -111,8 +168,14 @@ class ExprBinary(Expr):
         return visitor.visitBinaryExpr(self)
     
 class ExprVariable(Expr):
+    __slots__ = ("name", "depth", "slot")
+
     def __init__(self, name: Token):
         self.name = name
+        # set by the resolver for locals; None means global, and then slot
+        # is the global's index, once the interpreter first looks it up
+        self.depth = None
+        self.slot = None
 
     # def __str__(self):
     #     return f"{self.name.lex}"   # TODO 
@@ -121,9 +184,13 @@ class ExprVariable(Expr):
         return visitor.visitVariableExpr(self)
     
 class ExprAssign(Expr):
+    __slots__ = ("name", "val", "depth", "slot")
+
     def __init__(self, name: Token, val: Expr):
         self.name = name
         self.val = val
+        self.depth = None
+        self.slot = None
 
     # def __str__(self):
     #     return f"{self.name.lex} = {self.val}"
@@ -132,6 +199,8 @@ class ExprAssign(Expr):
         return visitor.visitAssignExpr(self)
     
 class ExprLogical(Expr):
+    __slots__ = ("left", "op", "right")
+
     def __init__(self, left: Expr, op: Token, right: Expr):
         self.left = left
         self.op = op
@@ -141,10 +210,16 @@ class ExprLogical(Expr):
         return visitor.visitLogicalExpr(self)
     
 class ExprCall(Expr):
+    __slots__ = ("callee", "paren", "args", "cacheCallee", "cacheEpoch")
+
     def __init__(self, callee: Expr, paren: Token, args: list[Expr]):
         self.callee = callee
         self.paren = paren
         self.args = args 
+        # a global function or class the call was bound to, and the
+        # globals' epoch when it was
+        self.cacheCallee = None
+        self.cacheEpoch = None
 
     def accept(self, visitor):
         return visitor.visitCallExpr(self)
@@ -153,33 +228,158 @@ class ExprCall(Expr):
 # Class Expressions 
 
 class ExprGet(Expr):
+    __slots__ = ("obj", "name", "cacheShape", "cacheSlot", "cacheClass", "cacheMethod")
+
     def __init__(self, obj: Expr, name: Token):
         self.obj = obj
         self.name = name
+        # the slot this site last read the field from, and the shape it
+        # was read through
+        self.cacheShape = None
+        self.cacheSlot = None
+        # the method this site last found, and the class it found it in
+        self.cacheClass = None
+        self.cacheMethod = None
 
     def accept(self, visitor):
         return visitor.visitGetExpr(self)
     
 class ExprSet(Expr):
+    __slots__ = ("obj", "name", "val", "cacheShape", "cacheSlot", "cacheFrom", "cacheTo")
+
     def __init__(self, obj: Expr, name: Token, val: Expr):
         self.obj = obj
         self.name = name
         self.val = val
+        # the slot this site last stored an existing field in, and its shape
+        self.cacheShape = None
+        self.cacheSlot = None
+        # the shape change this site last made by adding the field
+        self.cacheFrom = None
+        self.cacheTo = None
 
     def accept(self, visitor):
         return visitor.visitSetExpr(self)
 
 class ExprThis(Expr):
+    __slots__ = ("keyword", "depth", "slot")
+
     def __init__(self, keyword: Token):
         self.keyword = keyword
+        self.depth = None
+        self.slot = None
 
     def accept(self, visitor):
         return visitor.visitThisExpr(self)
     
 class ExprSuper(Expr):
+    __slots__ = ("keyword", "method", "depth", "slot", "cacheClass", "cacheMethod")
+
     def __init__(self, keyword: Token, method: Token):
         self.keyword = keyword
         self.method = method
+        self.depth = None
+        self.slot = None
+        # the method this site last found, and the superclass it found it in
+        self.cacheClass = None
+        self.cacheMethod = None
+
+    def accept(self, visitor):
+        return visitor.visitSuperExpr(self)
+
+
+# Quickened forms of ExprBinary and ExprUnary. The first time Interpreter
+# evaluates one of those nodes it swaps the node's __class__ for the form
+# that fits the operand types it saw, so later evaluations skip the
+# operator dispatch and the generic checks. When the types change the node
+# is swapped to the generic form for good.
+
+class ExprAddNumbers(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitAddNumbersExpr(self)
+
+class ExprAddStrings(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitAddStringsExpr(self)
+
+class ExprSubtract(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitSubtractExpr(self)
+
+class ExprMultiply(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitMultiplyExpr(self)
+
+class ExprDivide(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitDivideExpr(self)
+
+class ExprLess(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitLessExpr(self)
+
+class ExprLessEqual(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitLessEqualExpr(self)
+
+class ExprGreater(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitGreaterExpr(self)
+
+class ExprGreaterEqual(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitGreaterEqualExpr(self)
+
+class ExprEqual(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitEqualExpr(self)
+
+class ExprNotEqual(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitNotEqualExpr(self)
+
+class ExprBinaryGeneric(ExprBinary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitBinaryGenericExpr(self)
+
+class ExprNegate(ExprUnary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitNegateExpr(self)
+
+class ExprNot(ExprUnary):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        return visitor.visitNotExpr(self)
+
+class ExprUnaryGeneric(ExprUnary):
+    __slots__ = ()
 
     def accept(self, visitor):
-        return visitor.visitSuperExpr(self)
\ No newline at end of file
+        return visitor.visitUnaryGenericExpr(self)
@@ -1,39 +1,52 @@
 from app.callable import LoxCallable
-from app.environment import Environment
+from app.environment import Environment, LocalEnvironment
 from app.statement import StmtFunction
-from app.ret import ReturnExcept 
 
 
 class LoxFunction(LoxCallable):
-    def __init__(self, declaration, closure: Environment, isInit: bool): 
+    def __init__(self, declaration, closure: Environment, isInit: bool, this=None): 
         self.declaration = declaration
         self.closure = closure
         self.isInit = isInit
+        # the instance a method was bound to
+        self.this = this
 
     def call(self, interpreter, args) -> None:
-        env: Environment = Environment(self.closure)
+        # parameters are the first slots of the function's scope, in order,
+        # after "this" for a method; args is a fresh list built by the
+        # call, so it can be taken over
+        if self.this is not None:
+            args.insert(0, self.this)
+        env = LocalEnvironment(self.closure, args)
 
-        for i, v in enumerate(self.declaration.params):
-            env.define(v.lex, args[i])
-
-        try: 
-            interpreter.executeBlock(self.declaration.body, env)
-        except ReturnExcept as ret:
-            if self.isInit:
-                return self.closure.getAt(0, "this")
-            return ret.val
+        # a `return` comes back as a 1-tuple of its value
+        ret = interpreter.executeBlock(self.declaration.body, env)
 
         if self.isInit:
-            return self.closure.getAt(0, "this")
+            return env.values[0]
+        if ret is not None:
+            return ret[0]
         return None 
     
+    # Run as a method of this without binding to it first
+    def callOn(self, interpreter, this, args):
+        args.insert(0, this)
+        env = LocalEnvironment(self.closure, args)
+        ret = interpreter.executeBlock(self.declaration.body, env)
+
+        if self.isInit:
+            return this
+        if ret is not None:
+            return ret[0]
+        return None
+
     def arity(self) -> int:
         return len(self.declaration.params)
     
     def __str__(self) -> str: 
         return f"<fn {self.declaration.name.lex}>"
     
+    # Only for a method used as a value; Interpreter calls `obj.name(...)`
+    # without binding
     def bind(self, instance):
-        env = Environment(self.closure)
-        env.define("this", instance)
-        return LoxFunction(self.declaration, env, self.isInit)
\ No newline at end of file
+        return LoxFunction(self.declaration, self.closure, self.isInit, instance)
\ No newline at end of file
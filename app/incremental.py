@@ -0,0 +1,205 @@
+from bisect import bisect_right
+
+from app.tokens import Token, TokenType
+from app.scanner import Scanner
+from app.parser import Parser
+from app.statement import Stmt
+
+
+# Stands in for Lox while scanning and parsing a region: collects errors
+# instead of printing them.
+class Diagnostics:
+    def __init__(self):
+        self.ignore_error = False
+        self.hadError = False
+        self.unterminated = False
+        self.errors: list[tuple[int, str, str]] = []
+
+    def tokenError(self, line: int, msg: str):
+        self.errors.append((line, "", msg))
+        self.hadError = True
+        if msg == "Unterminated string.":
+            self.unterminated = True
+
+    def parseError(self, token: Token, msg: str):
+        if token.type == TokenType.EOF:
+            self.errors.append((token.line, " at end", msg))
+        else:
+            self.errors.append((token.line, f" at '{token.lex}'", msg))
+        self.hadError = True
+
+
+# A run of whole source lines holding one or more top-level declarations.
+# Chunk boundaries always fall between lines and between declarations, so
+# a chunk can be rescanned and reparsed without looking at its neighbours.
+class Chunk:
+    __slots__ = ("text", "line", "stmts", "tokens", "errors", "shift",
+                 "first", "clean")
+
+    def __init__(self, text: str, line: int):
+        self.text = text
+        self.line = line
+        self.stmts: list[Stmt] = []
+        self.tokens: list[Token] = []
+        self.errors: list[tuple[int, str, str]] = []
+        # line delta not yet applied to self.tokens and self.errors
+        self.shift = 0
+        self.first: TokenType = None
+        # False if the last declaration failed and the parser had to sync;
+        # where that sync stopped depends on the chunk that follows
+        self.clean = True
+
+
+class IncrementalSource:
+    def __init__(self, text: str = ""):
+        self._chunks: list[Chunk] = []
+        self._starts: list[int] = []
+        self._replace(0, -1, self._parse(text, 1)[0])
+
+    def text(self) -> str:
+        return "".join(chunk.text for chunk in self._chunks)
+
+    # Replace text[start:end] with text. Only the chunks the edit touches
+    # are rescanned and reparsed; every other chunk keeps its Stmt objects.
+    def edit(self, start: int, end: int, text: str) -> None:
+        chunks = self._chunks
+        i = self._chunkAt(start)
+        j = self._chunkAt(end)
+        while i > 0 and not chunks[i - 1].clean:
+            i -= 1
+
+        base = self._starts[i]
+        region = "".join(chunk.text for chunk in chunks[i:j + 1])
+        region = region[:start - base] + text + region[end - base:]
+
+        # The region has to end where a full parse would also end a
+        # declaration. Otherwise grow it, doubling each time.
+        while True:
+            parsed, clean = self._parse(region, chunks[i].line)
+            nxt = j + 1
+            if nxt == len(chunks) or \
+                    (clean and chunks[nxt].first != TokenType.ELSE):
+                break
+            j = min(len(chunks) - 1, j + (j - i + 1))
+            region += "".join(chunk.text for chunk in chunks[nxt:j + 1])
+
+        self._replace(i, j, parsed)
+
+    def statements(self) -> list[Stmt]:
+        statements: list[Stmt] = []
+        for chunk in self._chunks:
+            self._settle(chunk)
+            statements.extend(chunk.stmts)
+        return statements
+
+    def diagnostics(self) -> list[str]:
+        return [f"[line {line + chunk.shift}] Error{where}: {msg}"
+                for chunk in self._chunks
+                for line, where, msg in chunk.errors]
+
+    def _chunkAt(self, offset: int) -> int:
+        return max(0, min(bisect_right(self._starts, offset) - 1,
+                          len(self._chunks) - 1))
+
+    # Swap chunks[i:j+1] for new ones and move everything after them.
+    def _replace(self, i: int, j: int, new: list[Chunk]) -> None:
+        chunks = self._chunks
+        old = chunks[i:j + 1]
+        delta = sum(c.text.count("\n") for c in new) - \
+                sum(c.text.count("\n") for c in old)
+        chunks[i:j + 1] = new
+
+        if delta:
+            for chunk in chunks[i + len(new):]:
+                chunk.line += delta
+                chunk.shift += delta
+
+        offset = self._starts[i] if i < len(self._starts) else 0
+        starts = self._starts[:i]
+        for chunk in chunks[i:]:
+            starts.append(offset)
+            offset += len(chunk.text)
+        self._starts = starts
+
+    @staticmethod
+    def _settle(chunk: Chunk) -> None:
+        if chunk.shift:
+            for token in chunk.tokens:
+                token.line += chunk.shift
+            chunk.errors = [(line + chunk.shift, where, msg)
+                            for line, where, msg in chunk.errors]
+            chunk.shift = 0
+
+    # Scan and parse text, which starts at line, into chunks. Also report
+    # whether the parse ended cleanly at a declaration boundary, i.e.
+    # nothing was cut short by the end of the region.
+    @staticmethod
+    def _parse(text: str, line: int) -> tuple[list[Chunk], bool]:
+        diags = Diagnostics()
+        tokens: list[Token] = []
+
+        def record(scanned):
+            for token in scanned:
+                tokens.append(token)
+                yield token
+
+        parser = Parser(diags, record(Scanner(diags, text, line).scan()))
+        decls: list[tuple[int, int, Stmt]] = []
+        while not parser.atEnd():
+            first = parser.peek().line
+            try:
+                stmt = parser.declaration()
+            except (Parser.NestingError, RecursionError):
+                # nested deeper than the parser can recurse, and the token
+                # stream may have died with it: the rest of the region goes
+                # unparsed into this declaration's chunk
+                diags.parseError(parser.peek(), "Too much nesting.")
+                decls.append((first, first, None))
+                break
+            last = parser.prev()
+            decls.append((first, last.line + last.lex.count("\n"), stmt))
+
+        clean = not diags.unterminated and \
+                (not decls or decls[-1][2] is not None)
+
+        # Start a new chunk wherever a declaration begins on a later line
+        # than the previous one ended.
+        bounds: list[int] = [line]
+        last = None
+        for first, end, _ in decls:
+            if last is not None and first > last:
+                bounds.append(first)
+            last = end if last is None else max(last, end)
+
+        lines = text.split("\n")
+        chunks: list[Chunk] = []
+        for k, begin in enumerate(bounds):
+            stop = bounds[k + 1] if k + 1 < len(bounds) else line + len(lines)
+            body = "\n".join(lines[begin - line:stop - line])
+            if stop - line < len(lines):
+                body += "\n"
+            chunks.append(Chunk(body, begin))
+
+        k = 0
+        for first, _, stmt in decls:
+            while k + 1 < len(chunks) and chunks[k + 1].line <= first:
+                k += 1
+            if stmt is not None:
+                chunks[k].stmts.append(stmt)
+            chunks[k].clean = stmt is not None
+
+        k = 0
+        for token in tokens:
+            if token.type == TokenType.EOF:
+                break
+            while k + 1 < len(chunks) and chunks[k + 1].line <= token.line:
+                k += 1
+            chunks[k].tokens.append(token)
+            if chunks[k].first is None:
+                chunks[k].first = token.type
+
+        for error in diags.errors:
+            k = bisect_right([c.line for c in chunks], error[0]) - 1
+            chunks[max(k, 0)].errors.append(error)
+
+        return chunks, clean
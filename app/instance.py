@@ -4,17 +4,44 @@ from app.function import LoxFunction
 
 
 
+# The field layout of instances: which slot of LoxInstance.values each
+# field name is in. Instances that got the same fields in the same order
+# share one Shape, and adding a field moves an instance to the next shape
+# along, which is made once and then found in transitions.
+class Shape:
+    __slots__ = ("slots", "transitions")
+
+    def __init__(self, slots: dict[str, int]):
+        self.slots = slots
+        self.transitions: dict[str, Shape] = {}
+
+    def withField(self, lex: str) -> "Shape":
+        shape = self.transitions.get(lex)
+        if shape is None:
+            slots = dict(self.slots)
+            slots[lex] = len(slots)
+            shape = self.transitions[lex] = Shape(slots)
+        return shape
+
+
+EMPTY_SHAPE = Shape({})
+
+
 class LoxInstance:
+    __slots__ = ("klass", "shape", "values")
+
     def __init__(self, klass):
         self.klass = klass
-        self.fields: dict[str, object] = {}
+        self.shape = EMPTY_SHAPE
+        self.values: list = []
 
     def __str__(self):
         return self.klass.name + " instance"
     
     def get(self, name: Token):
-        if name.lex in self.fields:
-            return self.fields[name.lex]
+        slot = self.shape.slots.get(name.lex)
+        if slot is not None:
+            return self.values[slot]
         
         method: LoxFunction = self.klass.findMethod(name.lex)
         if method is not None:
@@ -23,4 +50,9 @@ class LoxInstance:
         raise MyRuntimeError(name, "Undefined property '" + name.lex + "'.")
     
     def set(self, name: Token, val):
-        self.fields[name.lex] = val 
\ No newline at end of file
+        slot = self.shape.slots.get(name.lex)
+        if slot is not None:
+            self.values[slot] = val
+        else:
+            self.shape = self.shape.withField(name.lex)
+            self.values.append(val) 
\ No newline at end of file
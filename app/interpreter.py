@@ -1,15 +1,19 @@
+import operator
+
 from app.tokens import Token
 from app.tokens import TokenType
 
 from app.runtime import MyRuntimeError
 from app.expression import *
 from app.statement import *
-from app.environment import Environment
+from app.environment import Environment, GlobalEnvironment, LocalEnvironment
 from app.callable import LoxCallable
 from app.function import LoxFunction
-from app.ret import ReturnExcept
 from app.loxclass import LoxClass
 from app.instance import LoxInstance
+from app.natives import defineNatives
+from app.memo import Memo
+from app.rope import Rope, STRINGS, concat
 
 
 
@@ -17,22 +21,14 @@ from app.instance import LoxInstance
 class Interpreter(Expr.Visitor, Stmt.Visitor):
     def __init__(self, lox):
         self.lox = lox
-        self.globals = Environment()
+        self.globals = GlobalEnvironment()
         self.environment = self.globals 
-        self.locals: dict[Expr, int] = {}
-
-        class Clock(LoxCallable):
-            def arity(self) -> int:
-                return 0
-            
-            def call(self, interpreter, args):
-                import time
-                return time.time()
-            
-            def __str__(self) -> str:
-                return "<native fn>"
-            
-        self.globals.define("clock", Clock())
+        # functions wrapped in a Memo, by --memo or memo()
+        self.memos: list[Memo] = []
+        defineNatives(self.globals, lox, self.memos)
+        # nodes specialised on first evaluation, and later generalised
+        self.quickened = 0
+        self.deoptimized = 0
 
     # LEGACY CODE 
     # Needed to pass evaluate cmd test cases
@@ -50,11 +46,11 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
         except MyRuntimeError as e:
             self.lox.runtimeError(e) 
 
+    # Statements return None, or for a `return` a 1-tuple holding the
+    # value, which every enclosing statement hands straight back up until
+    # LoxFunction.call unpacks it (the same protocol ClosureCompiler uses)
     def execute(self, stmt: Stmt):
-        stmt.accept(self)
-
-    def resolve(self, expr: Expr, depth: int) -> None:
-        self.locals[expr] = depth 
+        return stmt.accept(self)
 
     def executeBlock(self, statements: list[Stmt], env: Environment):
         prev: Environment = self.environment
@@ -63,7 +59,9 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
             self.environment = env 
 
             for stmt in statements:
-                self.execute(stmt)
+                ret = stmt.accept(self)
+                if ret is not None:
+                    return ret
         
         finally: 
             self.environment = prev 
@@ -77,6 +75,8 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
             return "true" if s else "false"
         if s == None:
             return "nil"
+        if type(s) is Rope:
+            return str(s)
         return s
 
     def evaluate(self, expr: Expr): 
@@ -87,11 +87,19 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
 
     def visitUnaryExpr(self, expr: ExprUnary): 
         child = self.evaluate(expr.expr)
+        val = self.unary(expr.op, child)
 
         if expr.op.type == TokenType.BANG:
+            self.quicken(expr, ExprNot)
+        elif isinstance(child, float):
+            self.quicken(expr, ExprNegate)
+        return val
+
+    def unary(self, op: Token, child):
+        if op.type == TokenType.BANG:
             return not self.isTruthful(child)
-        elif expr.op.type == TokenType.MINUS:
-            self.checkNumberOperand(expr.op, child)
+        elif op.type == TokenType.MINUS:
+            self.checkNumberOperand(op, child)
             return -child
         
         print("unary evaluate failed")
@@ -102,40 +110,163 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
     def visitBinaryExpr(self, expr: ExprBinary): 
         left = self.evaluate(expr.left)
         right = self.evaluate(expr.right)
+        val = self.binary(expr.op, left, right)
+
+        t = expr.op.type
+        if t == TokenType.EQUAL_EQUAL:
+            self.quicken(expr, ExprEqual)
+        elif t == TokenType.BANG_EQUAL:
+            self.quicken(expr, ExprNotEqual)
+        elif isinstance(left, float) and isinstance(right, float):
+            self.quicken(expr, self.QUICK_NUMBERS[t])
+        elif isinstance(left, STRINGS) and isinstance(right, STRINGS):
+            self.quicken(expr, ExprAddStrings)
+        return val
 
-        t = expr.op.type 
+    def binary(self, op: Token, left, right):
+        t = op.type 
 
         if t == TokenType.GREATER:
-            self.checkNumberOperands(expr.op, left, right)
+            self.checkNumberOperands(op, left, right)
             return left > right 
         elif t == TokenType.GREATER_EQUAL:
-            self.checkNumberOperands(expr.op, left, right)
+            self.checkNumberOperands(op, left, right)
             return left >= right 
         elif t == TokenType.LESS:
-            self.checkNumberOperands(expr.op, left, right)
+            self.checkNumberOperands(op, left, right)
             return left < right 
         elif t == TokenType.LESS_EQUAL:
-            self.checkNumberOperands(expr.op, left, right)
+            self.checkNumberOperands(op, left, right)
             return left <= right 
         elif t == TokenType.BANG_EQUAL:
             return not left == right 
         elif t == TokenType.EQUAL_EQUAL:
             return left == right 
         elif t == TokenType.MINUS:
-            self.checkNumberOperands(expr.op, left, right)
+            self.checkNumberOperands(op, left, right)
             return left - right
         elif t == TokenType.PLUS:
-            self.checkPlusOperands(expr.op, left, right)
-            return left + right 
+            self.checkPlusOperands(op, left, right)
+            if type(left) is float:
+                return left + right
+            return concat(left, right)
         elif t == TokenType.SLASH:
-            self.checkNumberOperands(expr.op, left, right)
+            self.checkNumberOperands(op, left, right)
             return left / right 
         elif t == TokenType.STAR:
-            self.checkNumberOperands(expr.op, left, right)
+            self.checkNumberOperands(op, left, right)
             return left * right 
         
         print("binary evaluate failed")
 
+    # Quickened nodes. Each handles the types it was specialised for and
+    # deoptimizes, keeping the operands it already evaluated, otherwise.
+    QUICK_NUMBERS = {
+        TokenType.PLUS: ExprAddNumbers, TokenType.MINUS: ExprSubtract,
+        TokenType.STAR: ExprMultiply, TokenType.SLASH: ExprDivide,
+        TokenType.LESS: ExprLess, TokenType.LESS_EQUAL: ExprLessEqual,
+        TokenType.GREATER: ExprGreater, TokenType.GREATER_EQUAL: ExprGreaterEqual,
+    }
+
+    def quicken(self, expr: Expr, cls):
+        expr.__class__ = cls
+        self.quickened += 1
+
+    def deoptimizeBinary(self, expr: ExprBinary, left, right):
+        expr.__class__ = ExprBinaryGeneric
+        self.deoptimized += 1
+        return self.binary(expr.op, left, right)
+
+    def visitAddNumbersExpr(self, expr: ExprBinary):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if type(left) is float and type(right) is float:
+            return left + right
+        return self.deoptimizeBinary(expr, left, right)
+
+    def visitAddStringsExpr(self, expr: ExprBinary):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if type(left) is str and type(right) is str and len(left) + len(right) < Rope.CHUNK:
+            return left + right
+        if type(left) in STRINGS and type(right) in STRINGS:
+            return concat(left, right)
+        return self.deoptimizeBinary(expr, left, right)
+
+    def visitSubtractExpr(self, expr: ExprBinary):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if type(left) is float and type(right) is float:
+            return left - right
+        return self.deoptimizeBinary(expr, left, right)
+
+    def visitMultiplyExpr(self, expr: ExprBinary):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if type(left) is float and type(right) is float:
+            return left * right
+        return self.deoptimizeBinary(expr, left, right)
+
+    def visitDivideExpr(self, expr: ExprBinary):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if type(left) is float and type(right) is float:
+            return left / right
+        return self.deoptimizeBinary(expr, left, right)
+
+    def visitLessExpr(self, expr: ExprBinary):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if type(left) is float and type(right) is float:
+            return left < right
+        return self.deoptimizeBinary(expr, left, right)
+
+    def visitLessEqualExpr(self, expr: ExprBinary):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if type(left) is float and type(right) is float:
+            return left <= right
+        return self.deoptimizeBinary(expr, left, right)
+
+    def visitGreaterExpr(self, expr: ExprBinary):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if type(left) is float and type(right) is float:
+            return left > right
+        return self.deoptimizeBinary(expr, left, right)
+
+    def visitGreaterEqualExpr(self, expr: ExprBinary):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if type(left) is float and type(right) is float:
+            return left >= right
+        return self.deoptimizeBinary(expr, left, right)
+
+    # == and != work on any types, so they never deoptimize
+    def visitEqualExpr(self, expr: ExprBinary):
+        return expr.left.accept(self) == expr.right.accept(self)
+
+    def visitNotEqualExpr(self, expr: ExprBinary):
+        return not expr.left.accept(self) == expr.right.accept(self)
+
+    def visitBinaryGenericExpr(self, expr: ExprBinary):
+        return self.binary(expr.op, self.evaluate(expr.left), self.evaluate(expr.right))
+
+    def visitNegateExpr(self, expr: ExprUnary):
+        child = expr.expr.accept(self)
+        if type(child) is float:
+            return -child
+        expr.__class__ = ExprUnaryGeneric
+        self.deoptimized += 1
+        return self.unary(expr.op, child)
+
+    def visitNotExpr(self, expr: ExprUnary):
+        child = expr.expr.accept(self)
+        return child is None or child is False
+
+    def visitUnaryGenericExpr(self, expr: ExprUnary):
+        return self.unary(expr.op, self.evaluate(expr.expr))
+
     # New Expressions 
     def visitVariableExpr(self, expr: ExprVariable):
         return self.lookupVariable(expr.name, expr)
@@ -166,17 +297,19 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
     def checkPlusOperands(operator: Token, left, right):
         if isinstance(left, float) and isinstance(right, float):
             return
-        if isinstance(left, str) and isinstance(right, str):
+        if isinstance(left, STRINGS) and isinstance(right, STRINGS):
             return
         raise MyRuntimeError(operator, "Operands must be two numbers or two strings.")
 
 
     def lookupVariable(self, name: Token, expr: Expr):
-        dist = self.locals.get(expr)
-        if dist is not None:
-            return self.environment.getAt(dist, name.lex)
-        else:
-            return self.globals.get(name)
+        if expr.depth is not None:
+            return self.environment.getAt(expr.depth, expr.slot)
+
+        slot = expr.slot
+        if slot is None:
+            slot = expr.slot = self.globals.slotOf(name)
+        return self.globals.values[slot]
 
     # STATE
     # Methods of the Evaluator class, as it inherits from the Visitor suite 
@@ -184,7 +317,18 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
 
     # Exprs 
     def visitCallExpr(self, expr: ExprCall):
-        callee = self.evaluate(expr.callee)
+        # bound to a global function or class that is still there
+        if expr.cacheEpoch == self.globals.epoch:
+            return expr.cacheCallee.call(self, [self.evaluate(arg) for arg in expr.args])
+
+        if type(expr.callee) is ExprGet:
+            return self.invoke(expr, expr.callee)
+        if type(expr.callee) is ExprSuper:
+            obj, method = self.superMethod(expr.callee)
+            return self.runMethod(expr, method, obj)
+        return self.callValue(expr, self.evaluate(expr.callee))
+
+    def callValue(self, expr: ExprCall, callee):
         args = [self.evaluate(arg) for arg in expr.args]
 
         if not isinstance(callee, LoxCallable):
@@ -195,6 +339,12 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
             raise MyRuntimeError(expr.paren, \
                 f"Expected {callee.arity()} arguments but got {len(args)}.")
 
+        # the arity just checked can't change while the global is left alone
+        if type(expr.callee) is ExprVariable and expr.callee.depth is None \
+                and type(callee) in (LoxFunction, LoxClass, Memo):
+            expr.cacheCallee = callee
+            expr.cacheEpoch = self.globals.epoch
+
         return callee.call(self, args) 
     
     # def visitAssignExpr(self, expr):
@@ -205,11 +355,13 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
     def visitAssignExpr(self, expr):
         val = self.evaluate(expr.val)
 
-        dist: int = self.locals.get(expr)
-        if dist is not None:
-            self.environment.assignAt(dist, expr.name, val)
+        if expr.depth is not None:
+            self.environment.assignAt(expr.depth, expr.slot, val)
         else:
-            self.globals.assign(expr.name, val)
+            slot = expr.slot
+            if slot is None:
+                slot = expr.slot = self.globals.slotOf(expr.name)
+            self.globals.setSlot(slot, val)
 
         return val
 
@@ -228,12 +380,61 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
         # Only evaluate the right side IF there was reason to do so 
         return self.evaluate(expr.right) 
     
+    # obj.name(args): a method is run with obj straight in slot 0 of its
+    # frame, instead of binding it first and calling the bound copy
+    def invoke(self, expr: ExprCall, get: ExprGet):
+        obj = self.evaluate(get.obj)
+        if not isinstance(obj, LoxInstance):
+            raise MyRuntimeError(get.name, "Only instances have properties.")
+
+        slot = obj.shape.slots.get(get.name.lex)
+        if slot is not None:
+            return self.callValue(expr, obj.values[slot])
+        return self.runMethod(expr, self.findMethod(get, obj), obj)
+
+    def runMethod(self, expr: ExprCall, method: LoxFunction, obj: LoxInstance):
+        args = [obj]
+        for arg in expr.args:
+            args.append(self.evaluate(arg))
+
+        if len(args) - 1 != len(method.declaration.params):
+            raise MyRuntimeError(expr.paren, \
+                f"Expected {method.arity()} arguments but got {len(args) - 1}.")
+
+        env = LocalEnvironment(method.closure, args)
+        ret = self.executeBlock(method.declaration.body, env)
+        if method.isInit:
+            return obj
+        if ret is not None:
+            return ret[0]
+        return None
+
     def visitGetExpr(self, expr: ExprGet):
         obj = self.evaluate(expr.obj)
-        if isinstance(obj, LoxInstance):
-            return obj.get(expr.name)
-        
-        raise MyRuntimeError(expr.name, "Only instances have properties.")
+        if not isinstance(obj, LoxInstance):
+            raise MyRuntimeError(expr.name, "Only instances have properties.")
+
+        # LoxInstance.get, with the field's slot and the method lookup
+        # cached on the node
+        shape = obj.shape
+        if shape is expr.cacheShape:
+            return obj.values[expr.cacheSlot]
+
+        slot = shape.slots.get(expr.name.lex)
+        if slot is not None:
+            expr.cacheShape = shape
+            expr.cacheSlot = slot
+            return obj.values[slot]
+        return self.findMethod(expr, obj).bind(obj)
+
+    def findMethod(self, expr: ExprGet, obj: LoxInstance) -> LoxFunction:
+        klass = obj.klass
+        if klass is not expr.cacheClass:
+            expr.cacheClass = klass
+            expr.cacheMethod = klass.findMethod(expr.name.lex)
+        if expr.cacheMethod is None:
+            raise MyRuntimeError(expr.name, "Undefined property '" + expr.name.lex + "'.")
+        return expr.cacheMethod
     
     def visitSetExpr(self, expr: ExprSet):
         obj = self.evaluate(expr.obj)
@@ -241,25 +442,50 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
             raise MyRuntimeError(expr.name, "Only instances have fields.")
         
         val = self.evaluate(expr.val)
-        obj.set(expr.name, val)
+
+        # LoxInstance.set, with the slot or the shape change cached on the
+        # node; read the shape only now, as the value may have added fields
+        shape = obj.shape
+        if shape is expr.cacheShape:
+            obj.values[expr.cacheSlot] = val
+        elif shape is expr.cacheFrom:
+            obj.shape = expr.cacheTo
+            obj.values.append(val)
+        else:
+            slot = shape.slots.get(expr.name.lex)
+            if slot is not None:
+                expr.cacheShape = shape
+                expr.cacheSlot = slot
+                obj.values[slot] = val
+            else:
+                expr.cacheFrom = shape
+                expr.cacheTo = obj.shape = shape.withField(expr.name.lex)
+                obj.values.append(val)
         return val
     
     def visitThisExpr(self, expr: ExprThis):
         return self.lookupVariable(expr.keyword, expr)
     
     def visitSuperExpr(self, expr: ExprSuper):
-        dist = self.locals.get(expr)
-        superclass: LoxClass = self.environment.getAt(dist, "super")
+        obj, method = self.superMethod(expr)
+        return method.bind(obj)
 
-        obj: LoxInstance = self.environment.getAt(dist - 1, "this")
+    def superMethod(self, expr: ExprSuper):
+        # "this" is slot 0 of the method's frame, just inside "super"
+        env = self.environment.ancestor(expr.depth - 1)
+        obj: LoxInstance = env.values[0]
+        superclass: LoxClass = env.enclosing.values[expr.slot]
 
-        method: LoxFunction = superclass.findMethod(expr.method.lex)
+        if superclass is not expr.cacheClass:
+            expr.cacheClass = superclass
+            expr.cacheMethod = superclass.findMethod(expr.method.lex)
+        method: LoxFunction = expr.cacheMethod
 
         if method is None:
             raise MyRuntimeError(expr.method, \
                 "Undefined property '" + expr.method.lex + "'.")
         
-        return method.bind(obj) 
+        return obj, method
 
     # Stmts
     def visitReturnStmt(self, stmt: StmtReturn):
@@ -267,28 +493,139 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
         if stmt.value != None:
             val = self.evaluate(stmt.value)
         
-        raise ReturnExcept(val) 
+        return (val,)
+        # raise ReturnExcept(val)   # LEGACY
 
     def visitFunctionStmt(self, stmt) -> None:
         function: LoxFunction = LoxFunction(stmt, self.environment, False)
-        self.environment.define(stmt.name.lex, function)
+        if stmt.pure and self.lox.memo:
+            function = self.memoize(function)
+        self.declare(stmt, function)
         return None
+
+    def memoize(self, function: LoxCallable) -> Memo:
+        memo = Memo(function, self.lox.memoSize)
+        self.memos.append(memo)
+        return memo
+
+    # Define what a var, fun or class statement declares
+    def declare(self, stmt: Stmt, val) -> None:
+        if stmt.slot is None:
+            self.globals.define(stmt.name.lex, val)
+        else:
+            self.environment.defineAt(stmt.slot, val)
     
-    def visitIfStmt(self, stmt: StmtIf) -> None:
+    def visitIfStmt(self, stmt: StmtIf):
         if (self.isTruthful(self.evaluate(stmt.condition))):
-            self.execute(stmt.thenBranch)
+            return self.execute(stmt.thenBranch)
         elif stmt.elseBranch is not None:
-            self.execute(stmt.elseBranch)
+            return self.execute(stmt.elseBranch)
         return None
 
-    def visitBlockStmt(self, stmt: StmtBlock) -> None:
-        self.executeBlock(stmt.statements, Environment(self.environment))
+    def visitBlockStmt(self, stmt: StmtBlock):
+        if stmt.scoped:
+            return self.executeBlock(stmt.statements, LocalEnvironment(self.environment))
+
+        for s in stmt.statements:
+            ret = s.accept(self)
+            if ret is not None:
+                return ret
         return None
     
     def visitWhileStmt(self, stmt):
         while self.isTruthful(self.evaluate(stmt.condition)):
-            self.execute(stmt.body)
+            ret = self.execute(stmt.body)
+            if ret is not None:
+                return ret
         return None 
+
+    def visitForStmt(self, stmt: StmtFor):
+        if self.counts(stmt):
+            self.quicken(stmt, StmtCountedFor)
+            return self.visitCountedForStmt(stmt)
+
+        prev: Environment = self.environment
+        if stmt.scoped:
+            self.environment = LocalEnvironment(prev)
+        try:
+            if stmt.initializer is not None:
+                stmt.initializer.accept(self)
+
+            cond, inc, body = stmt.condition, stmt.increment, stmt.body
+            while cond is None or self.isTruthful(cond.accept(self)):
+                ret = body.accept(self)
+                if ret is not None:
+                    return ret
+                if inc is not None:
+                    inc.accept(self)
+            return None
+        finally:
+            self.environment = prev
+
+    COMPARE = {
+        TokenType.LESS: operator.lt, TokenType.LESS_EQUAL: operator.le,
+        TokenType.GREATER: operator.gt, TokenType.GREATER_EQUAL: operator.ge,
+    }
+
+    # Whether stmt is a counted loop (see StmtCountedFor), with a variable
+    # or a literal as the bound so reading it twice is harmless
+    @classmethod
+    def counts(cls, stmt: StmtFor) -> bool:
+        init, cond, inc = stmt.initializer, stmt.condition, stmt.increment
+        if type(init) is not StmtVariable or init.initializer is None:
+            return False
+
+        def counter(expr) -> bool:
+            return type(expr) is ExprVariable and expr.depth == 0 and expr.slot == init.slot
+
+        return isinstance(cond, ExprBinary) and cond.op.type in cls.COMPARE \
+            and counter(cond.left) and type(cond.right) in (ExprVariable, ExprLiteral) \
+            and type(inc) is ExprAssign and inc.depth == 0 and inc.slot == init.slot \
+            and isinstance(inc.val, ExprBinary) \
+            and inc.val.op.type in (TokenType.PLUS, TokenType.MINUS) \
+            and counter(inc.val.left) and type(inc.val.right) is ExprLiteral \
+            and type(inc.val.right.val) is float
+
+    # Compares and steps the counter itself while it and the bound are
+    # numbers; anything else goes through the condition and increment
+    # nodes, which raise the errors
+    def visitCountedForStmt(self, stmt: StmtFor):
+        prev: Environment = self.environment
+        if stmt.scoped:
+            self.environment = LocalEnvironment(prev)
+        try:
+            init = stmt.initializer
+            init.accept(self)
+
+            values = self.environment.values
+            slot = init.slot
+            cond, inc, body = stmt.condition, stmt.increment, stmt.body
+            compare = self.COMPARE[cond.op.type]
+            limit = cond.right
+            step = inc.val.right.val
+            if inc.val.op.type == TokenType.MINUS:
+                step = -step
+
+            while True:
+                i = values[slot]
+                bound = limit.accept(self)
+                if type(i) is float and type(bound) is float:
+                    if not compare(i, bound):
+                        return None
+                elif not self.isTruthful(cond.accept(self)):
+                    return None
+
+                ret = body.accept(self)
+                if ret is not None:
+                    return ret
+
+                i = values[slot]
+                if type(i) is float:
+                    values[slot] = i + step
+                else:
+                    inc.accept(self)
+        finally:
+            self.environment = prev
     
     def visitExpressionStmt(self, stmt: StmtExpression) -> None:
         self.evaluate(stmt.expression)
@@ -304,7 +641,7 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
         if stmt.initializer != None:
             val = self.evaluate(stmt.initializer)
 
-        self.environment.define(stmt.name.lex, val)
+        self.declare(stmt, val)
         return None 
     
     def visitClassStmt(self, stmt: StmtClass) -> None:
@@ -315,11 +652,10 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
                 raise MyRuntimeError(stmt.superclass.name, \
                     "Superclass must be a class.")
             
-        self.environment.define(stmt.name.lex, None)
         # clss: LoxClass = LoxClass(stmt.name.lex) # LEGACY 
 
         if stmt.superclass:
-            self.environment = Environment(self.environment)
+            self.environment = LocalEnvironment(self.environment)
             self.environment.define("super", superclass)
 
         methods: dict[str, LoxFunction] = {}
@@ -333,4 +669,7 @@ class Interpreter(Expr.Visitor, Stmt.Visitor):
         if superclass:
             self.environment = self.environment.enclosing
 
-        self.environment.assign(stmt.name, clss)
\ No newline at end of file
+        # Defined only now rather than as nil up front: nothing can read the
+        # name before the methods run, and a local scope has no way to
+        # assign by name.
+        self.declare(stmt, clss)
\ No newline at end of file
@@ -1,20 +1,50 @@
 import sys
 
 from app.tokens import Token, TokenType
-from app.tokenize import Tokenizer
+from app.scanner import Scanner
 from app.parser import Parser
 from app.runtime import MyRuntimeError
 from app.interpreter import Interpreter
 from app.statement import Stmt
 from app.resolver import Resolver
+from app.cache import ProgramCache
+from app.optimizer import Optimizer
+from app.astprinter import AstPrinter
+from app.closure import ClosureCompiler
+from app.compiler import Compiler
+from app.chunk import disassemble
+from app.vm import VM
+from app.transpiler import Transpiler
+from app.stackmachine import StackMachine
+from app.memo import Memo
 
 
 class Lox:
+    CHUNK_SIZE = 1 << 16
+
     def __init__(self):
         self.hadError = False
+        self.hadTokenError = False
         self.hadRuntimeError = False
+        # parse errors held back while the scanner is still running
+        self.parseErrors: list = None
         self.cmd = ""
         self.ignore_error = False
+        self.useCache = True
+        self.optLevel = Optimizer.DEFAULT_LEVEL
+        self.dumpAst = False
+        self.dumpPython = False
+        self.showStats = False
+        # "tree" walks the AST with Interpreter, "closure" compiles it to
+        # Python closures first, "vm" to bytecode for the VM, "python" to
+        # a Python module, "stack" walks it without recursing in Python
+        self.engine = "tree"
+        # deepest Lox call stack --engine=stack allows; None for its default
+        self.maxDepth = None
+        # cache the results of functions the resolver proved pure, in an
+        # LRU cache of memoSize entries each (tree, stack and closure engines)
+        self.memo = False
+        self.memoSize = Memo.SIZE
 
     def runPrompt(self):
         inp = ""
@@ -26,26 +56,36 @@ class Lox:
                     continue 
                 self.run(line)
                 self.hadError = False
+                self.hadTokenError = False
 
     def runFile(self, path: str, cmd: str = ""):
-        with open(path) as file:
-            file_contents = file.read()
-        self.run(file_contents, cmd)
+        cache = None
+        program = None
+        if cmd == "run" and self.useCache:
+            cache = ProgramCache(path, self.optLevel)
+            program = cache.load()
+
+        if program is not None:
+            self.execute(program)
+        else:
+            # the scanner pulls the file in chunks as the parser asks for tokens
+            with open(path) as file:
+                source = iter(lambda: file.read(self.CHUNK_SIZE), "")
+                if cache is not None:
+                    source = cache.hashing(source)
+                self.run(source, cmd, cache)
 
         if self.hadError:
             exit(65)
         if self.hadRuntimeError:
             exit(70)
 
-    def run(self, line: str, cmd: str = ""):
-        t = Tokenizer(self, line)
-        tokens: list[Token] = t.tokenize()
+    def run(self, source, cmd: str = "", cache: ProgramCache = None):
+        tokens = Scanner(self, source).scan()
 
         if cmd == "tokenize":
-            t.printTokens()
-            return
-        
-        if self.hadError:
+            for token in tokens:
+                print(token)
             return
 
         ignore_error_case = {"parse", "evaluate"}
@@ -53,10 +93,19 @@ class Lox:
         if cmd in ignore_error_case:
             self.ignore_error = True
         
-        p = Parser(self, tokens)
+        p = Parser(self, tokens,
+                   StackMachine.MAX_NESTING if self.engine == "stack" else None)
         i = Interpreter(self)
 
+        # The scanner runs as the parser pulls tokens, so a scan error can
+        # turn up after parse errors on earlier lines. Only the scan errors
+        # get reported then, so hold the parse errors until the end.
+        self.parseErrors = []
         statements: list[Stmt] = p.parse()
+        errors, self.parseErrors = self.parseErrors, None
+        if not self.hadTokenError:
+            for line, where, msg in errors:
+                self.report(line, where, msg)
 
         if cmd == "parse":
             if self.hadError:
@@ -66,6 +115,8 @@ class Lox:
             return
         
         if cmd == "evaluate":
+            if self.hadTokenError:
+                return
             try:
                 i.evaluate_LEGACY(statements[0])
             except MyRuntimeError as e:
@@ -78,12 +129,52 @@ class Lox:
 
         resolver = Resolver(i)        
         resolver.resolve(statements) 
+        resolver.resolvePurity()
 
         if self.hadError:
             return
 
+        statements = Optimizer(self.optLevel).optimize(statements)
+
+        if cmd == "disassemble":
+            function = Compiler(self).compile(statements)
+            if function is not None:
+                disassemble(function)
+            return
+
+        if cache is not None:
+            cache.store(statements)
+
+        self.execute(statements)
+
+    def execute(self, statements: list[Stmt]):
+        if self.dumpAst:
+            print(AstPrinter().print(statements))
+            return
+        if self.dumpPython:
+            print(Transpiler(self).source(statements))
+            return
+
+        if self.engine == "closure":
+            i = ClosureCompiler(self)
+        elif self.engine == "vm":
+            i = VM(self)
+        elif self.engine == "python":
+            i = Transpiler(self)
+        elif self.engine == "stack":
+            i = StackMachine(self, self.maxDepth)
+        else:
+            i = Interpreter(self)
         i.interpret(statements)
 
+        if self.showStats and isinstance(i, Interpreter):
+            print(f"[stats] quickened {i.quickened} nodes, deoptimized {i.deoptimized}",
+                  file=sys.stderr)
+        if self.showStats and isinstance(i, (Interpreter, ClosureCompiler)):
+            for memo in i.memos:
+                print(f"[stats] memo {memo}: {memo.hits} hits, {memo.misses} misses, "
+                      f"{memo.evictions} evictions", file=sys.stderr)
+
 
     '''
     LEGACY CODE
@@ -113,12 +204,17 @@ class Lox:
 
     def tokenError(self, line: int, msg: str):
         self.report(line, "", msg)
+        self.hadTokenError = True
 
     def parseError(self, token: Token, msg: str):
         if (token.type == TokenType.EOF):
-            self.report(token.line, " at end", msg)
+            where = " at end"
+        else:
+            where = f" at '{token.lex}'"
+        if self.parseErrors is not None:
+            self.parseErrors.append((token.line, where, msg))
         else:
-            self.report(token.line, f" at '{token.lex}'", msg)
+            self.report(token.line, where, msg)
 
     def runtimeError(self, err: MyRuntimeError):
         print(f"{err.msg}\n[line {err.token.line}]", file=sys.stderr)
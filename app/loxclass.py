@@ -7,6 +7,17 @@ class LoxClass(LoxCallable):
         self.name = name 
         self.superclass = superclass
         self.methods = methods 
+        # every method instances of this class have, inherited ones
+        # included, so finding one is a single lookup however deep the
+        # hierarchy goes
+        self.methodTable: dict[str, LoxFunction] = {}
+        if superclass:
+            self.methodTable.update(superclass.methodTable)
+        self.methodTable.update(methods)
+        # what a call to the class needs, looked up once here since the
+        # methods can't change
+        self.initializer = self.methodTable.get("init")
+        self.initArity = self.initializer.arity() if self.initializer else 0
 
     def __str__(self) -> str:
         return self.name 
@@ -14,21 +25,14 @@ class LoxClass(LoxCallable):
     def call(self, interpreter, args):
         instance = LoxInstance(self)
 
-        init: LoxFunction = self.findMethod("init")
-        if init is not None:
-            init.bind(instance).call(interpreter, args)
+        if self.initializer is not None:
+            self.initializer.callOn(interpreter, instance, args)
 
         return instance 
     
     def arity(self) -> int:
-        init: LoxFunction = self.findMethod("init")
-        if init is None:
-            return 0
-        return init.arity()
+        return self.initArity
     
     def findMethod(self, name: str):
-        if name in self.methods:
-            return self.methods[name]
-        
-        if self.superclass:
-            return self.superclass.findMethod(name)
\ No newline at end of file
+        return self.methodTable.get(name)
+
@@ -1,8 +1,29 @@
 from app.lox import Lox
+from app.batch import collect, runBatch
 
+import os
 import sys
 
 
+ENGINES = ("tree", "closure", "vm", "python", "stack")
+
+
+# A flag's value as a whole number of at least 1; a usage error otherwise
+def positive(flag: str, val: str) -> int:
+    try:
+        n = int(val)
+    except ValueError:
+        n = 0
+    if n < 1:
+        usage(f"{flag} takes a positive whole number, not '{val}'.")
+    return n
+
+
+def usage(msg: str):
+    print(f"Usage: {msg}", file=sys.stderr)
+    exit(64)
+
+
 def main():
     # print("Logs here", file=sys.stderr)
 
@@ -20,12 +41,74 @@ def main():
         lox.runPrompt() 
     else:
         cmd = sys.argv[1]
-        validCommands = ["tokenize", "parse", "evaluate", "run"]
+        validCommands = ["tokenize", "parse", "evaluate", "run", "disassemble"]
 
         if cmd not in validCommands:
             print(f"Unknown command: {cmd}", file=sys.stderr)
             exit(1)
-        lox.runFile(sys.argv[2], cmd)
+
+        args = sys.argv[2:]
+        # Lox attributes set from flags; batch workers get the same ones
+        options = {}
+        if "--no-cache" in args:
+            options["useCache"] = False
+            args.remove("--no-cache")
+        if "--dump-ast" in args:
+            options["dumpAst"] = True
+            args.remove("--dump-ast")
+        if "--stats" in args:
+            options["showStats"] = True
+            args.remove("--stats")
+        if "--dump-python" in args:
+            options["dumpPython"] = True
+            args.remove("--dump-python")
+        if "--vm" in args:
+            options["engine"] = "vm"
+            args.remove("--vm")
+        for arg in list(args):
+            if arg.startswith("--engine="):
+                engine = arg[len("--engine="):]
+                if engine not in ENGINES:
+                    usage(f"--engine is one of {', '.join(ENGINES)}, not '{engine}'.")
+                options["engine"] = engine
+                args.remove(arg)
+        for arg in list(args):
+            if arg.startswith("--max-depth="):
+                options["maxDepth"] = positive("--max-depth", arg[len("--max-depth="):])
+                args.remove(arg)
+        for arg in list(args):
+            if arg == "--memo" or arg.startswith("--memo="):
+                options["memo"] = True
+                if arg != "--memo":
+                    options["memoSize"] = positive("--memo", arg[len("--memo="):])
+                args.remove(arg)
+        for level in ("-O0", "-O1", "-O2"):
+            if level in args:
+                options["optLevel"] = int(level[2:])
+                args.remove(level)
+
+        jobs = None
+        for arg in list(args):
+            if arg.startswith("--jobs="):
+                jobs = positive("--jobs", arg[len("--jobs="):])
+                args.remove(arg)
+        if "--jobs" in args:
+            at = args.index("--jobs")
+            if at + 1 == len(args):
+                usage("--jobs takes a positive whole number.")
+            jobs = positive("--jobs", args[at + 1])
+            del args[at:at + 2]
+
+        if not args:
+            usage(f"./your_program.sh {cmd} <filename>")
+
+        if jobs is not None or len(args) > 1 or os.path.isdir(args[0]):
+            paths = collect(args)
+            exit(runBatch(paths, cmd, jobs or os.cpu_count() or 1, options))
+
+        for name, val in options.items():
+            setattr(lox, name, val)
+        lox.runFile(args[0], cmd)
 
 
 
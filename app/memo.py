@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+from app.callable import LoxCallable
+from app.rope import Rope
+
+
+# A function whose results are cached per argument tuple, the least
+# recently used entry going once the cache is full. Only calls whose
+# arguments are all numbers, strings, booleans or nil are cached: an
+# instance or function can change between calls while it stays the same
+# key. Wrapping is only sound for a function whose result depends on
+# nothing but its arguments; --memo wraps just the ones the resolver
+# proved pure, memo(fn) whatever it's given.
+class Memo(LoxCallable):
+    SIZE = 4096
+    KEYS = (float, str, Rope, bool, type(None))
+
+    def __init__(self, function: LoxCallable, size: int = SIZE):
+        self.function = function
+        self.size = size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def arity(self) -> int:
+        return self.function.arity()
+
+    def call(self, interpreter, args):
+        key = self.key(args)
+        if key is None:
+            return self.function.call(interpreter, args)
+        if key in self.cache:
+            return self.hit(key)
+        return self.store(key, self.function.call(interpreter, args))
+
+    # The cache entry args go in, or None if they can't be cached
+    def key(self, args: list):
+        for arg in args:
+            if type(arg) not in self.KEYS:
+                return None
+        # the types go in too, or true and 1 would share an entry
+        return (tuple(args), tuple(map(type, args)))
+
+    def hit(self, key):
+        self.hits += 1
+        self.cache.move_to_end(key)
+        return self.cache[key]
+
+    def store(self, key, val):
+        self.misses += 1
+        self.cache[key] = val
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return val
+
+    def __str__(self) -> str:
+        return str(self.function)
+
+
+# memo(fn): fn wrapped in a Memo, put on memos for --stats. An engine whose
+# functions aren't LoxCallables (the VM, transpiled code) gets its own back.
+class MemoNative(LoxCallable):
+    def __init__(self, memos: list, size: int = Memo.SIZE):
+        self.memos = memos
+        self.size = size
+
+    def arity(self) -> int:
+        return 1
+
+    def call(self, interpreter, args):
+        function = args[0]
+        if not isinstance(function, LoxCallable):
+            return function
+        memo = Memo(function, self.size)
+        self.memos.append(memo)
+        return memo
+
+    def __str__(self) -> str:
+        return "<native fn>"
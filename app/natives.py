@@ -0,0 +1,23 @@
+import time
+
+from app.callable import LoxCallable
+from app.memo import MemoNative
+
+
+class Clock(LoxCallable):
+    def arity(self) -> int:
+        return 0
+
+    def call(self, interpreter, args):
+        return time.time()
+
+    def __str__(self) -> str:
+        return "<native fn>"
+
+
+# Built-in functions every engine puts in its globals; memo() only under
+# --memo. What it wraps goes on memos, when the engine wants them for --stats.
+def defineNatives(env, lox, memos: list = None) -> None:
+    env.define("clock", Clock())
+    if lox.memo:
+        env.define("memo", MemoNative([] if memos is None else memos, lox.memoSize))
@@ -0,0 +1,254 @@
+from app.tokens import TokenType
+from app.expression import *
+from app.statement import *
+from app.interpreter import Interpreter
+
+
+# Runs between Resolver.resolve and Interpreter.interpret and rewrites the
+# tree in place. Only nodes built from literals are replaced, so the
+# depths and slots the resolver stored on variable nodes stay valid.
+#
+#   -O0  nothing
+#   -O1  fold constant Binary/Unary/Logical nodes, drop Grouping nodes
+#   -O2  also prune if/while statements whose condition is constant
+#
+# Anything that would raise at runtime ("a" - 1, -nil, 1 / 0) is left as
+# it is, so the error still happens when and where it used to.
+class Optimizer(Expr.Visitor, Stmt.Visitor):
+    DEFAULT_LEVEL = 1
+
+    def __init__(self, level: int = DEFAULT_LEVEL):
+        self.level = level
+        self.folded = 0
+        self.pruned = 0
+
+    def optimize(self, statements: list[Stmt]) -> list[Stmt]:
+        if self.level <= 0:
+            return statements
+        return self.block(statements)
+
+    def block(self, statements: list[Stmt]) -> list[Stmt]:
+        out = []
+        for stmt in statements:
+            stmt = stmt.accept(self)
+            if stmt is not None:
+                out.append(stmt)
+        return out
+
+    # A statement in a position that needs one (an if or while body)
+    def branch(self, stmt: Stmt) -> Stmt:
+        stmt = stmt.accept(self)
+        return stmt if stmt is not None else StmtBlock([])
+
+    # Expression visits are generators that yield a child to have it
+    # optimized and get the result sent back. This drives them with a stack
+    # of its own, so nesting depth isn't bounded by Python's.
+    def expr(self, expr: Expr) -> Expr:
+        stack = [expr.accept(self)]
+        val = None
+        while True:
+            try:
+                child = stack[-1].send(val)
+            except StopIteration as done:
+                stack.pop()
+                val = done.value
+                if not stack:
+                    return val
+                continue
+            stack.append(child.accept(self))
+            val = None
+
+    @staticmethod
+    def constant(expr: Expr) -> bool:
+        return isinstance(expr, ExprLiteral)
+
+    def literal(self, val) -> ExprLiteral:
+        self.folded += 1
+        return ExprLiteral(val)
+
+
+    # Exprs
+    def visitLiteralExpr(self, expr: ExprLiteral):
+        return expr
+        yield
+
+    def visitGroupingExpr(self, expr: ExprGrouping):
+        return (yield expr.expr)
+
+    def visitUnaryExpr(self, expr: ExprUnary):
+        expr.expr = yield expr.expr
+        if not self.constant(expr.expr):
+            return expr
+
+        val = expr.expr.val
+        if expr.op.type == TokenType.BANG:
+            return self.literal(not Interpreter.isTruthful(val))
+        if expr.op.type == TokenType.MINUS and isinstance(val, float):
+            return self.literal(-val)
+        return expr
+
+    def visitBinaryExpr(self, expr: ExprBinary):
+        expr.left = yield expr.left
+        expr.right = yield expr.right
+        if not (self.constant(expr.left) and self.constant(expr.right)):
+            return expr
+
+        left, right = expr.left.val, expr.right.val
+        t = expr.op.type
+        numbers = isinstance(left, float) and isinstance(right, float)
+
+        if t == TokenType.EQUAL_EQUAL:
+            return self.literal(left == right)
+        if t == TokenType.BANG_EQUAL:
+            return self.literal(not left == right)
+        if t == TokenType.PLUS and isinstance(left, str) and isinstance(right, str):
+            return self.literal(left + right)
+        if not numbers:
+            return expr
+
+        if t == TokenType.GREATER:
+            return self.literal(left > right)
+        if t == TokenType.GREATER_EQUAL:
+            return self.literal(left >= right)
+        if t == TokenType.LESS:
+            return self.literal(left < right)
+        if t == TokenType.LESS_EQUAL:
+            return self.literal(left <= right)
+        if t == TokenType.MINUS:
+            return self.literal(left - right)
+        if t == TokenType.PLUS:
+            return self.literal(left + right)
+        if t == TokenType.STAR:
+            return self.literal(left * right)
+        if t == TokenType.SLASH and right != 0:
+            return self.literal(left / right)
+        return expr
+
+    def visitLogicalExpr(self, expr: ExprLogical):
+        expr.left = yield expr.left
+        expr.right = yield expr.right
+        if not self.constant(expr.left):
+            return expr
+
+        # the result is either the left value itself or whatever the right
+        # side evaluates to
+        truthy = Interpreter.isTruthful(expr.left.val)
+        self.folded += 1
+        if truthy == (expr.op.type == TokenType.OR):
+            return expr.left
+        return expr.right
+
+    def visitVariableExpr(self, expr: ExprVariable):
+        return expr
+        yield
+
+    def visitAssignExpr(self, expr: ExprAssign):
+        expr.val = yield expr.val
+        return expr
+
+    def visitCallExpr(self, expr: ExprCall):
+        expr.callee = yield expr.callee
+        args = []
+        for arg in expr.args:
+            args.append((yield arg))
+        expr.args = args
+        return expr
+
+    def visitGetExpr(self, expr: ExprGet):
+        expr.obj = yield expr.obj
+        return expr
+
+    def visitSetExpr(self, expr: ExprSet):
+        expr.obj = yield expr.obj
+        expr.val = yield expr.val
+        return expr
+
+    def visitThisExpr(self, expr: ExprThis):
+        return expr
+        yield
+
+    def visitSuperExpr(self, expr: ExprSuper):
+        return expr
+        yield
+
+
+    # Stmts
+    def visitExpressionStmt(self, stmt: StmtExpression):
+        stmt.expression = self.expr(stmt.expression)
+        return stmt
+
+    def visitPrintStmt(self, stmt: StmtPrint):
+        stmt.expression = self.expr(stmt.expression)
+        return stmt
+
+    def visitVarStmt(self, stmt: StmtVariable):
+        if stmt.initializer is not None:
+            stmt.initializer = self.expr(stmt.initializer)
+        return stmt
+
+    def visitBlockStmt(self, stmt: StmtBlock):
+        stmt.statements = self.block(stmt.statements)
+        return stmt
+
+    def visitIfStmt(self, stmt: StmtIf):
+        stmt.condition = self.expr(stmt.condition)
+        if self.level >= 2 and self.constant(stmt.condition):
+            # branches are statements, never declarations, so lifting one
+            # out of the if doesn't change what scope anything lands in
+            self.pruned += 1
+            if Interpreter.isTruthful(stmt.condition.val):
+                return stmt.thenBranch.accept(self)
+            if stmt.elseBranch is not None:
+                return stmt.elseBranch.accept(self)
+            return None
+
+        stmt.thenBranch = self.branch(stmt.thenBranch)
+        if stmt.elseBranch is not None:
+            stmt.elseBranch = self.branch(stmt.elseBranch)
+        return stmt
+
+    def visitWhileStmt(self, stmt: StmtWhile):
+        stmt.condition = self.expr(stmt.condition)
+        if self.level >= 2 and self.constant(stmt.condition) and \
+                not Interpreter.isTruthful(stmt.condition.val):
+            self.pruned += 1
+            return None
+
+        stmt.body = self.branch(stmt.body)
+        return stmt
+
+    def visitForStmt(self, stmt: StmtFor):
+        if stmt.initializer is not None:
+            stmt.initializer = stmt.initializer.accept(self)
+        if stmt.condition is not None:
+            stmt.condition = self.expr(stmt.condition)
+        if stmt.increment is not None:
+            stmt.increment = self.expr(stmt.increment)
+
+        if self.level >= 2 and stmt.condition is not None and \
+                self.constant(stmt.condition) and \
+                not Interpreter.isTruthful(stmt.condition.val):
+            self.pruned += 1
+            if stmt.initializer is None:
+                return None
+            # the initializer still runs, in the scope the loop gave it
+            block = StmtBlock([stmt.initializer])
+            block.scoped = stmt.scoped
+            return block
+
+        stmt.body = self.branch(stmt.body)
+        return stmt
+
+    def visitFunctionStmt(self, stmt: StmtFunction):
+        stmt.body = self.block(stmt.body)
+        return stmt
+
+    def visitReturnStmt(self, stmt: StmtReturn):
+        if stmt.value is not None:
+            stmt.value = self.expr(stmt.value)
+        return stmt
+
+    def visitClassStmt(self, stmt: StmtClass):
+        for method in stmt.methods:
+            self.visitFunctionStmt(method)
+        return stmt
@@ -10,29 +10,40 @@ class Parser:
             self.token = token
             self.msg = msg
 
+    class NestingError(Exception):
+        def __init__(self, token):
+            self.token = token
+
     # Parser init 
-    def __init__(self, lox, tokens: list[Token]):
+    # tokens can be any iterable, e.g. a lazy Scanner.scan(). The grammar
+    # only ever needs the current and the previous token. Blocks and
+    # statement bodies nested deeper than maxNesting, if given, are an error.
+    def __init__(self, lox, tokens, maxNesting: int = None):
         self._lox = lox
-        self._tokens = tokens
+        self._tokens = iter(tokens)
         self.head = None 
         self._pos = 0
+        self._prev: Token = None
+        self._cur: Token = next(self._tokens)
+        self.maxNesting = maxNesting
+        self.nesting = 0
 
     # functions from the book 
     def atEnd(self) -> bool:
-        if self._pos >= len(self._tokens) - 1:
-            return True
-        return False 
+        return self._cur.type == TokenType.EOF
 
     def prev(self) -> Token:
-        return self._tokens[self._pos - 1]
+        return self._prev
 
     def advance(self) -> Token:
         if not self.atEnd():
+            self._prev = self._cur
+            self._cur = next(self._tokens)
             self._pos += 1
         return self.prev()
     
     def peek(self) -> Token: 
-        return self._tokens[self._pos] 
+        return self._cur
 
     def check(self, t: TokenType) -> bool:
         if self.atEnd():
@@ -84,159 +95,169 @@ class Parser:
 
 
     # The Grammar 
-    def expression(self) -> Expr:
-        return self.assignment()
-        # return self.equality()    # LEGACY
+    # Expressions are parsed by precedence climbing over two explicit
+    # stacks instead of one method per precedence level. Nesting depth
+    # costs list entries, not Python frames.
+
+    # binary operator -> (precedence, node class); all left-associative
+    BINARY = {
+        TokenType.OR: (1, ExprLogical),
+        TokenType.AND: (2, ExprLogical),
+        TokenType.BANG_EQUAL: (3, ExprBinary),
+        TokenType.EQUAL_EQUAL: (3, ExprBinary),
+        TokenType.GREATER: (4, ExprBinary),
+        TokenType.GREATER_EQUAL: (4, ExprBinary),
+        TokenType.LESS: (4, ExprBinary),
+        TokenType.LESS_EQUAL: (4, ExprBinary),
+        TokenType.MINUS: (5, ExprBinary),
+        TokenType.PLUS: (5, ExprBinary),
+        TokenType.SLASH: (6, ExprBinary),
+        TokenType.STAR: (6, ExprBinary),
+    }
+    UNARY_PREC = 7
+
+    # kinds of operator stack entries
+    _GROUP, _CALL, _ASSIGN, _BINARY, _UNARY = range(5)
 
-    def assignment(self):
-        expr: Expr = self.orOp()
+    def expression(self) -> Expr:
+        ops: list[tuple] = []
+        vals: list[Expr] = []
+        binary = self.BINARY
+        advance = self.advance
 
-        if self.match(TokenType.EQUAL):
-            equals: Token = self.prev()
-            val: Expr = self.assignment()
+        while True:
+            # operand position: prefix operators and opening parens
+            t = self._cur.type
+            while t == TokenType.BANG or t == TokenType.MINUS or \
+                    t == TokenType.LEFT_PAREN:
+                if t == TokenType.LEFT_PAREN:
+                    ops.append((self._GROUP, advance()))
+                else:
+                    ops.append((self._UNARY, self.UNARY_PREC, advance()))
+                t = self._cur.type
+            vals.append(self.primary())
+
+            # operator position
+            while True:
+                t = self._cur.type
+                if t == TokenType.LEFT_PAREN:
+                    advance()
+                    if self._cur.type == TokenType.RIGHT_PAREN:
+                        vals.append(ExprCall(vals.pop(), advance(), []))
+                        continue
+                    ops.append((self._CALL, vals.pop(), []))
+                    break
+
+                if t == TokenType.DOT:
+                    advance()
+                    name: Token = self.consume(TokenType.IDENTIFIER, \
+                                            "Expect property name after '.'.")
+                    vals.append(ExprGet(vals.pop(), name))
+                    continue
+
+                if t in binary:
+                    prec = binary[t][0]
+                    while ops and ops[-1][0] >= self._BINARY and \
+                            ops[-1][1] >= prec:
+                        self.reduce(ops, vals)
+                    ops.append((self._BINARY, prec, advance()))
+                    break
+
+                if t == TokenType.EQUAL:
+                    # right-associative and below everything else
+                    while ops and ops[-1][0] >= self._BINARY:
+                        self.reduce(ops, vals)
+                    ops.append((self._ASSIGN, advance()))
+                    break
+
+                self.reduceAll(ops, vals)
+                if not ops:
+                    return vals.pop()
+
+                kind = ops[-1][0]
+                if t == TokenType.COMMA and kind == self._CALL:
+                    args: list[Expr] = ops[-1][2]
+                    args.append(vals.pop())
+                    advance()
+                    if len(args) >= 255:
+                        self.error(self.peek(), \
+                                "Can't have more than 255 arguments.")
+                    break
+
+                if kind == self._GROUP:
+                    self.consume(TokenType.RIGHT_PAREN, \
+                                 "Expect ')' after expression.")
+                    ops.pop()
+                    vals.append(ExprGrouping(vals.pop()))
+                else:
+                    paren: Token = self.consume(TokenType.RIGHT_PAREN, \
+                                                "Expect ')' after arguments.")
+                    _, callee, args = ops.pop()
+                    args.append(vals.pop())
+                    vals.append(ExprCall(callee, paren, args))
+
+    # Apply the operator on top of the stack to the operands it needs.
+    def reduce(self, ops: list[tuple], vals: list[Expr]) -> None:
+        entry = ops.pop()
+        kind = entry[0]
+
+        if kind == self._UNARY:
+            vals.append(ExprUnary(entry[2], vals.pop()))
+        elif kind == self._BINARY:
+            op: Token = entry[2]
+            right: Expr = vals.pop()
+            left: Expr = vals.pop()
+            if self.BINARY[op.type][1] is ExprLogical:
+                vals.append(ExprLogical(left, op, right))
+            else:
+                vals.append(ExprBinary(op, left, right))
+        else:
+            equals: Token = entry[1]
+            val: Expr = vals.pop()
+            expr: Expr = vals.pop()
 
             if isinstance(expr, ExprVariable):
-                name: Token = expr.name
-                return ExprAssign(name, val)
+                vals.append(ExprAssign(expr.name, val))
             elif isinstance(expr, ExprGet):
-                get: ExprGet = expr 
-                return ExprSet(get.obj, get.name, val)
-            
-            self.error(equals, "Invalid assignment target.")
-            
-        return expr 
-    
-    def orOp(self) -> Expr:
-        expr: Expr = self.andOp()
-
-        while self.match(TokenType.OR):
-            op: Token = self.prev()
-            right: Expr = self.andOp()
-            expr = ExprLogical(expr, op, right)
-        return expr 
-    
-    def andOp(self) -> Expr:
-        expr: Expr = self.equality()
-
-        while self.match(TokenType.AND):
-            op: Token = self.prev()
-            right: Expr = self.equality()
-            expr = ExprLogical(expr, op, right)
-        return expr     
-
-    def equality(self) -> Expr:
-        expr = self.comparison()
-
-        # match !=, ==
-        while (self.match(TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL)):
-            op: Token = self.prev()
-            right: Expr = self.comparison()
-            expr = ExprBinary(op, expr, right)
-
-        return expr
-
-    def comparison(self) -> Expr:
-        expr: Expr = self.term() 
-
-        # match >, >=, <, <=
-        while (self.match(TokenType.GREATER, TokenType.GREATER_EQUAL, \
-                          TokenType.LESS, TokenType.LESS_EQUAL)):
-            op: Token = self.prev()
-            right: Expr = self.term()
-            expr = ExprBinary(op, expr, right)
-        
-        return expr 
-
-    def term(self) -> Expr:
-        expr: Expr = self.factor()
-
-        # match +, -
-        while (self.match(TokenType.MINUS, TokenType.PLUS)):
-            op: Token = self.prev()
-            right: Expr = self.factor()
-            expr = ExprBinary(op, expr, right)
+                vals.append(ExprSet(expr.obj, expr.name, val))
+            else:
+                self.error(equals, "Invalid assignment target.")
+                vals.append(expr)
 
-        return expr
+    # Reduce down to the innermost open paren, if any.
+    def reduceAll(self, ops: list[tuple], vals: list[Expr]) -> None:
+        while ops and ops[-1][0] >= self._ASSIGN:
+            self.reduce(ops, vals)
 
-    def factor(self) -> Expr:
-        expr: Expr = self.unary()
+    def primary(self) -> Expr:
+        t = self._cur.type
 
-        # match /, *
-        while (self.match(TokenType.SLASH, TokenType.STAR)):
-            op: Token = self.prev()
-            right: Expr = self.unary()
-            expr = ExprBinary(op, expr, right)
+        if t == TokenType.IDENTIFIER:
+            return ExprVariable(self.advance())
 
-        return expr 
+        if t == TokenType.NUMBER or t == TokenType.STRING:
+            return ExprLiteral(self.advance().lit)
 
-    def unary(self) -> Expr:
-        # match !, -
-        if self.match(TokenType.BANG, TokenType.MINUS):
-            op: Token = self.prev()
-            right: Expr = self.unary()
-            return ExprUnary(op, right)
-        
-        return self.call()
-    
-    def call(self) -> Expr:
-        expr: Expr = self.primary()
-
-        while True:
-            if self.match(TokenType.LEFT_PAREN):
-                expr = self.finishCall(expr)
-            elif self.match(TokenType.DOT):
-                name: Token = self.consume(TokenType.IDENTIFIER, \
-                                            "Expect property name after '.'.")
-                expr = ExprGet(expr, name)
-            else:
-                break
-
-        return expr
-    
-    def finishCall(self, callee: Expr) -> Expr:
-        args: list[Expr] = []
-        if not self.check(TokenType.RIGHT_PAREN):
-            args.append(self.expression())
-            while self.match(TokenType.COMMA):
-                if len(args) >= 255:
-                    self.error(self.peek(), \
-                            "Can't have more than 255 arguments.")
-                args.append(self.expression())
-        
-        paren: Token = self.consume(TokenType.RIGHT_PAREN, \
-                                    "Expect ')' after arguments.")
-        return ExprCall(callee, paren, args)
-
-    def primary(self) -> Expr:
-        if self.match(TokenType.FALSE):
+        if t == TokenType.FALSE:
+            self.advance()
             return ExprLiteral(False)
-        if self.match(TokenType.TRUE):
+        if t == TokenType.TRUE:
+            self.advance()
             return ExprLiteral(True)
-        if self.match(TokenType.NIL):
+        if t == TokenType.NIL:
+            self.advance()
             return ExprLiteral(None)
         
-        if self.match(TokenType.NUMBER, TokenType.STRING):
-            return ExprLiteral(self.prev().lit)
-        
-        if self.match(TokenType.SUPER):
-            keyword: Token = self.prev()
+        if t == TokenType.SUPER:
+            keyword: Token = self.advance()
             self.consume(TokenType.DOT, "Expect '.' after 'super'.")
             method: Token = self.consume(TokenType.IDENTIFIER, \
                                          "Expect superclass method name.")
             return ExprSuper(keyword, method)
         
-        if self.match(TokenType.THIS):
-            return ExprThis(self.prev())
+        if t == TokenType.THIS:
+            return ExprThis(self.advance())
 
-        if self.match(TokenType.IDENTIFIER):
-            return ExprVariable(self.prev())
-        
-        # match ( expr )
-        if self.match(TokenType.LEFT_PAREN):
-            expr: Expr = self.expression()
-            self.consume(TokenType.RIGHT_PAREN, "Expect ')' after expression.")
-            return ExprGrouping(expr)
-        
         # if expr falls thru, raise error
         raise self.error(self.peek(), "Expected expression.")
 
@@ -255,9 +276,14 @@ class Parser:
 # INTRODUCTION OF STATEMENTS
     def parse(self): 
         statements: list[Stmt] = []
-        while not self.atEnd():
-            # print("Parsing loop...")    # DEBUG
-            statements.append(self.declaration())
+        try:
+            while not self.atEnd():
+                # print("Parsing loop...")    # DEBUG
+                statements.append(self.declaration())
+        except (self.NestingError, RecursionError):
+            # statements nest by recursion, so past maxNesting or Python's
+            # own limit give up on the rest of the source
+            self.error(self.peek(), "Too much nesting.")
         return statements
     
     def declaration(self):
@@ -356,30 +382,25 @@ class Parser:
         
         self.consume(TokenType.RIGHT_PAREN, "Expect ')' after for clauses.")
 
-        body: Stmt = self.statement()
-
-        if inc is not None: 
-            body = StmtBlock([body, StmtExpression(inc)])
-        
-        if cond is None:
-            cond = ExprLiteral(True)
-        
-        body = StmtWhile(cond, body) 
-
-        if initializer is not None: 
-            body = StmtBlock([initializer, body])
+        body: Stmt = self.body()
 
-        return body
+        # LEGACY: desugared to
+        #   StmtBlock([initializer, StmtWhile(cond, StmtBlock([body, inc]))])
+        return StmtFor(initializer, cond, inc, body)
 
     def ifStatement(self) -> Stmt:
         self.consume(TokenType.LEFT_PAREN, "Expect '(' after 'if'.")
         cond: Expr = self.expression()
         self.consume(TokenType.RIGHT_PAREN, "Expect ')' after if condition.")
 
-        thenBranch: Stmt = self.statement()
+        thenBranch: Stmt = self.body()
         elseBranch = None
         if self.match(TokenType.ELSE):
-            elseBranch = self.statement()
+            # an else-if chain is one level, however many arms it has
+            if self.check(TokenType.IF):
+                elseBranch = self.statement()
+            else:
+                elseBranch = self.body()
         
         return StmtIf(cond, thenBranch, elseBranch)
         
@@ -392,7 +413,7 @@ class Parser:
         self.consume(TokenType.LEFT_PAREN, "Expect '(' after 'while'.")
         cond: Expr = self.expression()
         self.consume(TokenType.RIGHT_PAREN, "Expect ')' after condition.")
-        body: Stmt = self.statement()
+        body: Stmt = self.body()
 
         return StmtWhile(cond, body)
 
@@ -401,12 +422,33 @@ class Parser:
         self.consume(TokenType.SEMICOLON, "Expect ';' after expression.")
         return StmtExpression(expr)
 
+    # The statement an if, while or for runs, one level further in. A block
+    # counts itself.
+    def body(self) -> Stmt:
+        if self.check(TokenType.LEFT_BRACE):
+            return self.statement()
+        self.nest()
+        try:
+            return self.statement()
+        finally:
+            self.nesting -= 1
+
+    def nest(self) -> None:
+        self.nesting += 1
+        if self.maxNesting is not None and self.nesting > self.maxNesting:
+            self.nesting -= 1
+            raise self.NestingError(self.peek())
+
     def block(self):
         statements: list[Stmt] = []
 
-        while not self.check(TokenType.RIGHT_BRACE) and \
-                not self.atEnd():
-            statements.append(self.declaration())
+        self.nest()
+        try:
+            while not self.check(TokenType.RIGHT_BRACE) and \
+                    not self.atEnd():
+                statements.append(self.declaration())
+        finally:
+            self.nesting -= 1
 
         self.consume(TokenType.RIGHT_BRACE, "Expect '}' after block.")
         return statements
@@ -20,13 +20,39 @@ class Resolver(Expr.Visitor, Stmt.Visitor):
         CLASS = 1,
         SUBCLASS = 2
 
+    # What the purity analysis knows of a function: whether its body does
+    # anything but compute from its own locals, and the globals it calls
+    class Purity:
+        __slots__ = ("function", "base", "pure", "callees")
+
+        def __init__(self, function: StmtFunction, base: int, pure: bool):
+            self.function = function
+            # scopes from this index on are the function's own
+            self.base = base
+            self.pure = pure
+            self.callees: set[str] = set()
+
     currentClass: ClassType = ClassType.NONE
 
     def __init__(self, interpreter):
         self.interpreter: Interpreter = interpreter 
         self.scopes: list[dict[str, bool]] = []
+        # parallel to scopes: the slot each name was given in its scope,
+        # the next free slot, and how many environments are open at runtime
+        # once the scope is (a block that doesn't get its own environment
+        # shares its enclosing one's)
+        self.slots: list[dict[str, int]] = []
+        self.nextSlot: list[int] = []
+        self.envs: list[int] = []
         self.currentFunction = self.FunctionType.NONE
         self.currentClass: self.ClassType = self.ClassType.NONE
+        # purity analysis: the functions being resolved, innermost last,
+        # all the plain ones seen, and what the program does with globals
+        self.functions: list[Resolver.Purity] = []
+        self.seen: list[Resolver.Purity] = []
+        self.globalFunctions: dict[str, StmtFunction] = {}
+        self.declaredGlobals: dict[str, int] = {}
+        self.assignedGlobals: set[str] = set()
 
     def peek(self) -> dict[str, bool]:
         return self.scopes[-1]
@@ -38,9 +64,13 @@ class Resolver(Expr.Visitor, Stmt.Visitor):
                 if not isinstance(stmt, Stmt):
                     print("Resolver@resolve: inp is not list[Stmt]")
                 self.resolve(stmt)
-        elif isinstance(inp, Stmt):
-            inp.accept(self)
         elif isinstance(inp, Expr):
+            # children go on this stack, first child last, so that however
+            # deeply an expression nests it costs no Python recursion
+            stack = [inp]
+            while stack:
+                stack.extend(reversed(stack.pop().accept(self)))
+        elif isinstance(inp, Stmt):
             inp.accept(self)
     
     '''
@@ -58,95 +88,203 @@ class Resolver(Expr.Visitor, Stmt.Visitor):
             expr.accept(self)
     '''
 
-    def beginScope(self) -> None:
+    # A scope that isn't scoped numbers its slots on from where its
+    # enclosing one is; they are free again when it ends
+    def beginScope(self, scoped: bool = True) -> None:
         self.scopes.append({}) 
+        self.slots.append({})
+        if scoped:
+            self.nextSlot.append(0)
+            self.envs.append(self.envs[-1] + 1 if self.envs else 1)
+        else:
+            self.nextSlot.append(self.nextSlot[-1])
+            self.envs.append(self.envs[-1])
 
     def endScope(self) -> None:
         self.scopes.pop()
+        self.slots.pop()
+        self.nextSlot.pop()
+        self.envs.pop()
 
-    def declare(self, name: Token) -> None:
+    # The slot name gets; None for a global
+    def declare(self, name: Token) -> int:
         if not self.scopes: # if scopes is empty 
-            return 
+            self.declaredGlobals[name.lex] = self.declaredGlobals.get(name.lex, 0) + 1
+            return None
         
         scope: dict[str, bool] = self.peek()
 
         if name.lex in scope:
             self.interpreter.lox.parseError(name, "Already a variable with this name in this scope.")
+            return self.slots[-1][name.lex]
 
         scope[name.lex] = False 
+        return self.claimSlot(name.lex)
+
+    def claimSlot(self, lex: str) -> int:
+        slot = self.slots[-1][lex] = self.nextSlot[-1]
+        self.nextSlot[-1] += 1
+        return slot
     
     def define(self, name: Token) -> None:
         if not self.scopes:
             return
         (self.peek())[name.lex] = True 
 
-    def resolveLocal(self, expr: Expr, name: Token) -> None:
+    # For the implicit "this" and "super" scopes
+    def defineImplicit(self, lex: str) -> None:
+        self.peek()[lex] = True
+        self.claimSlot(lex)
+
+    # Store where the variable lives on the node itself: how many
+    # environments out, and which slot in that one. Globals are left as None.
+    # Returns the index of the scope it was found in.
+    def resolveLocal(self, expr: Expr, name: Token) -> int:
         for i in range(len(self.scopes) - 1, -1, -1):
             if name.lex in self.scopes[i]:
-                self.interpreter.resolve(expr, len(self.scopes) - 1 - i)
-                return
+                expr.depth = self.envs[-1] - self.envs[i]
+                expr.slot = self.slots[i][name.lex]
+                return i
+        return None
+
+    def impure(self) -> None:
+        if self.functions:
+            self.functions[-1].pure = False
+
+    # Using a variable from outside the function, global or captured, ties
+    # the result to something other than the arguments
+    def touch(self, scope: int) -> None:
+        if self.functions and (scope is None or scope < self.functions[-1].base):
+            self.functions[-1].pure = False
+
+    # Run once the whole program is resolved. A function is pure if its own
+    # body is and every global it calls names a pure function that nothing
+    # assigns to or declares again (or shadows a native with). Start from
+    # all of them and drop the ones calling something that isn't, until
+    # none drop, so that recursion doesn't keep a function from being pure.
+    def resolvePurity(self) -> None:
+        natives = self.interpreter.globals.index
+        stable = {name: function for name, function in self.globalFunctions.items()
+                  if self.declaredGlobals[name] == 1 and name not in natives
+                  and name not in self.assignedGlobals}
+
+        pure = {p.function: p for p in self.seen if p.pure}
+        changed = True
+        while changed:
+            changed = False
+            for function, p in list(pure.items()):
+                if any(stable.get(name) not in pure for name in p.callees):
+                    del pure[function]
+                    changed = True
+
+        for function in pure:
+            function.pure = True
+
+    # Whether running statements can create a function or class, whose
+    # closure would keep the scope they run in alive
+    @classmethod
+    def closes(cls, statements: list[Stmt]) -> bool:
+        for stmt in statements:
+            if isinstance(stmt, (StmtFunction, StmtClass)):
+                return True
+            if isinstance(stmt, StmtBlock) and cls.closes(stmt.statements):
+                return True
+            if isinstance(stmt, StmtIf) and cls.closes([stmt.thenBranch]):
+                return True
+            if isinstance(stmt, StmtIf) and stmt.elseBranch is not None \
+                    and cls.closes([stmt.elseBranch]):
+                return True
+            if isinstance(stmt, (StmtWhile, StmtFor)) and cls.closes([stmt.body]):
+                return True
+        return False
             
     def resolveFunction(self, function: StmtFunction, t: FunctionType) -> None:
         enclosingFunction: Resolver.FunctionType = self.currentFunction
         self.currentFunction = t
+        # methods read "this", so only plain functions can be pure
+        purity = self.Purity(function, len(self.scopes), t == self.FunctionType.FUNCTION)
+        self.functions.append(purity)
+        if purity.pure:
+            self.seen.append(purity)
         self.beginScope()
+        # a method's frame holds "this" in slot 0, ahead of the parameters
+        if t in (self.FunctionType.METHOD, self.FunctionType.INITIALIZER):
+            self.defineImplicit("this")
         for param in function.params:
             self.declare(param)
             self.define(param)
         self.resolve(function.body)
         self.endScope()
+        self.functions.pop()
         self.currentFunction = enclosingFunction
 
 
     # Visit Expressions 
-    def visitVariableExpr(self, expr: ExprVariable) -> None:
+    # Each handles its own node and returns the children left to resolve,
+    # which resolve() puts on a stack of its own rather than recursing
+    def visitVariableExpr(self, expr: ExprVariable) -> tuple:
+        self.touch(self.resolveVariable(expr))
+        return ()
+
+    def resolveVariable(self, expr: ExprVariable) -> int:
         if self.scopes and self.peek().get(expr.name.lex) == False:
             self.interpreter.lox.parseError(expr.name, \
                       "Can't read local variable in its own initializer.")
             
-        self.resolveLocal(expr, expr.name)
+        return self.resolveLocal(expr, expr.name)
     
-    def visitAssignExpr(self, expr: ExprAssign) -> None:
-        self.resolve(expr.val)
-        self.resolveLocal(expr, expr.name)
+    def visitAssignExpr(self, expr: ExprAssign) -> tuple:
+        scope = self.resolveLocal(expr, expr.name)
+        if scope is None:
+            self.assignedGlobals.add(expr.name.lex)
+        self.touch(scope)
+        return (expr.val,)
     
-    def visitBinaryExpr(self, expr: ExprBinary) -> None:
-        self.resolve(expr.left)
-        self.resolve(expr.right)
-
-    def visitCallExpr(self, expr: ExprCall) -> None:
-        self.resolve(expr.callee)
-        for arg in expr.args:
-            self.resolve(arg)
+    def visitBinaryExpr(self, expr: ExprBinary) -> tuple:
+        return (expr.left, expr.right)
+
+    # Calling a global by name is as pure as the function it turns out to
+    # name; calling anything else is taken not to be
+    def visitCallExpr(self, expr: ExprCall) -> tuple:
+        if type(expr.callee) is ExprVariable:
+            if self.resolveVariable(expr.callee) is None and self.functions:
+                self.functions[-1].callees.add(expr.callee.name.lex)
+            else:
+                self.impure()
+            return tuple(expr.args)
+        self.impure()
+        return (expr.callee, *expr.args)
     
-    def visitGroupingExpr(self, expr: ExprGrouping) -> None:
-        self.resolve(expr.expr)
+    def visitGroupingExpr(self, expr: ExprGrouping) -> tuple:
+        return (expr.expr,)
     
-    def visitLiteralExpr(self, expr: ExprLiteral) -> None:
-        self.resolve(expr.val)
+    def visitLiteralExpr(self, expr: ExprLiteral) -> tuple:
+        return ()
     
-    def visitLogicalExpr(self, expr: ExprLogical) -> None:
-        self.resolve(expr.left)
-        self.resolve(expr.right)
+    def visitLogicalExpr(self, expr: ExprLogical) -> tuple:
+        return (expr.left, expr.right)
 
-    def visitUnaryExpr(self, expr: ExprUnary) -> None:
-        self.resolve(expr.expr)
+    def visitUnaryExpr(self, expr: ExprUnary) -> tuple:
+        return (expr.expr,)
 
-    def visitGetExpr(self, expr: ExprGet) -> None:
-        self.resolve(expr.obj)
+    # Fields can change between calls
+    def visitGetExpr(self, expr: ExprGet) -> tuple:
+        self.impure()
+        return (expr.obj,)
 
-    def visitSetExpr(self, expr: ExprSet) -> None:
-        self.resolve(expr.val)
-        self.resolve(expr.obj)
+    def visitSetExpr(self, expr: ExprSet) -> tuple:
+        self.impure()
+        return (expr.val, expr.obj)
 
-    def visitThisExpr(self, expr: ExprThis) -> None:
+    def visitThisExpr(self, expr: ExprThis) -> tuple:
         if self.currentClass == self.ClassType.NONE:
             self.interpreter.lox.parseError(expr.keyword, \
                 "Can't use 'this' outside of a class.")
-            return 
+            return ()
         self.resolveLocal(expr, expr.keyword)
+        return ()
 
-    def visitSuperExpr(self, expr: ExprSuper) -> None:
+    def visitSuperExpr(self, expr: ExprSuper) -> tuple:
         if self.currentClass == self.ClassType.NONE:
             self.interpreter.lox.parseError(expr.keyword, \
                 "Can't use 'super' outside of a class.")
@@ -155,25 +293,34 @@ class Resolver(Expr.Visitor, Stmt.Visitor):
                 "Can't use 'super' in a class with no superclass.")
             
         self.resolveLocal(expr, expr.keyword)
+        return ()
         
 
 
 
     # Visit Statements 
+    # Escape analysis: a block inside a function or another block, that no
+    # closure can capture, keeps its locals in free slots of the enclosing
+    # environment, which outlives it anyway
     def visitBlockStmt(self, stmt: StmtBlock) -> None:
-        self.beginScope()
+        stmt.scoped = not self.scopes or self.closes(stmt.statements)
+        self.beginScope(stmt.scoped)
         self.resolve(stmt.statements)
         self.endScope()
     
     def visitVarStmt(self, stmt: StmtVariable) -> None:
-        self.declare(stmt.name)
+        stmt.slot = self.declare(stmt.name)
         if stmt.initializer:
             self.resolve(stmt.initializer)
         
         self.define(stmt.name)
     
+    # A function that makes a closure or class hands back a new one each call
     def visitFunctionStmt(self, stmt: StmtFunction) -> None:
-        self.declare(stmt.name)
+        self.impure()
+        stmt.slot = self.declare(stmt.name)
+        if stmt.slot is None:
+            self.globalFunctions[stmt.name.lex] = stmt
         self.define(stmt.name)
         self.resolveFunction(stmt, self.FunctionType.FUNCTION)
     
@@ -187,6 +334,7 @@ class Resolver(Expr.Visitor, Stmt.Visitor):
             self.resolve(stmt.elseBranch)
     
     def visitPrintStmt(self, stmt: StmtPrint) -> None:
+        self.impure()
         self.resolve(stmt.expression)
     
     def visitReturnStmt(self, stmt: StmtReturn) -> None:
@@ -202,12 +350,29 @@ class Resolver(Expr.Visitor, Stmt.Visitor):
     def visitWhileStmt(self, stmt: StmtWhile) -> None:
         self.resolve(stmt.condition)
         self.resolve(stmt.body)
+
+    # The initializer declares in a scope of the loop's own, which needs an
+    # environment only if the body can make a closure over it. That one
+    # environment serves every iteration; a block body gets its own each
+    # time round, as any block does.
+    def visitForStmt(self, stmt: StmtFor) -> None:
+        stmt.scoped = not self.scopes or self.closes([stmt.body])
+        self.beginScope(stmt.scoped)
+        if stmt.initializer is not None:
+            self.resolve(stmt.initializer)
+        if stmt.condition is not None:
+            self.resolve(stmt.condition)
+        if stmt.increment is not None:
+            self.resolve(stmt.increment)
+        self.resolve(stmt.body)
+        self.endScope()
     
     def visitClassStmt(self, stmt: StmtClass) -> None: 
+        self.impure()
         enclosingClass: Resolver.ClassType = self.currentClass
         self.currentClass = self.ClassType.CLASS
 
-        self.declare(stmt.name)
+        stmt.slot = self.declare(stmt.name)
         self.define(stmt.name)
 
         if stmt.superclass:
@@ -220,17 +385,12 @@ class Resolver(Expr.Visitor, Stmt.Visitor):
 
         if stmt.superclass:
             self.beginScope()
-            self.peek()["super"] = True
-
-        self.beginScope()
-        self.peek()["this"] = True 
+            self.defineImplicit("super")
 
         for method in stmt.methods:
-            declaration = self.FunctionType.METHOD if \
-                method.name.lex == "init" else self.FunctionType.INITIALIZER
+            declaration = self.FunctionType.INITIALIZER if \
+                method.name.lex == "init" else self.FunctionType.METHOD
             self.resolveFunction(method, declaration)
-        
-        self.endScope()
 
         if stmt.superclass:
             self.endScope()
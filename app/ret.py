@@ -1,6 +1,8 @@
 from app.runtime import MyRuntimeError
 
 
+# LEGACY: returns used to unwind as this exception; Interpreter now hands
+# them back from statement execution instead
 class ReturnExcept(MyRuntimeError):
     def __init__(self, val):
         super().__init__(self, val)
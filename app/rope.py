@@ -0,0 +1,90 @@
+# A long string built by Lox's +, kept as the pieces it was built from
+# until something needs its characters. Adding to a str copies the whole
+# of it, so `s = s + x` in a loop is quadratic; adding to a Rope copies at
+# most a chunk.
+#
+# A Rope is parts[:count] followed by tail. Pieces collect in the tail
+# until it is CHUNK long, then move onto parts. Ropes built one from
+# another share the parts list: the one at its end appends in place, and
+# any other copies its own prefix first. A Rope never changes once made.
+# Adding a Rope on the right splices its pieces in, so `s = x + s` copies
+# the list of pieces each time but not the characters.
+#
+# Lox never sees one: printing, == and hashing go by the characters,
+# joined the first time they're needed and kept.
+class Rope:
+    # the longest tail; results of + shorter than it stay plain strs
+    CHUNK = 4096
+
+    __slots__ = ("parts", "count", "tail", "length", "flat")
+
+    def __init__(self, parts: list, count: int, tail: str, length: int):
+        self.parts = parts
+        self.count = count
+        self.tail = tail
+        self.length = length
+        self.flat = None
+
+    def append(self, s: str) -> "Rope":
+        tail = self.tail + s
+        if len(tail) < self.CHUNK:
+            return Rope(self.parts, self.count, tail, self.length + len(s))
+
+        parts = self.parts
+        if len(parts) != self.count:
+            parts = parts[:self.count]
+        parts.append(tail)
+        return Rope(parts, self.count + 1, "", self.length + len(s))
+
+    # This followed by other, other's pieces reused rather than joined. Our
+    # tail goes on the front of other's first piece if both are short.
+    def extend(self, other: "Rope") -> "Rope":
+        if other.count == 0:
+            return self.append(other.tail)
+
+        first = other.parts[0]
+        parts = self.parts
+        if len(parts) != self.count:
+            parts = parts[:self.count]
+        skip = 0
+        if len(self.tail) + len(first) < self.CHUNK:
+            parts.append(self.tail + first)
+            skip = 1
+        elif self.tail:
+            parts.append(self.tail)
+        parts.extend(other.parts[skip:other.count])
+        return Rope(parts, len(parts), other.tail, self.length + other.length)
+
+    def __str__(self) -> str:
+        if self.flat is None:
+            parts = self.parts
+            if len(parts) != self.count:
+                parts = parts[:self.count]
+            self.flat = "".join(parts) + self.tail
+        return self.flat
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __eq__(self, other) -> bool:
+        if type(other) is Rope or type(other) is str:
+            return len(self) == len(other) and str(self) == str(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+
+# The value a string can be at runtime
+STRINGS = (str, Rope)
+
+
+# Lox's + on two strings, either of them maybe a Rope
+def concat(left, right):
+    if type(left) is str:
+        if type(right) is str and len(left) + len(right) < Rope.CHUNK:
+            return left + right
+        left = Rope([], 0, left, len(left))
+    if type(right) is Rope:
+        return left.extend(right)
+    return left.append(right)
@@ -0,0 +1,144 @@
+from app.tokens import Token, TokenType
+
+import re
+import sys
+
+
+class Scanner:
+    # One master pattern run over the original source. Each match starts
+    # where the previous one ended, so nothing is sliced off the text and
+    # scanning stays linear in the size of the input.
+    _MASTER = re.compile(r"""
+        (?P<space>[ \t\r\n]+)
+      | (?P<comment>//[^\n]*)
+      | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>[!=<>]=?|[(){},.\-+;*/])
+      | (?P<number>\d+(?:\.\d+)?)
+      | (?P<string>"[^"]*")
+      | (?P<unterminated>")
+      | (?P<error>.)
+    """, re.VERBOSE)
+
+    _KEYWORDS = {
+        "and": TokenType.AND,
+        "class": TokenType.CLASS,
+        "else": TokenType.ELSE,
+        "false": TokenType.FALSE,
+        "for": TokenType.FOR,
+        "fun": TokenType.FUN,
+        "if": TokenType.IF,
+        "nil": TokenType.NIL,
+        "or": TokenType.OR,
+        "print": TokenType.PRINT,
+        "return": TokenType.RETURN,
+        "super": TokenType.SUPER,
+        "this": TokenType.THIS,
+        "true": TokenType.TRUE,
+        "var": TokenType.VAR,
+        "while": TokenType.WHILE,
+    }
+
+    _PUNCT = {
+        "(": TokenType.LEFT_PAREN,
+        ")": TokenType.RIGHT_PAREN,
+        "{": TokenType.LEFT_BRACE,
+        "}": TokenType.RIGHT_BRACE,
+        ",": TokenType.COMMA,
+        ".": TokenType.DOT,
+        "-": TokenType.MINUS,
+        "+": TokenType.PLUS,
+        ";": TokenType.SEMICOLON,
+        "/": TokenType.SLASH,
+        "*": TokenType.STAR,
+        "!": TokenType.BANG,
+        "!=": TokenType.BANG_EQUAL,
+        "=": TokenType.EQUAL,
+        "==": TokenType.EQUAL_EQUAL,
+        ">": TokenType.GREATER,
+        ">=": TokenType.GREATER_EQUAL,
+        "<": TokenType.LESS,
+        "<=": TokenType.LESS_EQUAL,
+    }
+
+    def __init__(self, lox, source, line: int = 1):
+        self.lox = lox
+        # either the whole text or an iterable of chunks of it
+        self._source = source
+        self._line = line
+        self._tokens: list[Token] = []
+
+    def scan(self):
+        chunks = self._source
+        if isinstance(chunks, str):
+            chunks = (chunks,)
+        chunks = iter(chunks)
+
+        keywords = self._KEYWORDS
+        punct = self._PUNCT
+        IDENTIFIER = TokenType.IDENTIFIER
+        intern = sys.intern
+        finditer = self._MASTER.finditer
+
+        line = self._line
+        buf = ""
+        final = False
+        while not final:
+            chunk = next(chunks, None)
+            if chunk is None:
+                final = True
+            else:
+                buf += chunk
+
+            # every character is covered by some group, so finditer never skips
+            pos = 0
+            for m in finditer(buf):
+                kind = m.lastgroup
+                # A match ending on or next to the end of the buffer might
+                # continue into the next chunk ("1." may become "1.5"), so
+                # leave it for the next round.
+                if not final and (m.end() >= len(buf) - 1 or kind == "unterminated"):
+                    break
+                pos = m.end()
+
+                if kind == "space":
+                    # tokens on one line share one int object for their line
+                    newlines = buf.count("\n", m.start(), pos)
+                    if newlines:
+                        line += newlines
+                elif kind == "ident":
+                    lex = intern(m.group())
+                    yield Token(keywords.get(lex, IDENTIFIER), lex, "null", line)
+                elif kind == "op":
+                    lex = intern(m.group())
+                    yield Token(punct[lex], lex, "null", line)
+                elif kind == "number":
+                    lex = m.group()
+                    yield Token(TokenType.NUMBER, lex, float(lex), line)
+                elif kind == "string":
+                    lex = m.group()
+                    yield Token(TokenType.STRING, lex, lex[1:-1], line)
+                    newlines = lex.count("\n")
+                    if newlines:
+                        line += newlines
+                elif kind == "comment":
+                    pass
+                elif kind == "unterminated":
+                    self.lox.tokenError(line, "Unterminated string.")
+                    line += buf.count("\n", pos)
+                    break
+                else:
+                    self.lox.tokenError(line, f"Unexpected character: {m.group()}")
+            buf = buf[pos:]
+
+        yield Token(TokenType.EOF, "", "null", line)
+
+    def tokenize(self) -> list[Token]:
+        self._tokens = list(self.scan())
+        return self._tokens
+
+    def tokens(self) -> list[Token]:
+        return self._tokens
+
+    def printTokens(self):
+        for token in self._tokens:
+            print(token)
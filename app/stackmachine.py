@@ -0,0 +1,471 @@
+from app.tokens import Token, TokenType
+from app.runtime import MyRuntimeError
+from app.expression import *
+from app.statement import *
+from app.environment import LocalEnvironment
+from app.callable import LoxCallable
+from app.function import LoxFunction
+from app.loxclass import LoxClass
+from app.instance import LoxInstance
+from app.interpreter import Interpreter
+from app.memo import Memo
+
+
+# run --engine=stack
+#
+# Interpreter without the Python call stack. A Lox call goes through
+# evaluate, accept, visitCallExpr, LoxFunction.call and executeBlock, so
+# the tree-walker runs into RecursionError a few hundred Lox frames deep.
+# Here every node that can call, or that nests too deeply, is run by a
+# generator (see Steps) that yields the nodes it needs evaluated and the
+# frames it needs entered; run() keeps those generators on a list of its
+# own and drives the top one, so the depth of a Lox program costs heap,
+# not Python frames.
+#
+# Everything else (call-free and shallow, most of a program by count) is
+# still handed to the Interpreter methods directly, quickening included.
+class StackMachine(Interpreter):
+    MAX_DEPTH = 10000
+    # Statements still nest by recursion in the parser, resolver and
+    # optimizer, so blocks and bodies deeper than this are a compile error
+    # here rather than a Python overflow on the way in
+    MAX_NESTING = 100
+    # subtrees at most this tall are evaluated by plain recursion
+    DIRECT_HEIGHT = 32
+
+    def __init__(self, lox, maxDepth: int = None):
+        super().__init__(lox)
+        self.maxDepth = self.MAX_DEPTH if maxDepth is None else maxDepth
+        # Lox calls in progress
+        self.depth = 0
+        self.steps = Steps(self)
+
+    def interpret(self, statements: list[Stmt]):
+        try:
+            self.steps.slow = Weigh(self.DIRECT_HEIGHT).weigh(statements)
+            self.run(self.steps.sequence(statements))
+        except MyRuntimeError as e:
+            self.lox.runtimeError(e)
+
+    # Drive gen to completion. A generator on the stack yields either a
+    # node, which gets a generator of its own pushed above it, or a Frame
+    # to run in an environment of its own; whatever finishes is sent to the
+    # one below.
+    # Each entry keeps the environment its generator runs in.
+    def run(self, gen):
+        stack = [(gen, self.environment, None)]
+        val = None
+
+        while True:
+            gen, env, frame = stack[-1]
+            self.environment = env
+            try:
+                request = gen.send(val)
+            except StopIteration as done:
+                stack.pop()
+                val = done.value
+
+                if frame is not None and frame.function is not None:
+                    # a tail call comes back as the frame to run in place
+                    # of this one
+                    if type(val) is Frame:
+                        stack.append((val.gen, val.env, val))
+                        val = None
+                        continue
+                    self.depth -= 1
+                    if frame.function.isInit:
+                        val = frame.env.values[0]
+                    elif val is not None:
+                        val = val[0]
+
+                if not stack:
+                    return val
+                continue
+
+            if type(request) is Frame:
+                if request.function is not None:
+                    if self.depth == self.maxDepth:
+                        raise MyRuntimeError(request.paren, "Stack overflow.")
+                    self.depth += 1
+                stack.append((request.gen, request.env, request))
+            else:
+                stack.append((request.accept(self.steps), env, None))
+            val = None
+
+    # The frame a call to a Lox function runs in, after the usual checks;
+    # None for anything else that can be called
+    def frame(self, expr: ExprCall, callee, args: list) -> "Frame":
+        if not isinstance(callee, LoxCallable):
+            raise MyRuntimeError(expr.paren, \
+                "Can only call functions and classes.")
+
+        if len(args) != callee.arity():
+            raise MyRuntimeError(expr.paren, \
+                f"Expected {callee.arity()} arguments but got {len(args)}.")
+
+        if type(callee) is not LoxFunction:
+            return None
+        if callee.this is not None:
+            args.insert(0, callee.this)
+        return Frame(self.steps.sequence(callee.declaration.body),
+                     LocalEnvironment(callee.closure, args), callee, expr.paren)
+
+
+# A Steps generator to run in env. For a call, function is the LoxFunction
+# and paren is where the call was made.
+class Frame:
+    __slots__ = ("gen", "env", "function", "paren")
+
+    def __init__(self, gen, env, function: LoxFunction = None, paren: Token = None):
+        self.gen = gen
+        self.env = env
+        self.function = function
+        self.paren = paren
+
+
+# The generators StackMachine.run drives, one per visit of a node in slow.
+# A child in slow is yielded for run() to evaluate; any other is evaluated
+# right away by the machine's own Interpreter methods.
+class Steps(Expr.Visitor, Stmt.Visitor):
+    def __init__(self, machine: StackMachine):
+        self.machine = machine
+        self.slow: set = set()
+
+    def sequence(self, statements: list[Stmt]):
+        m = self.machine
+        slow = self.slow
+        for stmt in statements:
+            ret = (yield stmt) if stmt in slow else stmt.accept(m)
+            if ret is not None:
+                return ret
+
+    def call(self, expr: ExprCall, callee, args: list):
+        m = self.machine
+        if type(callee) is LoxClass:
+            m.frame(expr, callee, args)
+            instance = LoxInstance(callee)
+            init = callee.initializer
+            if init is not None:
+                yield Frame(self.sequence(init.declaration.body),
+                            LocalEnvironment(init.closure, [instance] + args),
+                            init, expr.paren)
+            return instance
+
+        # a memoized function still runs in a frame of its own on a miss
+        if type(callee) is Memo and type(callee.function) is LoxFunction:
+            key = callee.key(args)
+            frame = m.frame(expr, callee.function, args)
+            if key is None:
+                return (yield frame)
+            if key in callee.cache:
+                return callee.hit(key)
+            return callee.store(key, (yield frame))
+
+        frame = m.frame(expr, callee, args)
+        if frame is None:
+            return callee.call(m, args)
+        return (yield frame)
+
+    # Exprs
+    def visitLiteralExpr(self, expr: ExprLiteral):
+        return expr.val
+        yield
+
+    def visitGroupingExpr(self, expr: ExprGrouping):
+        child = expr.expr
+        return (yield child) if child in self.slow else child.accept(self.machine)
+
+    def visitUnaryExpr(self, expr: ExprUnary):
+        child = expr.expr
+        val = (yield child) if child in self.slow else child.accept(self.machine)
+        return self.machine.unary(expr.op, val)
+
+    def visitBinaryExpr(self, expr: ExprBinary):
+        m = self.machine
+        slow = self.slow
+        left = (yield expr.left) if expr.left in slow else expr.left.accept(m)
+        right = (yield expr.right) if expr.right in slow else expr.right.accept(m)
+        return m.binary(expr.op, left, right)
+
+    def visitLogicalExpr(self, expr: ExprLogical):
+        m = self.machine
+        slow = self.slow
+        left = (yield expr.left) if expr.left in slow else expr.left.accept(m)
+
+        if expr.op.type == TokenType.OR:
+            if m.isTruthful(left):
+                return left
+        elif not m.isTruthful(left):
+            return left
+
+        return (yield expr.right) if expr.right in slow else expr.right.accept(m)
+
+    def visitVariableExpr(self, expr: ExprVariable):
+        return self.machine.visitVariableExpr(expr)
+        yield
+
+    def visitAssignExpr(self, expr: ExprAssign):
+        m = self.machine
+        val = (yield expr.val) if expr.val in self.slow else expr.val.accept(m)
+
+        if expr.depth is not None:
+            m.environment.assignAt(expr.depth, expr.slot, val)
+        else:
+            m.globals.assign(expr.name, val)
+        return val
+
+    def visitCallExpr(self, expr: ExprCall):
+        m = self.machine
+        slow = self.slow
+        callee = (yield expr.callee) if expr.callee in slow else expr.callee.accept(m)
+        args = []
+        for arg in expr.args:
+            args.append((yield arg) if arg in slow else arg.accept(m))
+        return (yield from self.call(expr, callee, args))
+
+    def visitGetExpr(self, expr: ExprGet):
+        obj = (yield expr.obj) if expr.obj in self.slow else expr.obj.accept(self.machine)
+        if not isinstance(obj, LoxInstance):
+            raise MyRuntimeError(expr.name, "Only instances have properties.")
+        return obj.get(expr.name)
+
+    def visitSetExpr(self, expr: ExprSet):
+        m = self.machine
+        slow = self.slow
+        obj = (yield expr.obj) if expr.obj in slow else expr.obj.accept(m)
+        if not isinstance(obj, LoxInstance):
+            raise MyRuntimeError(expr.name, "Only instances have fields.")
+
+        val = (yield expr.val) if expr.val in slow else expr.val.accept(m)
+        obj.set(expr.name, val)
+        return val
+
+    def visitThisExpr(self, expr: ExprThis):
+        return self.machine.visitThisExpr(expr)
+        yield
+
+    def visitSuperExpr(self, expr: ExprSuper):
+        return self.machine.visitSuperExpr(expr)
+        yield
+
+    # Stmts
+    def visitReturnStmt(self, stmt: StmtReturn):
+        m = self.machine
+        value = stmt.value
+
+        # `return f(...)`: hand the callee's frame back for run() to put in
+        # place of this one, so tail recursion runs in constant depth
+        if type(value) is ExprCall:
+            slow = self.slow
+            callee = (yield value.callee) if value.callee in slow else value.callee.accept(m)
+            args = []
+            for arg in value.args:
+                args.append((yield arg) if arg in slow else arg.accept(m))
+            if type(callee) is LoxFunction and not callee.isInit:
+                return m.frame(value, callee, args)
+            return ((yield from self.call(value, callee, args)),)
+
+        if value is None:
+            return (None,)
+        return ((yield value) if value in self.slow else value.accept(m),)
+
+    def visitFunctionStmt(self, stmt: StmtFunction):
+        return self.machine.visitFunctionStmt(stmt)
+        yield
+
+    def visitClassStmt(self, stmt: StmtClass):
+        return self.machine.visitClassStmt(stmt)
+        yield
+
+    def visitIfStmt(self, stmt: StmtIf):
+        m = self.machine
+        slow = self.slow
+        cond = (yield stmt.condition) if stmt.condition in slow else stmt.condition.accept(m)
+
+        branch = stmt.thenBranch if m.isTruthful(cond) else stmt.elseBranch
+        if branch is None:
+            return None
+        return (yield branch) if branch in slow else branch.accept(m)
+
+    def visitBlockStmt(self, stmt: StmtBlock):
+        if not stmt.scoped:
+            return (yield from self.sequence(stmt.statements))
+        return (yield Frame(self.sequence(stmt.statements),
+                            LocalEnvironment(self.machine.environment)))
+
+    def visitWhileStmt(self, stmt: StmtWhile):
+        m = self.machine
+        slow = self.slow
+        cond, body = stmt.condition, stmt.body
+
+        while m.isTruthful((yield cond) if cond in slow else cond.accept(m)):
+            ret = (yield body) if body in slow else body.accept(m)
+            if ret is not None:
+                return ret
+        return None
+
+    def visitForStmt(self, stmt: StmtFor):
+        if not stmt.scoped:
+            return (yield from self.loop(stmt))
+        return (yield Frame(self.loop(stmt), LocalEnvironment(self.machine.environment)))
+
+    def loop(self, stmt: StmtFor):
+        m = self.machine
+        slow = self.slow
+        init, cond, inc, body = stmt.initializer, stmt.condition, stmt.increment, stmt.body
+
+        if init is not None:
+            if init in slow:
+                yield init
+            else:
+                init.accept(m)
+
+        while cond is None or m.isTruthful((yield cond) if cond in slow else cond.accept(m)):
+            ret = (yield body) if body in slow else body.accept(m)
+            if ret is not None:
+                return ret
+            if inc is not None:
+                if inc in slow:
+                    yield inc
+                else:
+                    inc.accept(m)
+        return None
+
+    def visitExpressionStmt(self, stmt: StmtExpression):
+        expr = stmt.expression
+        if expr in self.slow:
+            yield expr
+        else:
+            expr.accept(self.machine)
+        return None
+
+    def visitPrintStmt(self, stmt: StmtPrint):
+        m = self.machine
+        expr = stmt.expression
+        val = (yield expr) if expr in self.slow else expr.accept(m)
+        print(m.string(val))
+        return None
+
+    def visitVarStmt(self, stmt: StmtVariable):
+        m = self.machine
+        init = stmt.initializer
+        val = None
+        if init is not None:
+            val = (yield init) if init in self.slow else init.accept(m)
+        m.declare(stmt, val)
+        return None
+
+
+# Finds the nodes Steps has to run: those with a call somewhere inside
+# (a call may go arbitrarily deep) and those taller than limit. Function
+# bodies are weighed on their own, as declaring a function runs none of it.
+#
+# The walk keeps its own stack, as a program too deep to evaluate by
+# recursion is too deep to weigh by it. Each visit method returns a node's
+# children and, where it isn't one more than its tallest child, its height.
+class Weigh(Expr.Visitor, Stmt.Visitor):
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.slow: set = set()
+
+    def weigh(self, statements: list[Stmt]) -> set:
+        for stmt in statements:
+            self.height(stmt)
+        return self.slow
+
+    def height(self, root) -> int:
+        # entries are [node, its children left to weigh, its own height
+        # if fixed, its tallest child so far]
+        stack = [[root, None, None, 0]]
+        while True:
+            entry = stack[-1]
+            if entry[1] is None:
+                children, entry[2] = entry[0].accept(self)
+                entry[1] = iter(children)
+            child = next(entry[1], None)
+            if child is not None:
+                stack.append([child, None, None, 0])
+                continue
+
+            stack.pop()
+            h = entry[2] if entry[2] is not None else entry[3] + 1
+            if h > self.limit:
+                self.slow.add(entry[0])
+            if not stack:
+                return h
+            stack[-1][3] = max(stack[-1][3], h)
+
+    # Exprs
+    def visitLiteralExpr(self, expr):
+        return (), None
+
+    def visitGroupingExpr(self, expr):
+        return (expr.expr,), None
+
+    def visitUnaryExpr(self, expr):
+        return (expr.expr,), None
+
+    def visitBinaryExpr(self, expr):
+        return (expr.left, expr.right), None
+
+    def visitLogicalExpr(self, expr):
+        return (expr.left, expr.right), None
+
+    def visitVariableExpr(self, expr):
+        return (), None
+
+    def visitAssignExpr(self, expr):
+        return (expr.val,), None
+
+    def visitCallExpr(self, expr):
+        return (expr.callee, *expr.args), self.limit + 1
+
+    def visitGetExpr(self, expr):
+        return (expr.obj,), None
+
+    def visitSetExpr(self, expr):
+        return (expr.obj, expr.val), None
+
+    def visitThisExpr(self, expr):
+        return (), None
+
+    def visitSuperExpr(self, expr):
+        return (), None
+
+    # Stmts
+    def visitExpressionStmt(self, stmt):
+        return (stmt.expression,), None
+
+    def visitPrintStmt(self, stmt):
+        return (stmt.expression,), None
+
+    def visitVarStmt(self, stmt):
+        if stmt.initializer is None:
+            return (), None
+        return (stmt.initializer,), None
+
+    def visitReturnStmt(self, stmt):
+        if stmt.value is None:
+            return (), None
+        return (stmt.value,), None
+
+    def visitBlockStmt(self, stmt):
+        return stmt.statements, None
+
+    def visitIfStmt(self, stmt):
+        if stmt.elseBranch is None:
+            return (stmt.condition, stmt.thenBranch), None
+        return (stmt.condition, stmt.thenBranch, stmt.elseBranch), None
+
+    def visitWhileStmt(self, stmt):
+        return (stmt.condition, stmt.body), None
+
+    def visitForStmt(self, stmt):
+        parts = (stmt.initializer, stmt.condition, stmt.increment, stmt.body)
+        return [part for part in parts if part is not None], None
+
+    def visitFunctionStmt(self, stmt):
+        return stmt.body, 1
+
+    def visitClassStmt(self, stmt):
+        return [s for method in stmt.methods for s in method.body], 1
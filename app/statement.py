@@ -8,6 +8,8 @@ class Stmt(ABC):
     Expression  : Expr expression
     Print       : Expr expression
     '''
+    __slots__ = ()
+
     @abstractmethod
     def accept(self, visitor): 
         pass
@@ -32,6 +34,10 @@ class Stmt(ABC):
         @abstractmethod 
         def visitWhileStmt(self, stmt):
             pass
+
+        @abstractmethod 
+        def visitForStmt(self, stmt):
+            pass
         
         @abstractmethod 
         def visitBlockStmt(self, stmt):
@@ -49,8 +55,14 @@ class Stmt(ABC):
         def visitClassStmt(self, stmt):
             pass
 
+        # Quickened nodes, as in Expr.Visitor
+        def visitCountedForStmt(self, stmt):
+            return self.visitForStmt(stmt)
+
 
 class StmtExpression(Stmt):
+    __slots__ = ("expression",)
+
     def __init__(self, expr): 
         self.expression = expr
 
@@ -58,6 +70,8 @@ class StmtExpression(Stmt):
         return visitor.visitExpressionStmt(self)
 
 class StmtPrint(Stmt):
+    __slots__ = ("expression",)
+
     def __init__(self, expr):
         self.expression = expr
 
@@ -65,21 +79,32 @@ class StmtPrint(Stmt):
         return visitor.visitPrintStmt(self)
     
 class StmtVariable(Stmt):
+    __slots__ = ("name", "initializer", "slot")
+
     def __init__(self, name: Token, initializer):
         self.name = name
         self.initializer = initializer
+        # set by the resolver for a local; None means global
+        self.slot = None
 
     def accept(self, visitor):
         return visitor.visitVarStmt(self)
     
 class StmtBlock(Stmt):
+    __slots__ = ("statements", "scoped")
+
     def __init__(self, statements: list[Stmt]):
         self.statements = statements
+        # False once the resolver has put the block's locals in the
+        # enclosing scope's slots, so running it allocates no environment
+        self.scoped = True
 
     def accept(self, visitor):
         return visitor.visitBlockStmt(self)
 
 class StmtIf(Stmt):
+    __slots__ = ("condition", "thenBranch", "elseBranch")
+
     def __init__(self, condition, thenBranch: Stmt, elseBranch):
         self.condition = condition
         self.thenBranch = thenBranch
@@ -89,6 +114,8 @@ class StmtIf(Stmt):
         return visitor.visitIfStmt(self)
 
 class StmtWhile(Stmt):
+    __slots__ = ("condition", "body")
+
     def __init__(self, condition, body: Stmt):
         self.condition = condition
         self.body = body
@@ -96,16 +123,39 @@ class StmtWhile(Stmt):
     def accept(self, visitor):
         return visitor.visitWhileStmt(self)
     
+class StmtFor(Stmt):
+    __slots__ = ("initializer", "condition", "increment", "body", "scoped")
+
+    # initializer, condition and increment may each be None
+    def __init__(self, initializer: Stmt, condition, increment, body: Stmt):
+        self.initializer = initializer
+        self.condition = condition
+        self.increment = increment
+        self.body = body
+        # as StmtBlock.scoped, for the scope the initializer declares in
+        self.scoped = True
+
+    def accept(self, visitor):
+        return visitor.visitForStmt(self)
+
 class StmtFunction(Stmt):
+    __slots__ = ("name", "params", "body", "slot", "pure")
+
     def __init__(self, name: Token, params: list[Token], body: list[Stmt]):
         self.name = name
         self.params = params
         self.body = body
+        self.slot = None
+        # set by the resolver once the result provably depends on nothing
+        # but the arguments
+        self.pure = False
 
     def accept(self, visitor):
         return visitor.visitFunctionStmt(self)
 
 class StmtReturn(Stmt):
+    __slots__ = ("keyword", "value")
+
     def __init__(self, keyword: Token, value):
         self.keyword = keyword
         self.value = value
@@ -114,11 +164,25 @@ class StmtReturn(Stmt):
         return visitor.visitReturnStmt(self)
     
 class StmtClass(Stmt):
+    __slots__ = ("name", "superclass", "methods", "slot")
+
     # def __init__(self, name: Token, methods: list[StmtFunction]):
     def __init__(self, name: Token, superclass, methods: list[StmtFunction]):
         self.name = name
         self.superclass = superclass
         self.methods = methods
+        self.slot = None
+
+    def accept(self, visitor):
+        return visitor.visitClassStmt(self)
+
+
+# Quickened form of StmtFor (see the end of expression.py), for
+# `for (var i = a; i < b; i = i + c)` with c a number literal, any of < <=
+# > >=, and + or -. Interpreter runs its counter without visiting the
+# condition and increment nodes.
+class StmtCountedFor(StmtFor):
+    __slots__ = ()
 
     def accept(self, visitor):
-        return visitor.visitClassStmt(self)
\ No newline at end of file
+        return visitor.visitCountedForStmt(self)
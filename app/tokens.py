@@ -50,6 +50,8 @@ class TokenType(Enum):
         return super().__str__().split(".")[1]
 
 class Token:
+    __slots__ = ("type", "lex", "lit", "line")
+
     def __init__(self, tt: TokenType, lex: str, lit: str, line: int):
         self.type, self.lex, self.lit, self.line = \
                     tt, lex, lit, line
@@ -0,0 +1,878 @@
+import ast
+import warnings
+from types import FunctionType, MethodType
+
+from app.tokens import Token, TokenType
+from app.runtime import MyRuntimeError
+from app.expression import *
+from app.statement import *
+from app.environment import Environment
+from app.callable import LoxCallable
+from app.natives import defineNatives
+from app.rope import STRINGS, concat
+
+
+# run --engine=python
+#
+# Translates the resolved tree into a Python module and runs it through
+# compile(), so CPython's own bytecode interpreter executes the program.
+# Lox functions become Python functions and Lox classes Python classes
+# deriving from LoxObject. The type checks the interpreter makes are
+# inlined into the generated expressions.
+#
+# Every generated node carries the Lox line it came from as its lineno, so
+# when generated code raises (an undefined global is a NameError, an
+# undefined property an AttributeError) the traceback says which Lox line
+# it was.
+#
+# Names in the generated code:
+#   g_x        global x
+#   v_x, v_x_2 local x; numbered when the name is declared again
+#   l_x        field or method x, and what a def or class binds first
+#   _t1        temporaries
+#
+# A local captured by a closure and assigned after it's declared is kept
+# in a one-element list, so the closure sees the assignment. Closures get
+# what they capture as keyword-only defaults, bound when the def runs.
+class Transpiler(Expr.Visitor, Stmt.Visitor):
+    FILENAME = "<lox>"
+
+    def __init__(self, lox):
+        self.lox = lox
+        self.captures = None
+        self.function = None
+        self.line = 1
+
+    def interpret(self, statements: list[Stmt]):
+        # Operands CPython folds to a constant, like -1 or 1 + 2, still get
+        # `is None` tests; they're correct, just not what its warning expects
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", SyntaxWarning)
+            code = compile(self.module(statements), self.FILENAME, "exec")
+        namespace = self.namespace()
+        try:
+            exec(code, namespace)
+            namespace["_main"]()
+        except MyRuntimeError as e:
+            self.lox.runtimeError(e)
+        except NameError as e:
+            self.lox.runtimeError(self.mapError(e, f"Undefined variable '{e.name[2:]}'."))
+        except AttributeError as e:
+            self.lox.runtimeError(self.mapError(e, f"Undefined property '{e.name[2:]}'."))
+        except RecursionError as e:
+            self.lox.runtimeError(self.mapError(e, "Stack overflow."))
+
+    def source(self, statements: list[Stmt]) -> str:
+        return ast.unparse(self.module(statements))
+
+    # The line of the innermost generated frame the error passed through
+    def mapError(self, e: Exception, msg: str) -> MyRuntimeError:
+        line = 0
+        tb = e.__traceback__
+        while tb is not None:
+            if tb.tb_frame.f_code.co_filename == self.FILENAME:
+                line = tb.tb_lineno
+            tb = tb.tb_next
+        return _error(line, msg)
+
+    def namespace(self) -> dict:
+        natives = Environment()
+        defineNatives(natives, self.lox)
+        namespace = {"g_" + name: val for name, val in natives._values.items()}
+        namespace.update(_RUNTIME)
+        namespace["_G"] = namespace
+        return namespace
+
+    def module(self, statements: list[Stmt]) -> ast.Module:
+        self.captures = Captures()
+        self.captures.program(statements)
+
+        self.function = self.captures.main
+        body = self.globals(self.function) + self.block(statements)
+        main = self.node(ast.FunctionDef, name="_main", args=self.arguments([]),
+                         body=body or [self.node(ast.Pass)], decorator_list=[],
+                         returns=None, type_comment=None)
+        return ast.Module(body=[main], type_ignores=[])
+
+
+    # Building nodes
+    def node(self, cls, **fields):
+        if "type_params" in cls._fields:
+            fields.setdefault("type_params", [])
+        node = cls(**fields)
+        node.lineno = node.end_lineno = self.line
+        node.col_offset = node.end_col_offset = 0
+        return node
+
+    def name(self, id: str, store: bool = False) -> ast.Name:
+        return self.node(ast.Name, id=id, ctx=ast.Store() if store else ast.Load())
+
+    def const(self, val) -> ast.Constant:
+        return self.node(ast.Constant, value=val)
+
+    def call(self, func: str, *args) -> ast.Call:
+        return self.node(ast.Call, func=self.name(func), args=list(args), keywords=[])
+
+    def compare(self, left, op, right) -> ast.Compare:
+        return self.node(ast.Compare, left=left, ops=[op], comparators=[right])
+
+    def isType(self, val, typename: str) -> ast.Compare:
+        return self.compare(self.call("type", val), ast.Is(), self.name(typename))
+
+    def both(self, tests: list):
+        if not tests:
+            return None
+        test = tests[0]
+        for other in tests[1:]:
+            test = self.node(ast.BinOp, left=test, op=ast.BitAnd(), right=other)
+        return test
+
+    def error(self, line: int, msg: str) -> ast.Call:
+        return self.call("_err", self.const(line), self.const(msg))
+
+    def stmt(self, expr) -> ast.Expr:
+        return self.node(ast.Expr, value=expr)
+
+    def assign(self, target: ast.expr, val) -> ast.Assign:
+        target.ctx = ast.Store()
+        return self.node(ast.Assign, targets=[target], value=val)
+
+    def temp(self) -> str:
+        self.function.temps += 1
+        return f"_t{self.function.temps}"
+
+    # Results of comparisons and `!` are known to be Python bools
+    @staticmethod
+    def boolean(node):
+        node.loxBool = True
+        return node
+
+    @staticmethod
+    def isBoolean(node) -> bool:
+        return getattr(node, "loxBool", False) or \
+            isinstance(node, ast.Constant) and type(node.value) is bool
+
+    # An operand used more than once: evaluated once into a temporary,
+    # unless it's a constant, or a name and the other operand can't
+    # assign to it in between. Returns what to read it back with and what
+    # to evaluate it with the first time.
+    def operand(self, node, other=None):
+        if isinstance(node, ast.Constant):
+            return node, node
+        if isinstance(node, ast.Name) and isinstance(other, (ast.Constant, ast.Name)):
+            return node, node
+        t = self.temp()
+        return self.name(t), self.node(ast.NamedExpr, target=self.name(t, True), value=node)
+
+    def typeTests(self, operands: list, typ: type, first: bool = True) -> list:
+        tests = []
+        for ref, evaluate in operands:
+            val = evaluate if first else ref
+            if isinstance(val, ast.Constant) and type(val.value) is typ:
+                continue
+            tests.append(self.isString(val) if typ is str else self.isType(val, typ.__name__))
+        return tests
+
+    # A string at runtime may be a str or a Rope
+    def isString(self, val) -> ast.Compare:
+        return self.compare(self.call("type", val), ast.In(), self.name("_STRINGS"))
+
+    def truthy(self, node):
+        if self.isBoolean(node):
+            return node
+        if isinstance(node, ast.Constant):
+            return self.const(node.value is not None and node.value is not False)
+        ref, evaluate = self.operand(node, node)
+        return self.node(ast.BoolOp, op=ast.And(), values=[
+            self.compare(evaluate, ast.IsNot(), self.const(None)),
+            self.compare(ref, ast.IsNot(), self.const(False))])
+
+    def expr(self, expr: Expr):
+        return expr.accept(self)
+
+    def block(self, statements: list[Stmt]) -> list:
+        out = []
+        for stmt in statements:
+            out.extend(stmt.accept(self))
+        return out
+
+    def body(self, statements: list[Stmt]) -> list:
+        return self.block(statements) or [self.node(ast.Pass)]
+
+    def globals(self, function) -> list:
+        if not function.globals:
+            return []
+        return [self.node(ast.Global, names=sorted(function.globals))]
+
+    def arguments(self, params: list[str], free: list = ()) -> ast.arguments:
+        return ast.arguments(
+            posonlyargs=[], args=[self.node(ast.arg, arg=p, annotation=None) for p in params],
+            vararg=None, kwonlyargs=[self.node(ast.arg, arg=id, annotation=None) for id, val in free],
+            kw_defaults=[val for id, val in free], kwarg=None, defaults=[])
+
+
+    # Variables
+    def read(self, node, lex: str):
+        decl = self.captures.decls.get(node)
+        if decl is None:
+            return self.name("g_" + lex)
+        if decl.cell:
+            return self.node(ast.Subscript, value=self.name(decl.py), slice=self.const(0),
+                             ctx=ast.Load())
+        return self.name(decl.py)
+
+    # Bind a declared name to a value, as statements
+    def define(self, node, lex: str, val) -> list:
+        decl = self.captures.decls.get(node)
+        if decl is None:
+            return [self.assign(self.name("g_" + lex), val)]
+        if decl.cell:
+            return [self.assign(self.name(decl.py), self.node(ast.List, elts=[val], ctx=ast.Load()))]
+        return [self.assign(self.name(decl.py), val)]
+
+    # A function or class that closures may refer to while it's being made
+    def preDefine(self, node) -> list:
+        decl = self.captures.decls.get(node)
+        if decl is None or not decl.cell:
+            return []
+        return [self.assign(self.name(decl.py),
+                            self.node(ast.List, elts=[self.const(None)], ctx=ast.Load()))]
+
+    def postDefine(self, node, lex: str, val) -> list:
+        decl = self.captures.decls.get(node)
+        if decl is not None and decl.cell:
+            return [self.assign(self.node(ast.Subscript, value=self.name(decl.py),
+                                          slice=self.const(0), ctx=ast.Store()), val)]
+        return self.define(node, lex, val)
+
+
+    # Exprs
+    def visitLiteralExpr(self, expr: ExprLiteral):
+        return self.const(expr.val)
+
+    def visitGroupingExpr(self, expr: ExprGrouping):
+        return self.expr(expr.expr)
+
+    def visitUnaryExpr(self, expr: ExprUnary):
+        operand = self.expr(expr.expr)
+        self.line = expr.op.line
+
+        if expr.op.type == TokenType.BANG:
+            if isinstance(operand, ast.Constant):
+                return self.boolean(self.const(operand.value is None or operand.value is False))
+            if self.isBoolean(operand):
+                return self.boolean(self.node(ast.UnaryOp, op=ast.Not(), operand=operand))
+            ref, evaluate = self.operand(operand, operand)
+            return self.boolean(self.node(ast.BoolOp, op=ast.Or(), values=[
+                self.compare(evaluate, ast.Is(), self.const(None)),
+                self.compare(ref, ast.Is(), self.const(False))]))
+
+        ref, evaluate = self.operand(operand, operand)
+        negate = self.node(ast.UnaryOp, op=ast.USub(), operand=ref)
+        tests = self.typeTests([(ref, evaluate)], float)
+        if not tests:
+            return negate
+        return self.node(ast.IfExp, test=tests[0], body=negate,
+                         orelse=self.error(expr.op.line, "Operand must be a number."))
+
+    ARITHMETIC = {
+        TokenType.MINUS: ast.Sub, TokenType.STAR: ast.Mult, TokenType.SLASH: ast.Div,
+    }
+    COMPARISON = {
+        TokenType.LESS: ast.Lt, TokenType.LESS_EQUAL: ast.LtE,
+        TokenType.GREATER: ast.Gt, TokenType.GREATER_EQUAL: ast.GtE,
+    }
+
+    def visitBinaryExpr(self, expr: ExprBinary):
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        op = expr.op
+        t = op.type
+        self.line = op.line
+
+        if t == TokenType.EQUAL_EQUAL or t == TokenType.BANG_EQUAL:
+            return self.equality(left, right, t == TokenType.EQUAL_EQUAL)
+
+        operands = [self.operand(left, right), self.operand(right, left)]
+        (a, _), (b, _) = operands
+
+        if t == TokenType.PLUS:
+            add = self.node(ast.BinOp, left=a, op=ast.Add(), right=b)
+            concat = self.call("_concat", a, b)
+            kinds = {type(node.value) for node in (left, right) if isinstance(node, ast.Constant)}
+            msg = "Operands must be two numbers or two strings."
+            if str in kinds:
+                value, test = concat, self.both(self.typeTests(operands, str))
+            elif kinds:
+                value, test = add, self.both(self.typeTests(operands, float))
+            else:
+                strings = self.node(ast.IfExp, test=self.both(self.typeTests(operands, str, False)),
+                                    body=concat, orelse=self.error(op.line, msg))
+                return self.node(ast.IfExp, test=self.both(self.typeTests(operands, float)),
+                                 body=add, orelse=strings)
+        else:
+            if t in self.COMPARISON:
+                value = self.boolean(self.compare(a, self.COMPARISON[t](), b))
+            else:
+                value = self.node(ast.BinOp, left=a, op=self.ARITHMETIC[t](), right=b)
+            test = self.both(self.typeTests(operands, float))
+            msg = "Operands must be numbers."
+
+        if test is None:
+            return value
+        result = self.node(ast.IfExp, test=test, body=value, orelse=self.error(op.line, msg))
+        if t in self.COMPARISON:
+            self.boolean(result)
+        return result
+
+    # Python's == except that two bound methods are only equal when they
+    # are the same object, as every Lox property get binds a new one
+    def equality(self, left, right, equal: bool):
+        if isinstance(left, ast.Constant) or isinstance(right, ast.Constant):
+            return self.boolean(self.compare(left, ast.Eq() if equal else ast.NotEq(), right))
+
+        a, first = self.operand(left, right)
+        b, second = self.operand(right, left)
+        tests = [self.isType(first, "MethodType")]
+        if second is not b:
+            tests.append(self.compare(second, ast.Is(), b))
+        return self.boolean(self.node(
+            ast.IfExp, test=self.both(tests),
+            body=self.compare(a, ast.Is() if equal else ast.IsNot(), b),
+            orelse=self.compare(a, ast.Eq() if equal else ast.NotEq(), b)))
+
+    def visitLogicalExpr(self, expr: ExprLogical):
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        self.line = expr.op.line
+
+        ref, evaluate = self.operand(left, left)
+        if self.isBoolean(left):
+            test = evaluate
+        elif evaluate is ref:
+            test = self.truthy(ref)
+        else:
+            test = self.node(ast.BoolOp, op=ast.And(), values=[
+                self.compare(evaluate, ast.IsNot(), self.const(None)),
+                self.compare(ref, ast.IsNot(), self.const(False))])
+
+        if expr.op.type == TokenType.OR:
+            result = self.node(ast.IfExp, test=test, body=ref, orelse=right)
+        else:
+            result = self.node(ast.IfExp, test=test, body=right, orelse=ref)
+        if self.isBoolean(left) and self.isBoolean(right):
+            self.boolean(result)
+        return result
+
+    def visitVariableExpr(self, expr: ExprVariable):
+        self.line = expr.name.line
+        return self.read(expr, expr.name.lex)
+
+    def visitAssignExpr(self, expr: ExprAssign):
+        val = self.expr(expr.val)
+        name = expr.name
+        self.line = name.line
+        decl = self.captures.decls.get(expr)
+
+        if decl is not None and not decl.cell:
+            return self.node(ast.NamedExpr, target=self.name(decl.py, True), value=val)
+
+        t = self.temp()
+        if decl is not None:
+            setitem = self.node(ast.Attribute, value=self.name(decl.py), attr="__setitem__",
+                                ctx=ast.Load())
+            store = self.node(ast.Call, func=setitem, keywords=[], args=[
+                self.const(0), self.node(ast.NamedExpr, target=self.name(t, True), value=val)])
+            return self.node(ast.BoolOp, op=ast.Or(), values=[store, self.name(t)])
+
+        g = "g_" + name.lex
+        test = self.node(ast.BoolOp, op=ast.And(), values=[
+            self.compare(self.node(ast.NamedExpr, target=self.name(t, True), value=val),
+                         ast.Is(), self.name(t)),
+            self.compare(self.const(g), ast.In(), self.name("_G"))])
+        return self.node(ast.IfExp, test=test,
+                         body=self.node(ast.NamedExpr, target=self.name(g, True), value=self.name(t)),
+                         orelse=self.error(name.line, f"Undefined variable '{name.lex}'."))
+
+    def visitCallExpr(self, expr: ExprCall):
+        callee = self.expr(expr.callee)
+        args = [self.expr(arg) for arg in expr.args]
+        line = expr.paren.line
+        self.line = line
+
+        # a method call on a property is a bound method; anything else
+        # that's a plain function is called directly
+        method = isinstance(expr.callee, (ExprGet, ExprSuper))
+        f = self.temp()
+        tests = [self.isType(self.node(ast.NamedExpr, target=self.name(f, True), value=callee),
+                             "MethodType" if method else "FunctionType")]
+
+        simple = all(isinstance(arg, (ast.Constant, ast.Name)) for arg in args)
+        refs = []
+        for arg in args:
+            if isinstance(arg, ast.Constant) or simple:
+                refs.append(arg)
+                continue
+            ref, evaluate = self.operand(arg)
+            tests.append(self.compare(evaluate, ast.Is(), ref))
+            refs.append(ref)
+
+        code = self.node(ast.Attribute, value=self.name(f), attr="__code__", ctx=ast.Load())
+        count = self.node(ast.Attribute, value=code, attr="co_argcount", ctx=ast.Load())
+        test = self.node(ast.BoolOp, op=ast.And(), values=[
+            self.both(tests), self.compare(count, ast.Eq(), self.const(len(args) + method))])
+
+        fast = self.node(ast.Call, func=self.name(f), args=refs, keywords=[])
+        slow = self.call("_call", self.const(line), self.name(f), *refs)
+        return self.node(ast.IfExp, test=test, body=fast, orelse=slow)
+
+    def visitGetExpr(self, expr: ExprGet):
+        obj = self.expr(expr.obj)
+        name = expr.name
+        self.line = name.line
+
+        if isinstance(expr.obj, ExprThis):
+            return self.node(ast.Attribute, value=obj, attr="l_" + name.lex, ctx=ast.Load())
+
+        ref, evaluate = self.operand(obj, obj)
+        return self.node(
+            ast.IfExp, test=self.call("isinstance", evaluate, self.name("LoxObject")),
+            body=self.node(ast.Attribute, value=ref, attr="l_" + name.lex, ctx=ast.Load()),
+            orelse=self.error(name.line, "Only instances have properties."))
+
+    def visitSetExpr(self, expr: ExprSet):
+        obj = self.expr(expr.obj)
+        ref, evaluate = self.operand(obj, obj)
+        val = self.expr(expr.val)
+        name = expr.name
+        self.line = name.line
+
+        t = self.temp()
+        store = self.call("setattr", ref, self.const("l_" + name.lex),
+                          self.node(ast.NamedExpr, target=self.name(t, True), value=val))
+        result = self.node(ast.BoolOp, op=ast.Or(), values=[store, self.name(t)])
+        if isinstance(expr.obj, ExprThis):
+            return result
+        return self.node(
+            ast.IfExp, test=self.call("isinstance", evaluate, self.name("LoxObject")),
+            body=result, orelse=self.error(name.line, "Only instances have fields."))
+
+    def visitThisExpr(self, expr: ExprThis):
+        self.line = expr.keyword.line
+        return self.read(expr, "this")
+
+    def visitSuperExpr(self, expr: ExprSuper):
+        self.line = expr.method.line
+        return self.call("_super", self.read(expr, "super"), self.read(expr.keyword, "this"),
+                         self.const("l_" + expr.method.lex))
+
+
+    # Stmts
+    def visitExpressionStmt(self, stmt: StmtExpression):
+        expr = stmt.expression
+
+        # assignments as statements don't need to produce a value
+        if isinstance(expr, ExprAssign):
+            decl = self.captures.decls.get(expr)
+            if decl is not None:
+                val = self.expr(expr.val)
+                self.line = expr.name.line
+                return [self.assign(self.read(expr, expr.name.lex), val)]
+
+        if isinstance(expr, ExprSet):
+            obj = self.expr(expr.obj)
+            val = self.expr(expr.val)
+            self.line = expr.name.line
+            out = []
+            if not isinstance(expr.obj, ExprThis):
+                # the value is evaluated before the target is, so only
+                # read the object back from its name if the value can't
+                # have changed it
+                if not (isinstance(obj, ast.Name) and isinstance(val, (ast.Constant, ast.Name))):
+                    t = self.temp()
+                    out.append(self.assign(self.name(t), obj))
+                    obj = self.name(t)
+                test = self.node(ast.UnaryOp, op=ast.Not(),
+                                 operand=self.call("isinstance", obj, self.name("LoxObject")))
+                out.append(self.node(ast.If, test=test, orelse=[], body=[
+                    self.stmt(self.error(expr.name.line, "Only instances have fields."))]))
+            target = self.node(ast.Attribute, value=obj, attr="l_" + expr.name.lex, ctx=ast.Store())
+            out.append(self.assign(target, val))
+            return out
+
+        return [self.stmt(self.expr(expr))]
+
+    def visitPrintStmt(self, stmt: StmtPrint):
+        val = self.expr(stmt.expression)
+        return [self.stmt(self.call("print", self.call("_str", val)))]
+
+    def visitVarStmt(self, stmt: StmtVariable):
+        val = self.const(None)
+        if stmt.initializer is not None:
+            val = self.expr(stmt.initializer)
+        self.line = stmt.name.line
+        return self.define(stmt, stmt.name.lex, val)
+
+    def visitBlockStmt(self, stmt: StmtBlock):
+        return self.block(stmt.statements)
+
+    def visitIfStmt(self, stmt: StmtIf):
+        test = self.truthy(self.expr(stmt.condition))
+        then = self.body([stmt.thenBranch])
+        otherwise = []
+        if stmt.elseBranch is not None:
+            otherwise = self.block([stmt.elseBranch])
+        return [self.node(ast.If, test=test, body=then, orelse=otherwise)]
+
+    def visitWhileStmt(self, stmt: StmtWhile):
+        test = self.truthy(self.expr(stmt.condition))
+        return [self.node(ast.While, test=test, body=self.body([stmt.body]), orelse=[])]
+
+    def visitForStmt(self, stmt: StmtFor):
+        out = []
+        if stmt.initializer is not None:
+            out = stmt.initializer.accept(self)
+
+        test = self.const(True)
+        if stmt.condition is not None:
+            test = self.truthy(self.expr(stmt.condition))
+
+        body = self.block([stmt.body])
+        if stmt.increment is not None:
+            body += self.visitExpressionStmt(StmtExpression(stmt.increment))
+        out.append(self.node(ast.While, test=test, body=body or [self.node(ast.Pass)], orelse=[]))
+        return out
+
+    def def_(self, stmt: StmtFunction, isMethod: bool = False, superclass: str = None):
+        info = self.captures.functions[stmt]
+        enclosing = self.function
+        self.function = info
+
+        params = [decl.py for decl in info.params]
+        free = [(decl.py, self.name(decl.py)) for decl in info.free]
+        if isMethod:
+            params.insert(0, "this")
+        if superclass is not None:
+            free.insert(0, ("s_super", self.name(superclass)))
+
+        self.line = stmt.name.line
+        body = self.globals(info)
+        for decl in info.params:
+            if decl.cell:
+                body.append(self.assign(self.name(decl.py),
+                                        self.node(ast.List, elts=[self.name(decl.py)], ctx=ast.Load())))
+        body += self.block(stmt.body)
+        if info.isInit:
+            body.append(self.node(ast.Return, value=self.name("this")))
+
+        self.function = enclosing
+        self.line = stmt.name.line
+        return self.node(ast.FunctionDef, name="l_" + stmt.name.lex,
+                         args=self.arguments(params, free), body=body or [self.node(ast.Pass)],
+                         decorator_list=[], returns=None, type_comment=None)
+
+    def visitFunctionStmt(self, stmt: StmtFunction):
+        self.line = stmt.name.line
+        out = self.preDefine(stmt)
+        out.append(self.def_(stmt))
+        return out + self.postDefine(stmt, stmt.name.lex, self.name("l_" + stmt.name.lex))
+
+    def visitReturnStmt(self, stmt: StmtReturn):
+        self.line = stmt.keyword.line
+        val = None
+        if stmt.value is not None:
+            val = self.expr(stmt.value)
+        if self.function.isInit:
+            out = [self.stmt(val)] if val is not None else []
+            return out + [self.node(ast.Return, value=self.name("this"))]
+        return [self.node(ast.Return, value=val)]
+
+    def visitClassStmt(self, stmt: StmtClass):
+        name = stmt.name
+        out = []
+        base = self.name("LoxObject")
+        superclass = None
+
+        if stmt.superclass is not None:
+            superclass = self.temp()
+            val = self.expr(stmt.superclass)
+            self.line = stmt.superclass.name.line
+            out.append(self.assign(self.name(superclass), val))
+            out.append(self.stmt(self.call("_checkSuper", self.const(self.line),
+                                           self.name(superclass))))
+            base = self.name(superclass)
+
+        self.line = name.line
+        out += self.preDefine(stmt)
+        methods = [self.def_(method, True, superclass) for method in stmt.methods]
+        self.line = name.line
+        out.append(self.node(ast.ClassDef, name="l_" + name.lex, bases=[base], keywords=[],
+                             body=methods or [self.node(ast.Pass)], decorator_list=[]))
+        return out + self.postDefine(stmt, name.lex, self.name("l_" + name.lex))
+
+
+# A local variable, and whether closures capture it
+class Decl:
+    __slots__ = ("py", "function", "captured", "assigned", "declaration")
+
+    def __init__(self, py: str, function, declaration: bool = False):
+        self.py = py
+        self.function = function
+        self.captured = False
+        self.assigned = False
+        # functions and classes can be captured before they exist
+        self.declaration = declaration
+
+    @property
+    def cell(self) -> bool:
+        return self.captured and (self.assigned or self.declaration)
+
+
+class FunctionInfo:
+    __slots__ = ("parent", "params", "free", "globals", "temps", "isInit")
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.params: list[Decl] = []
+        # locals of enclosing functions used here or in nested functions
+        self.free: dict[Decl, None] = {}
+        # globals assigned here
+        self.globals: set[str] = set()
+        self.temps = 0
+        self.isInit = False
+
+
+# First pass of Transpiler: resolves names the way Resolver does, to find
+# which locals closures capture and which are assigned.
+class Captures(Expr.Visitor, Stmt.Visitor):
+    def __init__(self):
+        self.scopes: list[dict[str, Decl]] = []
+        self.main = FunctionInfo(None)
+        self.function = self.main
+        # variable nodes and declarations to the locals they refer to
+        self.decls: dict = {}
+        self.functions: dict[StmtFunction, FunctionInfo] = {}
+        self.counts: dict[str, int] = {}
+
+    def program(self, statements: list[Stmt]):
+        for stmt in statements:
+            stmt.accept(self)
+
+    def local(self, lex: str, declaration: bool = False) -> Decl:
+        count = self.counts.get(lex, 0) + 1
+        self.counts[lex] = count
+        decl = Decl(f"v_{lex}" if count == 1 else f"v_{lex}_{count}", self.function, declaration)
+        self.scopes[-1][lex] = decl
+        return decl
+
+    def declare(self, node, lex: str, declaration: bool = False):
+        if not self.scopes:
+            self.function.globals.add("g_" + lex)
+        else:
+            self.decls[node] = self.local(lex, declaration)
+
+    def use(self, node, lex: str, assign: bool = False):
+        for scope in reversed(self.scopes):
+            if lex in scope:
+                decl = self.decls[node] = scope[lex]
+                decl.assigned |= assign
+                function = self.function
+                while function is not decl.function:
+                    decl.captured = True
+                    function.free[decl] = None
+                    function = function.parent
+                return
+        if assign:
+            self.function.globals.add("g_" + lex)
+
+    def function_(self, stmt: StmtFunction, implicit: dict = {}):
+        info = FunctionInfo(self.function)
+        self.functions[stmt] = info
+        enclosing = self.function
+        self.function = info
+
+        self.scopes.append({})
+        for lex, py in implicit.items():
+            self.scopes[-1][lex] = Decl(py, info)
+        info.params = [self.local(param.lex) for param in stmt.params]
+        for s in stmt.body:
+            s.accept(self)
+        self.scopes.pop()
+
+        self.function = enclosing
+        return info
+
+    # Exprs
+    def visitLiteralExpr(self, expr: ExprLiteral):
+        pass
+
+    def visitGroupingExpr(self, expr: ExprGrouping):
+        expr.expr.accept(self)
+
+    def visitUnaryExpr(self, expr: ExprUnary):
+        expr.expr.accept(self)
+
+    def visitBinaryExpr(self, expr: ExprBinary):
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visitLogicalExpr(self, expr: ExprLogical):
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visitVariableExpr(self, expr: ExprVariable):
+        self.use(expr, expr.name.lex)
+
+    def visitAssignExpr(self, expr: ExprAssign):
+        expr.val.accept(self)
+        self.use(expr, expr.name.lex, True)
+
+    def visitCallExpr(self, expr: ExprCall):
+        expr.callee.accept(self)
+        for arg in expr.args:
+            arg.accept(self)
+
+    def visitGetExpr(self, expr: ExprGet):
+        expr.obj.accept(self)
+
+    def visitSetExpr(self, expr: ExprSet):
+        expr.obj.accept(self)
+        expr.val.accept(self)
+
+    def visitThisExpr(self, expr: ExprThis):
+        self.use(expr, "this")
+
+    def visitSuperExpr(self, expr: ExprSuper):
+        self.use(expr, "super")
+        self.use(expr.keyword, "this")
+
+    # Stmts
+    def visitExpressionStmt(self, stmt: StmtExpression):
+        stmt.expression.accept(self)
+
+    def visitPrintStmt(self, stmt: StmtPrint):
+        stmt.expression.accept(self)
+
+    def visitVarStmt(self, stmt: StmtVariable):
+        if stmt.initializer is not None:
+            stmt.initializer.accept(self)
+        self.declare(stmt, stmt.name.lex)
+
+    def visitBlockStmt(self, stmt: StmtBlock):
+        self.scopes.append({})
+        for s in stmt.statements:
+            s.accept(self)
+        self.scopes.pop()
+
+    def visitIfStmt(self, stmt: StmtIf):
+        stmt.condition.accept(self)
+        stmt.thenBranch.accept(self)
+        if stmt.elseBranch is not None:
+            stmt.elseBranch.accept(self)
+
+    def visitWhileStmt(self, stmt: StmtWhile):
+        stmt.condition.accept(self)
+        stmt.body.accept(self)
+
+    def visitForStmt(self, stmt: StmtFor):
+        self.scopes.append({})
+        for part in (stmt.initializer, stmt.condition, stmt.increment, stmt.body):
+            if part is not None:
+                part.accept(self)
+        self.scopes.pop()
+
+    def visitFunctionStmt(self, stmt: StmtFunction):
+        self.declare(stmt, stmt.name.lex, True)
+        self.function_(stmt)
+
+    def visitReturnStmt(self, stmt: StmtReturn):
+        if stmt.value is not None:
+            stmt.value.accept(self)
+
+    def visitClassStmt(self, stmt: StmtClass):
+        self.declare(stmt, stmt.name.lex, True)
+        implicit = {"this": "this"}
+        if stmt.superclass is not None:
+            stmt.superclass.accept(self)
+            implicit["super"] = "s_super"
+        for method in stmt.methods:
+            info = self.function_(method, implicit)
+            info.isInit = method.name.lex == "init"
+
+
+# Runtime support the generated code refers to
+
+class LoxObject:
+    def __str__(self):
+        return type(self).__name__[2:] + " instance"
+
+
+def _error(line: int, msg: str) -> MyRuntimeError:
+    return MyRuntimeError(Token(TokenType.EOF, "", None, line), msg)
+
+
+def _err(line: int, msg: str):
+    raise _error(line, msg)
+
+
+def _str(val) -> str:
+    t = type(val)
+    if t is float:
+        return str(int(val)) if val.is_integer() else str(val)
+    if t is str:
+        return val
+    if t is bool:
+        return "true" if val else "false"
+    if val is None:
+        return "nil"
+    if t is FunctionType:
+        return f"<fn {val.__name__[2:]}>"
+    if t is MethodType:
+        return f"<fn {val.__func__.__name__[2:]}>"
+    if isinstance(val, type):
+        return val.__name__[2:]
+    return str(val)
+
+
+# Calls the fast path in generated code doesn't take: classes, natives,
+# wrong argument counts and things that can't be called
+def _call(line: int, f, *args):
+    if type(f) is FunctionType:
+        arity = f.__code__.co_argcount
+    elif type(f) is MethodType:
+        arity = f.__code__.co_argcount - 1
+    elif isinstance(f, type) and issubclass(f, LoxObject):
+        init = getattr(f, "l_init", None)
+        arity = 0 if init is None else init.__code__.co_argcount - 1
+        if len(args) != arity:
+            _err(line, f"Expected {arity} arguments but got {len(args)}.")
+        instance = f()
+        if init is not None:
+            init(instance, *args)
+        return instance
+    elif isinstance(f, LoxCallable):
+        if len(args) != f.arity():
+            _err(line, f"Expected {f.arity()} arguments but got {len(args)}.")
+        return f.call(None, list(args))
+    else:
+        _err(line, "Can only call functions and classes.")
+
+    if len(args) != arity:
+        _err(line, f"Expected {arity} arguments but got {len(args)}.")
+    return f(*args)
+
+
+def _super(superclass, this, name: str):
+    return MethodType(getattr(superclass, name), this)
+
+
+def _checkSuper(line: int, superclass):
+    if not (isinstance(superclass, type) and issubclass(superclass, LoxObject)):
+        _err(line, "Superclass must be a class.")
+
+
+_RUNTIME = {
+    "LoxObject": LoxObject, "FunctionType": FunctionType, "MethodType": MethodType,
+    "_err": _err, "_str": _str, "_call": _call, "_super": _super,
+    "_checkSuper": _checkSuper, "_concat": concat, "_STRINGS": STRINGS,
+}
@@ -0,0 +1,498 @@
+from app.tokens import Token, TokenType
+from app.runtime import MyRuntimeError
+from app.environment import Environment
+from app.callable import LoxCallable
+from app.interpreter import Interpreter
+from app.natives import defineNatives
+from app.chunk import OpCode, FunctionProto
+from app.compiler import Compiler
+from app.statement import Stmt
+from app.rope import Rope, STRINGS, concat
+
+
+# Runtime objects. These print the same way as the tree-walker's.
+class Closure:
+    __slots__ = ("function", "upvalues")
+
+    def __init__(self, function: FunctionProto, upvalues: list):
+        self.function = function
+        self.upvalues = upvalues
+
+    def __str__(self) -> str:
+        return str(self.function)
+
+
+# A variable captured by a closure. While the variable is still on the
+# stack slot is its index there; once closed, slot is -1 and value holds it.
+class Upvalue:
+    __slots__ = ("slot", "value")
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self.value = None
+
+
+class VMClass:
+    __slots__ = ("name", "methods", "init")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.methods: dict[str, Closure] = {}
+        # methods["init"], kept apart for calls to the class
+        self.init: Closure = None
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class VMInstance:
+    __slots__ = ("klass", "fields")
+
+    def __init__(self, klass: VMClass):
+        self.klass = klass
+        self.fields: dict[str, object] = {}
+
+    def __str__(self) -> str:
+        return self.klass.name + " instance"
+
+
+class BoundMethod:
+    __slots__ = ("receiver", "method")
+
+    def __init__(self, receiver, method: Closure):
+        self.receiver = receiver
+        self.method = method
+
+    def __str__(self) -> str:
+        return str(self.method)
+
+
+class CallFrame:
+    __slots__ = ("closure", "ip", "base")
+
+    def __init__(self, closure: Closure, base: int):
+        self.closure = closure
+        self.ip = 0
+        # stack index of slot 0
+        self.base = base
+
+
+# Marks a GET_METHOD result that is a plain value rather than a method
+# waiting for its receiver
+_PLAIN = object()
+
+GET_LOCAL = OpCode.GET_LOCAL.value
+SET_LOCAL = OpCode.SET_LOCAL.value
+CONSTANT = OpCode.CONSTANT.value
+GET_GLOBAL = OpCode.GET_GLOBAL.value
+SET_GLOBAL = OpCode.SET_GLOBAL.value
+GET_UPVALUE = OpCode.GET_UPVALUE.value
+SET_UPVALUE = OpCode.SET_UPVALUE.value
+POP = OpCode.POP.value
+JUMP_IF_FALSE = OpCode.JUMP_IF_FALSE.value
+LOOP = OpCode.LOOP.value
+JUMP = OpCode.JUMP.value
+LESS = OpCode.LESS.value
+ADD = OpCode.ADD.value
+SUBTRACT = OpCode.SUBTRACT.value
+CALL = OpCode.CALL.value
+RETURN = OpCode.RETURN.value
+GET_METHOD = OpCode.GET_METHOD.value
+INVOKE = OpCode.INVOKE.value
+GET_PROPERTY = OpCode.GET_PROPERTY.value
+SET_PROPERTY = OpCode.SET_PROPERTY.value
+CHECK_INSTANCE = OpCode.CHECK_INSTANCE.value
+EQUAL = OpCode.EQUAL.value
+NOT_EQUAL = OpCode.NOT_EQUAL.value
+GREATER = OpCode.GREATER.value
+GREATER_EQUAL = OpCode.GREATER_EQUAL.value
+LESS_EQUAL = OpCode.LESS_EQUAL.value
+MULTIPLY = OpCode.MULTIPLY.value
+DIVIDE = OpCode.DIVIDE.value
+NOT = OpCode.NOT.value
+NEGATE = OpCode.NEGATE.value
+JUMP_IF_TRUE = OpCode.JUMP_IF_TRUE.value
+NIL = OpCode.NIL.value
+TRUE = OpCode.TRUE.value
+FALSE = OpCode.FALSE.value
+PRINT = OpCode.PRINT.value
+DEFINE_GLOBAL = OpCode.DEFINE_GLOBAL.value
+CLOSURE = OpCode.CLOSURE.value
+CLOSE_UPVALUE = OpCode.CLOSE_UPVALUE.value
+GET_SUPER = OpCode.GET_SUPER.value
+CLASS = OpCode.CLASS.value
+INHERIT = OpCode.INHERIT.value
+METHOD = OpCode.METHOD.value
+
+
+# run --vm
+#
+# Stack-based virtual machine for the bytecode Compiler emits, after clox.
+# Interpreter stays the reference implementation; this produces the same
+# output and the same runtime errors.
+class VM:
+    FRAMES_MAX = 10000
+
+    def __init__(self, lox):
+        self.lox = lox
+        env = Environment()
+        defineNatives(env, lox)
+        self.globals: dict = env._values
+        self.stack: list = []
+        self.frames: list[CallFrame] = []
+        # open upvalues, ordered by stack slot
+        self.openUpvalues: list[Upvalue] = []
+
+    def interpret(self, statements: list[Stmt]):
+        function = Compiler(self.lox).compile(statements)
+        if function is None:
+            return
+
+        script = Closure(function, [])
+        self.stack.append(script)
+        self.frames.append(CallFrame(script, 0))
+        try:
+            self.run()
+        except MyRuntimeError as e:
+            self.lox.runtimeError(e)
+
+    @staticmethod
+    def error(frame: CallFrame, ip: int, msg: str) -> MyRuntimeError:
+        line = frame.closure.function.chunk.lines[ip - 1]
+        return MyRuntimeError(Token(TokenType.EOF, "", "null", line), msg)
+
+    def capture(self, slot: int) -> Upvalue:
+        ups = self.openUpvalues
+        i = len(ups)
+        while i > 0 and ups[i - 1].slot > slot:
+            i -= 1
+        if i > 0 and ups[i - 1].slot == slot:
+            return ups[i - 1]
+        upvalue = Upvalue(slot)
+        ups.insert(i, upvalue)
+        return upvalue
+
+    def closeUpvalues(self, last: int) -> None:
+        ups = self.openUpvalues
+        stack = self.stack
+        while ups and ups[-1].slot >= last:
+            upvalue = ups.pop()
+            upvalue.value = stack[upvalue.slot]
+            upvalue.slot = -1
+
+    # Call anything but a Closure (which run() handles inline). Returns the
+    # new frame if the callee is Lox code, or None once a native is done.
+    def callValue(self, frame: CallFrame, ip: int, callee, argc: int):
+        stack = self.stack
+        if type(callee) is BoundMethod:
+            stack[-argc - 1] = callee.receiver
+            callee = callee.method
+        elif type(callee) is VMClass:
+            stack[-argc - 1] = VMInstance(callee)
+            init = callee.init
+            if init is None:
+                if argc != 0:
+                    raise self.error(frame, ip, f"Expected 0 arguments but got {argc}.")
+                return None
+            callee = init
+        elif isinstance(callee, LoxCallable):
+            if argc != callee.arity():
+                raise self.error(frame, ip,
+                    f"Expected {callee.arity()} arguments but got {argc}.")
+            args = stack[len(stack) - argc:]
+            result = callee.call(None, args)
+            del stack[len(stack) - argc - 1:]
+            stack.append(result)
+            return None
+        elif type(callee) is not Closure:
+            raise self.error(frame, ip, "Can only call functions and classes.")
+
+        return self.callClosure(frame, ip, callee, argc)
+
+    def callClosure(self, frame: CallFrame, ip: int, callee: Closure, argc: int):
+        if callee.function.arity != argc:
+            raise self.error(frame, ip,
+                f"Expected {callee.function.arity} arguments but got {argc}.")
+        if len(self.frames) == self.FRAMES_MAX:
+            raise self.error(frame, ip, "Stack overflow.")
+        frame.ip = ip
+        new = CallFrame(callee, len(self.stack) - argc - 1)
+        self.frames.append(new)
+        return new
+
+    def run(self):
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        frames = self.frames
+        globals = self.globals
+        string = Interpreter.string
+        CHUNK = Rope.CHUNK
+
+        frame = frames[-1]
+        closure = frame.closure
+        code = closure.function.chunk.code
+        consts = closure.function.chunk.constants
+        upvalues = closure.upvalues
+        base = frame.base
+        ip = frame.ip
+
+        while True:
+            op = code[ip]
+            ip += 1
+
+            # roughly by how often each comes up
+            if op == GET_LOCAL:
+                push(stack[base + code[ip]])
+                ip += 1
+            elif op == SET_LOCAL:
+                stack[base + code[ip]] = stack[-1]
+                ip += 1
+            elif op == CONSTANT:
+                push(consts[code[ip]])
+                ip += 1
+            elif op == GET_GLOBAL:
+                name = consts[code[ip]]
+                ip += 1
+                try:
+                    push(globals[name])
+                except KeyError:
+                    raise self.error(frame, ip, f"Undefined variable '{name}'.")
+            elif op == SET_GLOBAL:
+                name = consts[code[ip]]
+                ip += 1
+                if name not in globals:
+                    raise self.error(frame, ip, f"Undefined variable '{name}'.")
+                globals[name] = stack[-1]
+            elif op == GET_UPVALUE:
+                upvalue = upvalues[code[ip]]
+                ip += 1
+                slot = upvalue.slot
+                push(stack[slot] if slot >= 0 else upvalue.value)
+            elif op == SET_UPVALUE:
+                upvalue = upvalues[code[ip]]
+                ip += 1
+                slot = upvalue.slot
+                if slot >= 0:
+                    stack[slot] = stack[-1]
+                else:
+                    upvalue.value = stack[-1]
+            elif op == POP:
+                pop()
+            elif op == JUMP_IF_FALSE:
+                val = stack[-1]
+                if val is None or val is False:
+                    ip += code[ip] + 1
+                else:
+                    ip += 1
+            elif op == LOOP:
+                ip -= code[ip] - 1
+            elif op == JUMP:
+                ip += code[ip] + 1
+            elif op == LESS:
+                b = pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = a < b
+            elif op == ADD:
+                b = pop()
+                a = stack[-1]
+                if type(a) is float and type(b) is float or type(a) is str \
+                        and type(b) is str and len(a) + len(b) < CHUNK:
+                    stack[-1] = a + b
+                elif type(a) in STRINGS and type(b) in STRINGS:
+                    stack[-1] = concat(a, b)
+                else:
+                    raise self.error(frame, ip, "Operands must be two numbers or two strings.")
+            elif op == SUBTRACT:
+                b = pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = a - b
+            elif op == CALL or op == INVOKE:
+                argc = code[ip]
+                ip += 1
+                callee = stack[-argc - 1]
+                if op == INVOKE:
+                    if callee is _PLAIN:
+                        del stack[-argc - 1]
+                        callee = stack[-argc - 1]
+                    else:
+                        # [method, receiver, args...] -> [receiver, args...]
+                        callee = stack[-argc - 2]
+                        del stack[-argc - 2]
+
+                if type(callee) is Closure:
+                    frame = self.callClosure(frame, ip, callee, argc)
+                else:
+                    new = self.callValue(frame, ip, callee, argc)
+                    if new is None:
+                        continue
+                    frame = new
+                closure = frame.closure
+                code = closure.function.chunk.code
+                consts = closure.function.chunk.constants
+                upvalues = closure.upvalues
+                base = frame.base
+                ip = 0
+            elif op == RETURN:
+                result = pop()
+                if self.openUpvalues:
+                    self.closeUpvalues(base)
+                frames.pop()
+                del stack[base:]
+                if not frames:
+                    return
+                push(result)
+
+                frame = frames[-1]
+                closure = frame.closure
+                code = closure.function.chunk.code
+                consts = closure.function.chunk.constants
+                upvalues = closure.upvalues
+                base = frame.base
+                ip = frame.ip
+            elif op == GET_METHOD:
+                name = consts[code[ip]]
+                ip += 1
+                instance = stack[-1]
+                if type(instance) is not VMInstance:
+                    raise self.error(frame, ip, "Only instances have properties.")
+                if name in instance.fields:
+                    stack[-1] = instance.fields[name]
+                    push(_PLAIN)
+                else:
+                    method = instance.klass.methods.get(name)
+                    if method is None:
+                        raise self.error(frame, ip, f"Undefined property '{name}'.")
+                    stack[-1] = method
+                    push(instance)
+            elif op == GET_PROPERTY:
+                name = consts[code[ip]]
+                ip += 1
+                instance = stack[-1]
+                if type(instance) is not VMInstance:
+                    raise self.error(frame, ip, "Only instances have properties.")
+                if name in instance.fields:
+                    stack[-1] = instance.fields[name]
+                else:
+                    method = instance.klass.methods.get(name)
+                    if method is None:
+                        raise self.error(frame, ip, f"Undefined property '{name}'.")
+                    stack[-1] = BoundMethod(instance, method)
+            elif op == SET_PROPERTY:
+                name = consts[code[ip]]
+                ip += 1
+                val = pop()
+                instance = stack[-1]
+                if type(instance) is not VMInstance:
+                    raise self.error(frame, ip, "Only instances have fields.")
+                instance.fields[name] = val
+                stack[-1] = val
+            elif op == CHECK_INSTANCE:
+                if type(stack[-1]) is not VMInstance:
+                    raise self.error(frame, ip, "Only instances have fields.")
+            elif op == EQUAL:
+                b = pop()
+                stack[-1] = stack[-1] == b
+            elif op == NOT_EQUAL:
+                b = pop()
+                stack[-1] = not stack[-1] == b
+            elif op == GREATER:
+                b = pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = a > b
+            elif op == GREATER_EQUAL:
+                b = pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = a >= b
+            elif op == LESS_EQUAL:
+                b = pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = a <= b
+            elif op == MULTIPLY:
+                b = pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = a * b
+            elif op == DIVIDE:
+                b = pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = a / b
+            elif op == NOT:
+                val = stack[-1]
+                stack[-1] = val is None or val is False
+            elif op == NEGATE:
+                val = stack[-1]
+                if type(val) is not float:
+                    raise self.error(frame, ip, "Operand must be a number.")
+                stack[-1] = -val
+            elif op == JUMP_IF_TRUE:
+                val = stack[-1]
+                if val is None or val is False:
+                    ip += 1
+                else:
+                    ip += code[ip] + 1
+            elif op == NIL:
+                push(None)
+            elif op == TRUE:
+                push(True)
+            elif op == FALSE:
+                push(False)
+            elif op == PRINT:
+                print(string(pop()))
+            elif op == DEFINE_GLOBAL:
+                globals[consts[code[ip]]] = pop()
+                ip += 1
+            elif op == CLOSURE:
+                function = consts[code[ip]]
+                ip += 1
+                captured = []
+                for i in range(function.upvalues):
+                    if code[ip]:
+                        captured.append(self.capture(base + code[ip + 1]))
+                    else:
+                        captured.append(upvalues[code[ip + 1]])
+                    ip += 2
+                push(Closure(function, captured))
+            elif op == CLOSE_UPVALUE:
+                self.closeUpvalues(len(stack) - 1)
+                pop()
+            elif op == GET_SUPER:
+                name = consts[code[ip]]
+                ip += 1
+                superclass = pop()
+                method = superclass.methods.get(name)
+                if method is None:
+                    raise self.error(frame, ip, f"Undefined property '{name}'.")
+                stack[-1] = BoundMethod(stack[-1], method)
+            elif op == CLASS:
+                push(VMClass(consts[code[ip]]))
+                ip += 1
+            elif op == INHERIT:
+                superclass = stack[-2]
+                if type(superclass) is not VMClass:
+                    raise self.error(frame, ip, "Superclass must be a class.")
+                # classes can't change once declared, so copying the
+                # methods down is the same as looking them up the chain
+                stack[-1].methods.update(superclass.methods)
+                stack[-1].init = superclass.init
+                pop()
+            elif op == METHOD:
+                method = pop()
+                name = consts[code[ip]]
+                stack[-1].methods[name] = method
+                if name == "init":
+                    stack[-1].init = method
+                ip += 1
@@ -0,0 +1,48 @@
+# Differential check of the execution engines. Every program in programs/
+# has to give, on every engine, at every optimization level and with
+# --memo, exactly the stdout and stderr the tree-walker gives. expected/
+# holds the tree-walker's: <name>.out is its stdout, <name>.err its stderr
+# followed by the exit status on a line of its own.
+#
+#   python3 -m pytest tests
+#
+# After a change that is meant to alter output, rewrite expected/ from the
+# tree-walker with `python3 -m tests.test_engines` and review the diff.
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+HERE = Path(__file__).parent
+ROOT = HERE.parent
+PROGRAMS = sorted((HERE / "programs").glob("*.lox"))
+EXPECTED = HERE / "expected"
+
+ENGINES = ("tree", "closure", "vm", "python", "stack")
+FLAGS = ((), ("-O0",), ("-O2",), ("--memo",))
+
+
+# A program's stdout, and its stderr with the exit status after it
+def run(program: Path, *args: str) -> tuple[bytes, bytes]:
+    result = subprocess.run(
+        [sys.executable, "-m", "app.main", "run", "--no-cache", *args,
+         str(program)],
+        cwd=ROOT, capture_output=True, timeout=120)
+    return result.stdout, result.stderr + b"%d\n" % result.returncode
+
+
+@pytest.mark.parametrize("flags", FLAGS, ids=lambda f: " ".join(f) or "default")
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("program", PROGRAMS, ids=lambda p: p.stem)
+def test_engine_matches_tree_walker(program: Path, engine: str, flags: tuple):
+    out, err = run(program, f"--engine={engine}", *flags)
+    assert out == (EXPECTED / f"{program.stem}.out").read_bytes()
+    assert err == (EXPECTED / f"{program.stem}.err").read_bytes()
+
+
+if __name__ == "__main__":
+    for program in PROGRAMS:
+        out, err = run(program, "--engine=tree", "-O0")
+        (EXPECTED / f"{program.stem}.out").write_bytes(out)
+        (EXPECTED / f"{program.stem}.err").write_bytes(err)